@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+*********************************************
+*
+* Micro-benchmark for formatForCNN
+* Compares the legacy per-spectrum dstack loop
+* with the reshaped view used in SpectraKeras_CNN
+*
+* version: 20261018a
+*
+* By: Nicola Ferralis <feranick@hotmail.com>
+*
+***********************************************
+'''
+print(__doc__)
+
+import numpy as np
+import sys, os.path, time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../SpectraKeras'))
+from SpectraKeras_CNN import formatForCNN
+
+#************************************
+''' Main '''
+#************************************
+class defParam:
+    numSpectra = [1000, 10000, 100000]
+    numPoints = 1000
+    repeats = 3
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print(' Usage:\n  python3 BenchFormatForCNN.py [<#spectra> <#points>]\n')
+        print(' Requires python 3.x. Not compatible with python 2.x\n')
+        return
+    if len(sys.argv) > 1:
+        defParam.numSpectra = [int(sys.argv[1])]
+    if len(sys.argv) > 2:
+        defParam.numPoints = int(sys.argv[2])
+
+    print('  #spectra\t| legacy [s]\t| view [s]\t| speedup\t| equal\t| zero-copy')
+    print('  -------------------------------------------------------------------------------')
+    for N in defParam.numSpectra:
+        A = np.random.rand(N, defParam.numPoints)
+        x_old, t_old = timeIt(formatForCNN_legacy, A)
+        x_new, t_new = timeIt(formatForCNN, A)
+        equal = x_old.shape == x_new.shape and x_old.dtype == x_new.dtype and \
+            x_old.tobytes() == x_new.tobytes()
+        print("  {0:d}\t\t| {1:.4f}\t| {2:.6f}\t| {3:.0f}x\t\t| {4}\t| {5}".format(N, t_old,
+            t_new, t_old/max(t_new,1e-9), equal, np.shares_memory(A, x_new)))
+        if not equal:
+            print("\033[1m\n Output of formatForCNN differs from legacy implementation\033[0m\n")
+            return 1
+    print('')
+
+#************************************
+''' Best of repeated runs '''
+#************************************
+def timeIt(func, A):
+    best = np.inf
+    for i in range(defParam.repeats):
+        start = time.perf_counter()
+        x = func(A)
+        best = min(best, time.perf_counter() - start)
+    return x, best
+
+#************************************
+''' Legacy formatForCNN (reference) '''
+#************************************
+def formatForCNN_legacy(A):
+    listmatrix = []
+    for i in range(A.shape[0]):
+        spectra = np.dstack([A[i]])
+        listmatrix.append(spectra)
+    x = np.stack(listmatrix, axis=0)
+    return x
+
+#************************************
+''' Main initialization routine '''
+#************************************
+if __name__ == "__main__":
+    sys.exit(main())
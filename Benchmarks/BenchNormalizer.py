@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+*********************************************
+*
+* Benchmark for Normalizer.transform_matrix
+* Compares the legacy row loop with the
+* vectorized, in-place and float32 variants
+*
+* version: 20261018a
+*
+* By: Nicola Ferralis <feranick@hotmail.com>
+*
+***********************************************
+'''
+print(__doc__)
+
+import numpy as np
+import sys, os.path, time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../SpectraKeras'))
+from libSpectraKeras import Normalizer
+
+#************************************
+''' Main '''
+#************************************
+class defParam:
+    numSpectra = [10000, 100000, 1000000]
+    numPoints = 100
+    repeats = 3
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print(' Usage:\n  python3 BenchNormalizer.py [<#spectra> <#points>]\n')
+        print(' Requires python 3.x. Not compatible with python 2.x\n')
+        return
+    if len(sys.argv) > 1:
+        defParam.numSpectra = [int(sys.argv[1])]
+    if len(sys.argv) > 2:
+        defParam.numPoints = int(sys.argv[2])
+
+    norm = Normalizer()
+    print('\n  Spectra with',defParam.numPoints,'points (times in s, best of',defParam.repeats,'runs)\n')
+    print('  #spectra\t| legacy\t| vectorized\t| in-place\t| float32\t| speedup\t| equal')
+    print('  -----------------------------------------------------------------------------------------------')
+    for N in defParam.numSpectra:
+        A = np.random.rand(N, defParam.numPoints)
+        # Keep a few constant rows to exercise the pass-through case
+        A[::1000] = 0.5
+
+        An_old, t_old = timeIt(lambda: transform_matrix_legacy(norm, A))
+        An_new, t_new = timeIt(lambda: norm.transform_matrix(A))
+        B = np.empty_like(A)
+        An_inp, t_inp = timeIt(lambda: norm.transform_matrix(B, inplace=True), lambda: np.copyto(B, A))
+        An_f32, t_f32 = timeIt(lambda: norm.transform_matrix(A, dtype=np.float32))
+
+        equal = np.array_equal(An_old, An_new) and np.array_equal(An_old, An_inp) and \
+            np.allclose(An_old, An_f32, atol=1e-6)
+        print("  {0:d}\t\t| {1:.4f}\t| {2:.4f}\t| {3:.4f}\t| {4:.4f}\t| {5:.1f}x\t\t| {6}".format(N,
+            t_old, t_new, t_inp, t_f32, t_old/t_new, equal))
+        if not equal:
+            print("\033[1m\n Output of transform_matrix differs from legacy implementation\033[0m\n")
+            return 1
+    print('')
+
+#************************************
+''' Best of repeated runs '''
+#************************************
+def timeIt(func, setup=None):
+    best = np.inf
+    for i in range(defParam.repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        x = func()
+        best = min(best, time.perf_counter() - start)
+    return x, best
+
+#************************************
+''' Legacy transform_matrix (reference) '''
+#************************************
+def transform_matrix_legacy(norm, y):
+    yn = np.copy(y)
+    for i in range(0,y.shape[0]):
+        if np.amax(y[i,:]) - np.amin(y[i,:]) == 0:
+            pass
+        else:
+            yn[i,:] = np.multiply(y[i,:] - np.amin(y[i,:]),
+                norm.YnormTo/(np.amax(y[i,:]) - np.amin(y[i,:])))
+    return yn
+
+#************************************
+''' Main initialization routine '''
+#************************************
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+*********************************************
+*
+* Benchmark for the normalization and
+* cherry-picking of learning data in
+* SpectraLearnPredict2 (slp_preprocess)
+* Compares with the original row-by-row loops
+*
+* version: 20261018a
+*
+* By: Nicola Ferralis <feranick@hotmail.com>
+*
+***********************************************
+'''
+print(__doc__)
+
+import numpy as np
+import sys, os.path, time, getopt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+    'SpectraLearnPredict2', 'SpectraLearnPredict2'))
+
+#************************************
+''' Main '''
+#************************************
+class defParam:
+    numSpectra = 50000
+    numPoints = 2000
+    enSel = [1050, 1150, 1220, 1270, 1330, 1410, 1480, 1590, 1620, 1650]
+    enSelDelta = [2, 2, 2, 2, 10, 2, 2, 15, 5, 2]
+    repeats = 3
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "n:p:h", ["spectra=", "points=", "help"])
+    except:
+        usage()
+        return 2
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            return
+        if o in ("-n", "--spectra"):
+            defParam.numSpectra = int(a)
+        if o in ("-p", "--points"):
+            defParam.numPoints = int(a)
+
+    from slp.slp_config import preprocDef
+    from slp import slp_preprocess
+    preprocDef.enSel = defParam.enSel
+    preprocDef.enSelDelta = defParam.enSelDelta
+
+    if len(args) > 0:
+        print(' Using learning file:', args[0])
+        En, Cl, A, YnormXind = slp_preprocess.readLearnFile(args[0])
+    else:
+        print(' Synthetic learning data:', defParam.numSpectra, 'x', defParam.numPoints, '\n')
+        En, A = makeData(defParam.numSpectra, defParam.numPoints)
+        YnormXind = np.where(En>0)[0].tolist()
+
+    print('  Step\t\t\t| loop [s]\t| vectorized [s]\t| speedup\t| identical')
+    print('  --------------------------------------------------------------------------------')
+    tLoop, Aloop = timeIt(normLoop, A, YnormXind, preprocDef.YnormTo)
+    tVec, Avec = timeIt(lambda A, Y, To: slp_preprocess.normYSpectra(A, Y), A, YnormXind, preprocDef.YnormTo)
+    printRow('Y normalization', tLoop, tVec, np.array_equal(Aloop, Avec))
+
+    tLoop, (Aloop, Enloop) = timeIt(cherryPickLoop, A, En, preprocDef)
+    tVec, (Avec, Envec) = timeIt(lambda A, En, p: slp_preprocess.cherryPickPoints(A, En), A, En, preprocDef)
+    printRow('Cherry picking', tLoop, tVec, np.array_equal(Aloop, Avec) and np.array_equal(Enloop, Envec))
+    print('')
+
+# Random spectra on a Raman-like x-axis, some with negative intensities
+def makeData(numSpectra, numPoints):
+    rng = np.random.default_rng(0)
+    En = np.linspace(1000, 1700, numPoints)
+    A = rng.random((numSpectra, numPoints)) - 0.05*rng.random((numSpectra, 1))
+    return En, A
+
+# Best of defParam.repeats runs on a fresh copy of the input
+def timeIt(fn, A, *args):
+    best = None
+    for i in range(defParam.repeats):
+        Acopy = np.copy(A)
+        start = time.perf_counter()
+        out = fn(Acopy, *args)
+        t = time.perf_counter() - start
+        if best is None or t < best:
+            best = t
+    return best, out
+
+def printRow(name, tLoop, tVec, same):
+    print("  {0:<22s}| {1:.3f}\t| {2:.3f}\t\t| {3:.1f}x\t\t| {4}".format(name, tLoop, tVec, tLoop/tVec, same))
+
+#************************************
+''' Original implementations '''
+#************************************
+def normLoop(A, YnormXind, YnormTo):
+    for i in range(0,A.shape[0]):
+        if(np.amin(A[i]) <= 0):
+            A[i,:] = A[i,:] - np.amin(A[i,:]) + 1e-8
+        A[i,:] = np.multiply(A[i,:], YnormTo/A[i,A[i][YnormXind].tolist().index(max(A[i][YnormXind].tolist()))+YnormXind[0]])
+    return A
+
+def cherryPickLoop(A, En, preprocDef):
+    Atemp = A[:,range(len(preprocDef.enSel))]
+    enPoints = list(preprocDef.enSel)
+    enRange = list(preprocDef.enSel)
+    for i in range(0, len(preprocDef.enSel)):
+        enRange[i] = np.where((En<float(preprocDef.enSel[i]+preprocDef.enSelDelta[i])) & (En>float(preprocDef.enSel[i]-preprocDef.enSelDelta[i])))[0].tolist()
+        for j in range(0, A.shape[0]):
+            Atemp[j,i] = A[j,A[j,enRange[i]].tolist().index(max(A[j, enRange[i]].tolist()))+enRange[i][0]]
+        enPoints[i] = int(np.average(enRange[i]))
+    return Atemp, En[enPoints]
+
+#************************************
+''' Lists the program usage '''
+#************************************
+def usage():
+    print(' Usage:\n  python3 BenchPreprocess.py [-n <#spectra>] [-p <#points>] [<learningfile>]\n')
+    print(' Without <learningfile>, synthetic data is used (default: {0:d} x {1:d}).\n'.format(defParam.numSpectra, defParam.numPoints))
+    print(' Requires python 3.x. Not compatible with python 2.x\n')
+
+#************************************
+''' Main initialization routine '''
+#************************************
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+*********************************************
+*
+* Startup-time benchmark for the entry points
+* of SpectraKeras and SpectraLearnPredict2
+* Each subcommand is run with -X importtime
+*
+* version: 20261018a
+*
+* By: Nicola Ferralis <feranick@hotmail.com>
+*
+***********************************************
+'''
+print(__doc__)
+
+import sys, os.path, time, json, subprocess, tempfile, getopt
+
+#************************************
+''' Main '''
+#************************************
+class defParam:
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    skCNN = os.path.join(root, 'SpectraKeras', 'SpectraKeras_CNN.py')
+    skMLP = os.path.join(root, 'SpectraKeras', 'SpectraKeras_MLP.py')
+    slp2 = os.path.join(root, 'SpectraLearnPredict2', 'SpectraLearnPredict2', 'SpectraLearnPredict2.py')
+
+    # (name, script, arguments). Missing input files make each subcommand
+    # stop right after startup, so only the import cost is measured.
+    commands = [
+        ['SpectraKeras_CNN usage', skCNN, []],
+        ['SpectraKeras_CNN -p', skCNN, ['-p', 'missing.txt']],
+        ['SpectraKeras_CNN -c', skCNN, ['-c', 'missing.txt']],
+        ['SpectraKeras_MLP usage', skMLP, []],
+        ['SpectraKeras_MLP -p', skMLP, ['-p', 'missing.txt']],
+        ['SpectraKeras_MLP -c', skMLP, ['-c', 'missing.txt']],
+        ['SpectraLearnPredict2 usage', slp2, []],
+        ['SpectraLearnPredict2 -p', slp2, ['-p', 'missing.txt']],
+        ['SpectraLearnPredict2 -k', slp2, ['-k', 'missing.txt']],
+        ]
+    heavy = ['tensorflow', 'tflite_runtime', 'keras', 'sklearn', 'pandas', 'matplotlib', 'scipy', 'h5py']
+    repeats = 3
+    tolerance = 0.2
+    numTop = 5
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "s:b:h", ["save=", "baseline=", "help"])
+    except:
+        usage()
+        return 2
+    saveFile = baselineFile = None
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            return
+        if o in ("-s", "--save"):
+            saveFile = a
+        if o in ("-b", "--baseline"):
+            baselineFile = a
+    if len(args) > 0:
+        defParam.commands = [[' '.join([os.path.basename(args[0])]+args[1:]), os.path.abspath(args[0]), args[1:]]]
+
+    results = {}
+    # Run in an empty folder: the entry points create their .ini files in the cwd
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for name, script, arguments in defParam.commands:
+            results[name] = runCommand(script, arguments, tmpDir)
+
+    print('\n  Subcommand\t\t\t| wall [s]\t| imports [s]\t| heavy frameworks loaded')
+    print('  ---------------------------------------------------------------------------------------------')
+    for name, res in results.items():
+        print("  {0:<30s}| {1:.3f}\t| {2:.3f}\t| {3}".format(name, res['wall'], res['imports'],
+            ', '.join(res['heavy']) if res['heavy'] else '-'))
+        print("  {0:<30s}  slowest: {1}".format('', ', '.join(["{0} ({1:.0f} ms)".format(m, t*1000)
+            for m, t in res['top']])))
+    print('')
+
+    if saveFile is not None:
+        with open(saveFile, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(" Results saved in:",saveFile,"\n")
+
+    if baselineFile is not None:
+        return compareBaseline(results, baselineFile)
+
+#************************************
+''' Run a subcommand with -X importtime '''
+#************************************
+def runCommand(script, arguments, cwd):
+    best = None
+    for i in range(defParam.repeats):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', script] + arguments, cwd=cwd,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+        wall = time.perf_counter() - start
+        modules = parseImportTime(proc.stderr)
+        res = {'wall': wall, 'imports': sum(modules.values())/1e6,
+            'heavy': sorted({m.split('.')[0] for m in modules if m.split('.')[0] in defParam.heavy}),
+            'top': topLevel(modules)}
+        if best is None or wall < best['wall']:
+            best = res
+    return best
+
+# Lines are: "import time: <self us> | <cumulative us> | <indented module name>"
+def parseImportTime(stderr):
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        modules[fields[2].strip()] = int(fields[0])
+    return modules
+
+# Slowest top-level packages, by total self time of their submodules
+def topLevel(modules):
+    packages = {}
+    for m, t in modules.items():
+        packages[m.split('.')[0]] = packages.get(m.split('.')[0], 0) + t/1e6
+    names = sorted(packages, key=packages.get, reverse=True)[:defParam.numTop]
+    return [[n, packages[n]] for n in names]
+
+#************************************
+''' Compare with a saved baseline '''
+#************************************
+def compareBaseline(results, baselineFile):
+    with open(baselineFile, 'r') as f:
+        baseline = json.load(f)
+    regressions = 0
+    print('  Subcommand\t\t\t| baseline [s]\t| current [s]\t| change')
+    print('  ---------------------------------------------------------------------------')
+    for name, res in results.items():
+        if name not in baseline:
+            continue
+        change = res['wall']/baseline[name]['wall'] - 1
+        newHeavy = sorted(set(res['heavy']) - set(baseline[name]['heavy']))
+        flag = ''
+        if change > defParam.tolerance or newHeavy:
+            regressions += 1
+            flag = '\033[1m  REGRESSION\033[0m'
+        print("  {0:<30s}| {1:.3f}\t| {2:.3f}\t| {3:+.0f}%{4}".format(name, baseline[name]['wall'], res['wall'],
+            100*change, flag))
+        if newHeavy:
+            print("  {0:<30s}  newly loaded: {1}".format('', ', '.join(newHeavy)))
+    print('')
+    return 1 if regressions > 0 else 0
+
+#************************************
+''' Lists the program usage '''
+#************************************
+def usage():
+    print(' Usage:\n  python3 BenchStartup.py [-s <results.json>] [-b <baseline.json>] [<script> <args>]\n')
+    print(' Without <script>, all SpectraKeras and SpectraLearnPredict2 subcommands are measured.')
+    print(' With -b, exits with 1 if a subcommand is more than {0:.0f}% slower'.format(100*defParam.tolerance))
+    print(' or loads a heavy framework not loaded in the baseline.\n')
+    print(' Requires python 3.x. Not compatible with python 2.x\n')
+
+#************************************
+''' Main initialization routine '''
+#************************************
+if __name__ == "__main__":
+    sys.exit(main())
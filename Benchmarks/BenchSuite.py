@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+*********************************************
+*
+* Benchmark suite for the hot paths of
+* SpectraKeras, SpectraLearnPredict2 and of
+* the augmentation engine (Add* utilities)
+* Synthetic spectra are generated in-process.
+* Reports throughput, peak RSS and regressions
+* against a saved baseline
+*
+* version: 20261018a
+*
+* By: Nicola Ferralis <feranick@hotmail.com>
+*
+***********************************************
+'''
+print(__doc__)
+
+import numpy as np
+import sys, os.path, time, json, glob, getopt, shutil, tempfile, subprocess, resource
+
+#************************************
+''' Parameters '''
+#************************************
+class defParam:
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    skFolder = os.path.join(root, 'SpectraKeras')
+    slpFolder = os.path.join(root, 'SpectraLearnPredict2', 'SpectraLearnPredict2')
+    utilFolder = os.path.join(root, 'Utilities')
+
+    numSpectra = 20000
+    numPoints = 1000
+    numClasses = 20
+    numMap = 5000
+    numTest = 200
+    repeats = 3
+    tolerance = 0.2         # max throughput loss before flagging a regression
+    toleranceRSS = 0.2      # max peak RSS increase before flagging a regression
+
+    # name: [benchmark function, argument]
+    cases = {
+        'readLearnFile txt' : ['benchReadLearnFile', 'txt'],
+        'readLearnFile h5' : ['benchReadLearnFile', 'h5'],
+        'readLearnFile npy' : ['benchReadLearnFile', 'npy'],
+        'Normalizer' : ['benchNormalizer', None],
+        'NormalizeLabel' : ['benchNormalizeLabel', None],
+        'MultiClassReductor' : ['benchMultiClassReductor', None],
+        'formatForCNN' : ['benchFormatForCNN', None],
+        'preProcess' : ['benchPreProcess', None],
+        'batchPredict CNN' : ['benchBatchPredict', None],
+        'LearnPredictMap' : ['benchLearnPredictMap', None],
+        'KmMap' : ['benchKmMap', None],
+        'AddNoisyData' : ['benchAugment', 'AddNoisyData'],
+        'AddRelativeNoisyData' : ['benchAugment', 'AddRelativeNoisyData'],
+        'AddHorizontalOffset' : ['benchAugment', 'AddHorizontalOffset'],
+        'AddRelativeHorNoisyData' : ['benchAugment', 'AddRelativeHorNoisyData'],
+        'AddVerticalOffset' : ['benchAugment', 'AddVerticalOffset'],
+        'AddLinearBackground' : ['benchAugment', 'AddLinearBackground'],
+        'Augmenter to h5' : ['benchAugmentSave', None],
+        }
+
+# Minimal SpectraKeras parameters for the library calls
+class skParam:
+    numLabels = 1
+    normalize = True
+    normalizeLabel = True
+    useGeneralNormLabel = False
+    useCustomRound = True
+    minGeneralLabel = 0
+    maxGeneralLabel = 1
+    YnormTo = 1
+    stepNormLabel = 0.001
+    spectral_range = "model_spectral_range.pkl"
+
+#************************************
+''' Main '''
+#************************************
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "n:p:r:k:s:b:lh",
+            ["spectra=", "points=", "repeats=", "keep=", "save=", "baseline=", "list", "help", "case="])
+    except:
+        usage()
+        return 2
+    saveFile = baselineFile = keep = None
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            return
+        if o in ("-l", "--list"):
+            print('  ' + '\n  '.join(defParam.cases.keys()) + '\n')
+            return
+        if o in ("-n", "--spectra"):
+            defParam.numSpectra = int(a)
+        if o in ("-p", "--points"):
+            defParam.numPoints = int(a)
+        if o in ("-r", "--repeats"):
+            defParam.repeats = int(a)
+        if o in ("-k", "--keep"):
+            keep = a.lower()
+        if o in ("-s", "--save"):
+            saveFile = a
+        if o in ("-b", "--baseline"):
+            baselineFile = a
+        if o == "--case":
+            # Internal: run a single case in this process
+            return runCase(a, args[0], args[1])
+
+    cases = [c for c in defParam.cases if keep is None or keep in c.lower()]
+    workDir = tempfile.mkdtemp(prefix='BenchSuite_')
+    try:
+        print(' Synthetic data: {0:d} spectra x {1:d} points, {2:d} classes, map: {3:d} spectra\n'.format(
+            defParam.numSpectra, defParam.numPoints, defParam.numClasses, defParam.numMap))
+        makeData(workDir)
+        results = {}
+        print('  Case\t\t\t| time [s]\t| spectra/s\t| peak RSS [MB]\t| RSS in run [MB]')
+        print('  -----------------------------------------------------------------------------------------')
+        for name in cases:
+            results[name] = runSubprocess(name, workDir)
+            printResult(name, results[name])
+        print('')
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    results = {'size' : [defParam.numSpectra, defParam.numPoints, defParam.numMap], 'cases' : results}
+    if saveFile is not None:
+        with open(saveFile, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(" Results saved in:",saveFile,"\n")
+
+    if baselineFile is not None:
+        return compareBaseline(results, baselineFile)
+
+def printResult(name, res):
+    if 'error' in res:
+        print("  {0:<22s}| skipped: {1:s}".format(name, res['error']))
+    else:
+        print("  {0:<22s}| {1:.4f}\t| {2:.0f}\t\t| {3:.0f}\t\t| {4:.0f}".format(name, res['time'],
+            res['throughput'], res['peakRSS'], res['runRSS']))
+
+#************************************
+''' Synthetic data '''
+''' Gaussian bands on a Raman-like x-axis, one band pattern per class '''
+#************************************
+def makeData(workDir):
+    rng = np.random.default_rng(0)
+    En = np.linspace(1000, 1700, defParam.numPoints)
+    centers = rng.uniform(1050, 1650, (defParam.numClasses, 4))
+
+    def spectra(labels):
+        S = 0.02*rng.random((labels.size, En.size))
+        for k in range(4):
+            c = centers[labels, k][:,None] + rng.normal(0, 2, (labels.size, 1))
+            S += rng.uniform(0.2, 1, (labels.size, 1))*np.exp(-0.5*((En-c)/8)**2)
+        return S
+
+    labels = rng.integers(0, defParam.numClasses, defParam.numSpectra)
+    M = np.vstack((np.append([0], En), np.hstack((labels[:,None].astype(float), spectra(labels)))))
+    np.savetxt(os.path.join(workDir, 'learn.txt'), M, delimiter='\t', fmt='%10.6f')
+    np.save(os.path.join(workDir, 'learn.npy'), M)
+    import h5py
+    with h5py.File(os.path.join(workDir, 'learn.h5'), 'w') as hf:
+        hf.create_dataset("M",  data=M)
+
+    # Map: x, y, spectrum on the same x-axis
+    side = int(np.ceil(np.sqrt(defParam.numMap)))
+    X, Y = np.divmod(np.arange(defParam.numMap), side)
+    R = spectra(rng.integers(0, defParam.numClasses, defParam.numMap))
+    with open(os.path.join(workDir, 'map.txt'), 'w') as f:
+        f.write('\t'.join(map(str, En)) + '\n')
+        np.savetxt(f, np.hstack((X[:,None], Y[:,None], R)), delimiter='\t', fmt='%10.6f')
+
+    # Single spectra for prediction, on a shifted x-axis to exercise resampling
+    testFolder = os.path.join(workDir, 'test')
+    os.makedirs(testFolder)
+    Rx = np.linspace(995, 1705, defParam.numPoints + 37)
+    R = spectra(rng.integers(0, defParam.numClasses, defParam.numTest))
+    for i in range(defParam.numTest):
+        np.savetxt(os.path.join(testFolder, 'sample_{0:04d}.txt'.format(i)),
+            np.vstack((Rx, np.interp(Rx, En, R[i]))).T, delimiter='\t', fmt='%10.6f')
+
+#************************************
+''' Run each case in a fresh process '''
+''' so that peak RSS is per case '''
+#************************************
+def runSubprocess(name, workDir):
+    resultFile = os.path.join(workDir, 'result.json')
+    if os.path.exists(resultFile):
+        os.remove(resultFile)
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '-n', str(defParam.numSpectra),
+        '-p', str(defParam.numPoints), '-r', str(defParam.repeats), '--case', name, workDir, resultFile],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    try:
+        with open(resultFile, 'r') as f:
+            return json.load(f)
+    except:
+        lines = proc.stderr.strip().splitlines()
+        return {'error' : lines[-1] if lines else 'exit code ' + str(proc.returncode)}
+
+def runCase(name, workDir, resultFile):
+    caseDir = os.path.join(workDir, name.replace(' ', '_'))
+    os.makedirs(caseDir, exist_ok=True)
+    # SpectraKeras and SpectraLearnPredict2 create their .ini files in the cwd
+    os.chdir(caseDir)
+    sys.path[:0] = [defParam.skFolder, defParam.slpFolder, defParam.utilFolder]
+    try:
+        func, arg = defParam.cases[name]
+        numSpectra, run, setup = globals()[func](workDir, arg)
+        startRSS = peakRSS()
+        best = np.inf
+        for i in range(defParam.repeats):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        res = {'time' : best, 'throughput' : numSpectra/best, 'peakRSS' : peakRSS(),
+            'runRSS' : peakRSS() - startRSS}
+    except ImportError as e:
+        res = {'error' : 'requires ' + str(e.name)}
+    except Exception as e:
+        res = {'error' : type(e).__name__ + ': ' + str(e)}
+    with open(resultFile, 'w') as f:
+        json.dump(res, f)
+
+# Peak resident set size of this process, in MB (ru_maxrss is in bytes on macOS)
+def peakRSS():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss/1024**2 if sys.platform == 'darwin' else rss/1024
+
+#************************************
+''' Benchmarks '''
+''' Each returns: #spectra, timed function, setup run before each repeat '''
+#************************************
+def benchReadLearnFile(workDir, ext):
+    from libSpectraKeras import readLearnFile
+    learnFile = os.path.join(workDir, 'learn.' + ext)
+    return defParam.numSpectra, lambda: readLearnFile(learnFile, skParam), None
+
+def benchNormalizer(workDir, arg):
+    from libSpectraKeras import Normalizer
+    A = np.load(os.path.join(workDir, 'learn.npy'))[1:,1:]
+    norm = Normalizer()
+    return A.shape[0], lambda: norm.transform_matrix(A), None
+
+def benchNormalizeLabel(workDir, arg):
+    from libSpectraKeras import NormalizeLabel
+    M = np.load(os.path.join(workDir, 'learn.npy'))
+    nL = NormalizeLabel(M, skParam)
+    return M.shape[0]-1, lambda: nL.transform_matrix(M), None
+
+def benchMultiClassReductor(workDir, arg):
+    from libSpectraKeras import MultiClassReductor
+    Cl = np.load(os.path.join(workDir, 'learn.npy'))[1:,0]
+    mcr = MultiClassReductor()
+    mcr.fit(np.unique(Cl))
+    return Cl.shape[0], lambda: mcr.transform(Cl), None
+
+def benchFormatForCNN(workDir, arg):
+    from SpectraKeras_CNN import formatForCNN
+    A = np.load(os.path.join(workDir, 'learn.npy'))[1:,1:]
+    return A.shape[0], lambda: formatForCNN(A), None
+
+def benchPreProcess(workDir, arg):
+    from libSpectraKeras import preProcess, Resampler
+    En = np.load(os.path.join(workDir, 'learn.npy'))[0,1:]
+    files = sorted(glob.glob(os.path.join(workDir, 'test', '*.txt')))
+    Rtot = [np.loadtxt(f, unpack=True) for f in files]
+    resampler = Resampler()
+    return len(Rtot), lambda: [preProcess(R, skParam, En, resampler) for R in Rtot], None
+
+# Trains a small CNN first: only the batch prediction is timed
+def benchBatchPredict(workDir, arg):
+    import tensorflow
+    import SpectraKeras_CNN as sk
+    import configparser
+    dP = sk.Conf()
+    conf = configparser.ConfigParser()
+    conf.optionxform = str
+    conf.read(dP.configFile)
+    conf['Parameters']['epochs'] = '2'
+    conf['Parameters']['plotActivations'] = 'False'
+    conf['System']['makeQuantizedTFlite'] = 'False'
+    with open(dP.configFile, 'w') as f:
+        conf.write(f)
+    sk.train(os.path.join(workDir, 'learn.h5'), None, False)
+    testFolder = os.path.join(workDir, 'test')
+    return defParam.numTest, lambda: sk.batchPredict(testFolder), None
+
+# Training and prediction of the whole map with SVM and sklearn NN
+def benchLearnPredictMap(workDir, arg):
+    from slp import slp_io
+    from slp.slp_config import nnDef, svmDef, kmDef, tfDef, dnntfDef, kerasDef, sysDef
+    dnntfDef.runDNNTF = kerasDef.runKeras = tfDef.runTF = kmDef.runKM = False
+    nnDef.runNN = svmDef.runSVM = True
+    nnDef.plotMap = svmDef.plotMap = False
+    nnDef.alwaysRetrain = svmDef.alwaysRetrain = True
+    sysDef.multiProc = False
+    learnFile, mapFile = copyInputs(workDir, ['learn.txt', 'map.txt'])
+    return defParam.numMap, lambda: slp_io.LearnPredictMap(learnFile, mapFile), lambda: removeMaps(mapFile)
+
+def benchKmMap(workDir, arg):
+    from slp import slp_kmeans
+    from slp.slp_config import kmDef
+    kmDef.plotKM = False
+    kmDef.alwaysRetrain = True
+    mapFile, = copyInputs(workDir, ['map.txt'])
+    return defParam.numMap, lambda: slp_kmeans.KmMap(mapFile, defParam.numClasses), lambda: removeMaps(mapFile)
+
+# One augmented copy of the learning set, with the settings of each utility
+def benchAugment(workDir, module):
+    from libSpectraKeras import Augmenter
+    M0 = np.load(os.path.join(workDir, 'learn.npy'))
+    En, M = M0[0,1:], M0[1:]
+    settings = {
+        'AddNoisyData' : {'noise' : 5, 'normalize' : True, 'shared' : True, 'compound' : True},
+        'AddRelativeNoisyData' : {'multNoise' : 5, 'normalize' : True, 'shared' : True, 'compound' : True},
+        'AddHorizontalOffset' : {'horOffset' : 5, 'randomize' : False, 'normalize' : True},
+        'AddRelativeHorNoisyData' : {'relNoise' : 500, 'horOffset' : 5},
+        'AddVerticalOffset' : {'vertOffset' : 0.1, 'randomize' : False, 'shared' : True, 'compound' : True,
+            'vertOffsetLast' : False},
+        'AddLinearBackground' : {'linBackground' : 0.001, 'normalize' : True, 'keepLabels' : False},
+        }[module]
+    aug = Augmenter(En, seed=0, **settings)
+    return M.shape[0], lambda: [b for b in aug.augmentBlocks(M, 1)], None
+
+# Two copies with all transforms, written to a chunked HDF5 file
+def benchAugmentSave(workDir, arg):
+    from libSpectraKeras import Augmenter
+    M0 = np.load(os.path.join(workDir, 'learn.npy'))
+    aug = Augmenter(M0[0,1:], noise=1, relNoise=1, horOffset=5, vertOffset=0.1, linBackground=0.001,
+        normalize=True, seed=0)
+    return 2*(M0.shape[0]-1), lambda: aug.save(M0[1:], 'augmented.h5', 2, includeOriginal=False,
+        numWorkers=os.cpu_count()), None
+
+def copyInputs(workDir, files):
+    for f in files:
+        shutil.copy(os.path.join(workDir, f), f)
+    return [os.path.abspath(f) for f in files]
+
+# Map outputs are appended to: remove them before each repeat
+def removeMaps(mapFile):
+    root = os.path.splitext(mapFile)[0]
+    for f in glob.glob(root + '_*'):
+        os.remove(f)
+
+#************************************
+''' Compare with a saved baseline '''
+#************************************
+def compareBaseline(results, baselineFile):
+    with open(baselineFile, 'r') as f:
+        baseline = json.load(f)
+    if baseline.get('size') != results['size']:
+        print(" Baseline was run with a different data size:", baseline.get('size'), "\n")
+    regressions = 0
+    print('  Case\t\t\t| spectra/s (base -> now)\t| peak RSS [MB] (base -> now)')
+    print('  -----------------------------------------------------------------------------------------')
+    for name, res in results['cases'].items():
+        base = baseline['cases'].get(name)
+        if base is None or 'error' in base or 'error' in res:
+            continue
+        change = res['throughput']/base['throughput'] - 1
+        changeRSS = res['peakRSS']/base['peakRSS'] - 1
+        flag = ''
+        if change < -defParam.tolerance or changeRSS > defParam.toleranceRSS:
+            regressions += 1
+            flag = '\033[1m  REGRESSION\033[0m'
+        print("  {0:<22s}| {1:.0f} -> {2:.0f} ({3:+.0f}%)\t| {4:.0f} -> {5:.0f} ({6:+.0f}%){7}".format(name,
+            base['throughput'], res['throughput'], 100*change, base['peakRSS'], res['peakRSS'], 100*changeRSS, flag))
+    print('')
+    return 1 if regressions > 0 else 0
+
+#************************************
+''' Lists the program usage '''
+#************************************
+def usage():
+    print(' Usage:\n  python3 BenchSuite.py [-n <#spectra>] [-p <#points>] [-r <#repeats>] [-k <case>]')
+    print('                         [-s <results.json>] [-b <baseline.json>]\n')
+    print('  -k: run only the cases whose name contains <case>. -l: list the cases')
+    print('  -s: save the results, to be used later as baseline')
+    print('  -b: exits with 1 if a case is more than {0:.0f}% slower or uses more than {1:.0f}% more memory'.format(
+        100*defParam.tolerance, 100*defParam.toleranceRSS))
+    print('      than in the baseline\n')
+    print(' Requires python 3.x. Not compatible with python 2.x\n')
+
+#************************************
+''' Main initialization routine '''
+#************************************
+if __name__ == "__main__":
+    sys.exit(main())
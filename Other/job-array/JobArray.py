@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+*************************************************
+*
+* JobArray
+* Run many SpectraKeras / SpectraLearnPredict2 trainings
+* as a single SLURM or PBS job array, packing several
+* trainings on each node. Replaces the per-job
+* pbs-queue/sub_* and slurm-queue/sub_ml* wrappers.
+*
+* version: 20261018a
+*
+* By: Nicola Ferralis <feranick@hotmail.com>
+*
+*************************************************
+'''
+print(__doc__)
+
+import sys, os.path, time, json, csv, re, glob, shutil, shlex, socket, subprocess
+
+#************************************
+''' Parameters '''
+#************************************
+class defParam:
+    coresPerNode = 28
+    defaultCores = 7
+    maxLocalNodes = 2
+    jobsFolder = "jobs"
+    resultsFile = "jobarray_results.csv"
+    walltime = "100:00:00"
+
+    # program: [executable, training flag, configuration file name]
+    programs = {
+        'CNN' : ['SpectraKeras_CNN', '-t', 'SpectraKeras_CNN.ini'],
+        'MLP' : ['SpectraKeras_MLP', '-t', 'SpectraKeras_MLP.ini'],
+        'SLP2' : ['SpectraLearnPredict2', '-a', 'SpectraLearnPredict2.ini'],
+        }
+    # Used when the executables are not installed
+    repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+    scripts = {
+        'CNN' : os.path.join(repo, 'SpectraKeras', 'SpectraKeras_CNN.py'),
+        'MLP' : os.path.join(repo, 'SpectraKeras', 'SpectraKeras_MLP.py'),
+        'SLP2' : os.path.join(repo, 'SpectraLearnPredict2', 'SpectraLearnPredict2', 'SpectraLearnPredict2.py'),
+        }
+
+#************************************
+''' Main '''
+#************************************
+def main():
+    if len(sys.argv) < 3:
+        usage()
+        return
+    manifestFile = os.path.abspath(sys.argv[2])
+    tasks = readManifest(manifestFile)
+    if tasks is None:
+        return 1
+    nodes = packTasks(tasks)
+
+    if sys.argv[1] == 'plan':
+        printPlan(tasks, nodes)
+    elif sys.argv[1] == 'submit':
+        scheduler = sys.argv[3] if len(sys.argv) > 3 else 'local'
+        printPlan(tasks, nodes)
+        return submit(manifestFile, tasks, nodes, scheduler)
+    elif sys.argv[1] == 'run':
+        return runNode(tasks, nodes, int(sys.argv[3]))
+    elif sys.argv[1] == 'collect':
+        collect(manifestFile, tasks, nodes)
+    else:
+        usage()
+
+#************************************
+''' Read manifest '''
+''' CSV with header: name,program,learnFile,testFile,config,cores '''
+''' Only program and learnFile are required. program is CNN, MLP, SLP2 '''
+''' or any other command, which is then run as: <program> <learnFile> [<testFile>] '''
+#************************************
+def readManifest(manifestFile):
+    try:
+        with open(manifestFile, 'r') as f:
+            rows = [r for r in csv.DictReader(f) if r.get('program') and not r['program'].startswith('#')]
+    except:
+        print("\033[1m Manifest file not found \033[0m\n")
+        return None
+    base = os.path.dirname(manifestFile)
+    tasks = []
+    for i, r in enumerate(rows):
+        path = lambda f: os.path.abspath(os.path.join(base, f)) if f else ''
+        task = {'index' : i,
+            'program' : r['program'].strip(),
+            'learnFile' : path(r.get('learnFile', '').strip()),
+            'testFile' : path((r.get('testFile') or '').strip()),
+            'config' : path((r.get('config') or '').strip()),
+            'cores' : int(r.get('cores') or defParam.defaultCores)}
+        task['cores'] = min(task['cores'], defParam.coresPerNode)
+        name = (r.get('name') or '').strip()
+        if name == '':
+            name = "{0:03d}_{1:s}_{2:s}".format(i, task['program'] if task['program'] in defParam.programs else 'cmd',
+                os.path.splitext(os.path.basename(task['learnFile']))[0])
+            if task['config']:
+                name += '_' + os.path.splitext(os.path.basename(task['config']))[0]
+        task['name'] = name
+        task['folder'] = os.path.join(base, defParam.jobsFolder, name)
+        # Without a variant, use the .ini next to the manifest (or in the cwd),
+        # as the pbs-queue/slurm-queue wrappers did
+        if task['config'] == '' and task['program'] in defParam.programs:
+            for folder in [base, os.getcwd()]:
+                ini = os.path.join(folder, defParam.programs[task['program']][2])
+                if os.path.isfile(ini):
+                    task['config'] = os.path.abspath(ini)
+                    break
+        tasks.append(task)
+    return tasks
+
+#************************************
+''' Pack tasks on nodes (first fit decreasing on cores) '''
+''' Deterministic, so each array element recomputes its own node '''
+#************************************
+def packTasks(tasks):
+    nodes = []
+    for task in sorted(tasks, key=lambda t: (-t['cores'], t['index'])):
+        for node in nodes:
+            if node['free'] >= task['cores']:
+                break
+        else:
+            node = {'free' : defParam.coresPerNode, 'tasks' : []}
+            nodes.append(node)
+        node['tasks'].append(task['index'])
+        node['free'] -= task['cores']
+    return [sorted(n['tasks']) for n in nodes]
+
+def printPlan(tasks, nodes):
+    print(" {0:d} trainings on {1:d} node(s), {2:d} cores per node\n".format(len(tasks), len(nodes), defParam.coresPerNode))
+    for i, node in enumerate(nodes):
+        print("  Node {0:d}: {1:s}".format(i, ', '.join(["{0:s} ({1:d})".format(tasks[t]['name'], tasks[t]['cores']) for t in node])))
+    print('')
+
+#************************************
+''' Submit the job array '''
+#************************************
+def submit(manifestFile, tasks, nodes, scheduler):
+    folder = os.path.join(os.path.dirname(manifestFile), defParam.jobsFolder)
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, 'plan.json'), 'w') as f:
+        json.dump({'coresPerNode' : defParam.coresPerNode, 'tasks' : tasks, 'nodes' : nodes}, f, indent=1)
+    run = [sys.executable, os.path.abspath(__file__), 'run', manifestFile]
+
+    if scheduler == 'local':
+        return submitLocal(run, manifestFile, tasks, nodes)
+
+    if scheduler == 'slurm':
+        script = os.path.join(folder, 'jobarray.slurm')
+        header = ["#SBATCH --job-name=SpectralMachine", "#SBATCH --array=0-{0:d}".format(len(nodes)-1),
+            "#SBATCH --nodes=1", "#SBATCH --ntasks=1", "#SBATCH --cpus-per-task={0:d}".format(defParam.coresPerNode),
+            "#SBATCH -t {0:s}".format(defParam.walltime), "#SBATCH -o {0:s}/node_%a.out".format(folder),
+            "#SBATCH --export=ALL"]
+        index = "$SLURM_ARRAY_TASK_ID"
+        submitCmd = 'sbatch'
+    elif scheduler == 'pbs':
+        script = os.path.join(folder, 'jobarray.pbs')
+        header = ["#PBS -N SpectralMachine", "#PBS -J 0-{0:d}".format(len(nodes)-1),
+            "#PBS -l nodes=1:ppn={0:d}".format(defParam.coresPerNode), "#PBS -l walltime={0:s}".format(defParam.walltime),
+            "#PBS -j oe", "#PBS -o {0:s}".format(folder), "#PBS -V"]
+        index = "$PBS_ARRAY_INDEX"
+        submitCmd = 'qsub'
+    else:
+        print(" Scheduler must be one of: slurm, pbs, local\n")
+        return 2
+
+    with open(script, 'w') as f:
+        f.write("#!/bin/sh\n" + '\n'.join(header) + "\n\ncd {0:s}\n{1:s} {2:s}\n".format(shlex.quote(os.path.dirname(manifestFile)),
+            ' '.join([shlex.quote(a) for a in run]), index))
+    print(" Job array script saved in:", script)
+    if shutil.which(submitCmd) is None:
+        print(" " + submitCmd + " not found. Submit with:\n  " + submitCmd + " " + script + "\n")
+        return
+    return subprocess.call([submitCmd, script])
+
+# Process-based stand-in for the scheduler: each array element is a local
+# process, at most maxLocalNodes at a time.
+def submitLocal(run, manifestFile, tasks, nodes):
+    print(" Running {0:d} array element(s) locally, {1:d} at a time\n".format(len(nodes), defParam.maxLocalNodes))
+    pending = list(range(len(nodes)))
+    running = {}
+    failed = 0
+    while pending or running:
+        while pending and len(running) < defParam.maxLocalNodes:
+            i = pending.pop(0)
+            running[i] = subprocess.Popen(run + [str(i)], stdout=subprocess.DEVNULL)
+        for i, p in list(running.items()):
+            if p.poll() is not None:
+                failed += int(p.returncode != 0)
+                print("  Node {0:d} done (exit code {1:d})".format(i, p.returncode))
+                del running[i]
+        time.sleep(0.2)
+    print('')
+    collect(manifestFile, tasks, nodes)
+    return 1 if failed else 0
+
+#************************************
+''' Run the trainings of one node (array element) concurrently '''
+#************************************
+def runNode(tasks, nodes, index):
+    procs = []
+    failed = 0
+    for t in nodes[index]:
+        task = tasks[t]
+        os.makedirs(task['folder'], exist_ok=True)
+        cmd = getCommand(task)
+        if task['program'] in defParam.programs:
+            # The programs silently fall back to built-in defaults without an .ini
+            if task['config'] == '':
+                print(" Node {0:d}: no {1:s} found for {2:s}. Not running it.".format(index,
+                    defParam.programs[task['program']][2], task['name']))
+                writeStatus(task, index, shlex.join(cmd), 2, time.time())
+                failed += 1
+                continue
+            shutil.copy(task['config'], os.path.join(task['folder'], defParam.programs[task['program']][2]))
+        # Keep each training within its share of the node
+        env = dict(os.environ, OMP_NUM_THREADS=str(task['cores']), MKL_NUM_THREADS=str(task['cores']),
+            OPENBLAS_NUM_THREADS=str(task['cores']), TF_NUM_INTRAOP_THREADS=str(task['cores']),
+            TF_NUM_INTEROP_THREADS='1')
+        log = open(os.path.join(task['folder'], 'log.txt'), 'w')
+        print(" Node {0:d} ({1:s}): {2:s}".format(index, socket.gethostname(), shlex.join(cmd)))
+        procs.append([task, subprocess.Popen(cmd, cwd=task['folder'], env=env, stdout=log, stderr=subprocess.STDOUT),
+            log, time.time()])
+
+    for task, p, log, start in procs:
+        p.wait()
+        log.close()
+        writeStatus(task, index, shlex.join(getCommand(task)), p.returncode, start)
+        failed += int(p.returncode != 0)
+    return 1 if failed else 0
+
+def writeStatus(task, index, command, returncode, start):
+    status = {'node' : index, 'host' : socket.gethostname(), 'command' : command,
+        'returncode' : returncode, 'start' : start, 'wallTime' : time.time() - start}
+    with open(os.path.join(task['folder'], 'status.json'), 'w') as f:
+        json.dump(status, f, indent=1)
+
+def getCommand(task):
+    args = [task['learnFile']] + ([task['testFile']] if task['testFile'] else [])
+    if task['program'] in defParam.programs:
+        exe, flag = defParam.programs[task['program']][:2]
+        if shutil.which(exe) is not None:
+            return [exe, flag] + args
+        return [sys.executable, defParam.scripts[task['program']], flag] + args
+    return shlex.split(task['program']) + args
+
+#************************************
+''' Collect status, metrics and summaries in one table '''
+#************************************
+def collect(manifestFile, tasks, nodes):
+    nodeOf = {t : i for i, node in enumerate(nodes) for t in node}
+    metrics = ['val_acc_max', 'val_acc_last', 'val_loss_min', 'val_mae_min', 'nn_accuracy', 'svm_accuracy']
+    rows = []
+    for task in tasks:
+        status = {}
+        if os.path.isfile(os.path.join(task['folder'], 'status.json')):
+            with open(os.path.join(task['folder'], 'status.json'), 'r') as f:
+                status = json.load(f)
+        logFile = os.path.join(task['folder'], 'log.txt')
+        values = parseLog(logFile)
+        summaries = sorted(glob.glob(os.path.join(task['folder'], 'summary*.csv')))
+        if not status:
+            state = 'not run'
+        elif status['returncode'] == 0:
+            state = 'done'
+        else:
+            state = 'failed'
+        rows.append([task['name'], task['program'], task['learnFile'], task['testFile'], task['config'],
+            task['cores'], nodeOf[task['index']], status.get('host', ''), state, status.get('returncode', ''),
+            '{0:.1f}'.format(status['wallTime']) if status else ''] + [values.get(m, '') for m in metrics] +
+            [logFile if os.path.isfile(logFile) else '', ';'.join(summaries)])
+
+    resultsFile = os.path.join(os.path.dirname(manifestFile), defParam.resultsFile)
+    with open(resultsFile, 'w', newline='') as f:
+        csv_out = csv.writer(f)
+        csv_out.writerow(['Name', 'Program', 'Learning file', 'Validation file', 'Config', 'Cores', 'Node', 'Host',
+            'Status', 'Exit code', 'Wall time [s]'] + metrics + ['Log', 'Summaries'])
+        csv_out.writerows(rows)
+
+    print('  Name\t\t\t\t| Status\t| Wall time [s]\t| Validation')
+    print('  -----------------------------------------------------------------------------')
+    for r in rows:
+        print("  {0:<30s}| {1:s}\t\t| {2:s}\t\t| {3:s}".format(r[0], r[8], r[10],
+            ', '.join(["{0:s}={1:s}".format(m, str(v)) for m, v in zip(metrics, r[11:17]) if v != ''])))
+    print("\n Results saved in:", resultsFile, "\n")
+
+# Final validation metrics from the training logs
+def parseLog(logFile):
+    values = {}
+    try:
+        with open(logFile, 'r', errors='ignore') as f:
+            text = re.sub(r'\x1b\[[0-9;]*m', '', f.read())
+    except:
+        return values
+    # SpectraKeras: last "Validation Summary" block
+    valid = text.rsplit('Validation Summary', 1)
+    if len(valid) == 2:
+        m = re.search(r'Accuracy - Average: [\d.]+%; Max: ([\d.]+)%; Last: ([\d.]+)%', valid[1])
+        if m:
+            values['val_acc_max'], values['val_acc_last'] = float(m.group(1)), float(m.group(2))
+        m = re.search(r'Loss - Average: [\d.]+; Min: ([\d.]+)', valid[1])
+        if m:
+            values['val_loss_min'] = float(m.group(1))
+        m = re.search(r'Mean Abs Err - Average: [\d.]+; Min: ([\d.]+)', valid[1])
+        if m:
+            values['val_mae_min'] = float(m.group(1))
+    # SpectraLearnPredict2 -a
+    m = re.findall(r'\n\s+Accuracy:\s+([\d.]+)', text)
+    if m:
+        values['nn_accuracy'] = float(m[-1])
+    m = re.findall(r'Mean accuracy:\s+([\d.]+)', text)
+    if m:
+        values['svm_accuracy'] = float(m[-1])
+    return values
+
+#************************************
+''' Lists the program usage '''
+#************************************
+def usage():
+    print(' Usage:\n')
+    print(' Show how trainings are packed on nodes:')
+    print('  python3 JobArray.py plan <manifest.csv>\n')
+    print(' Submit as a job array (default: local, process-based stand-in for the scheduler):')
+    print('  python3 JobArray.py submit <manifest.csv> [slurm|pbs|local]\n')
+    print(' Run the trainings of one array element (used by the job array):')
+    print('  python3 JobArray.py run <manifest.csv> <index>\n')
+    print(' Collect status, metrics and summaries in', defParam.resultsFile + ':')
+    print('  python3 JobArray.py collect <manifest.csv>\n')
+    print(' Manifest (CSV): name,program,learnFile,testFile,config,cores')
+    print('  program: CNN, MLP, SLP2 or a command; config: .ini variant (optional,')
+    print('  default: the .ini next to the manifest or in the current folder)')
+    print('  cores: cores used by each training (default: {0:d}, {1:d} per node)\n'.format(defParam.defaultCores,
+        defParam.coresPerNode))
+    print(' Requires python 3.x. Not compatible with python 2.x\n')
+
+#************************************
+''' Main initialization routine '''
+#************************************
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,7 +11,7 @@
 print(__doc__)
 
 import numpy as np
-import sys, os.path, getopt, time, configparser, pickle, h5py, csv, glob
+import sys, os.path, getopt, time, configparser, pickle, csv, glob
 from libSpectraKeras import *
 
 #***************************************************
@@ -71,6 +71,18 @@ class Conf():
             'cv_split' : 0.01,
             'fullSizeBatch' : False,
             'batch_size' : 64,
+            'streamLearnFile' : False,
+            'chunkSize' : 1024,
+            'shuffleBuffer' : 10000,
+            'augment' : False,
+            'augmentCopies' : 4,
+            'augmentNoise' : 0,
+            'augmentRelNoise' : 1,
+            'augmentHorOffset' : 2,
+            'augmentVertOffset' : 0,
+            'augmentLinBackground' : 0,
+            'augmentSeed' : 0,
+            'augmentQueue' : 8,
             'numLabels' : 1,
             'plotWeightsFlag' : False,
             'plotActivations' : True,
@@ -83,6 +95,32 @@ class Conf():
             'useTFlitePred' : False,
             'TFliteRuntime' : False,
             'runCoralEdge' : False,
+            'batchSizePredict' : 64,
+            'poolSizeTFlite' : 1,
+            'numThreadsTFlite' : 0,
+            'serverHost' : 'localhost',
+            'serverPort' : 5000,
+            'serverMaxWait' : 0.005,
+            }
+
+    def sweepDef(self):
+        self.conf['Sweep'] = {
+            'sweepMode' : 'grid',
+            'sweepTrials' : 10,
+            'concurrentTrials' : 2,
+            'sweepEpochs' : 0,
+            'sweepPatience' : 10,
+            'sweepWarmup' : 5,
+            }
+        # Values to sweep: lists are used as given (grid) or sampled (random);
+        # in random mode, (low, high) tuples are sampled log-uniformly
+        self.conf['SweepGrid'] = {
+            'CL_filter' : [[1]],
+            'CL_size' : [[10], [20]],
+            'max_pooling' : [[20]],
+            'HL' : [[40,70]],
+            'l_rate' : [0.001, 0.0001],
+            'l2' : [1e-4],
             }
 
     def readConfig(self,configFile):
@@ -106,6 +144,19 @@ class Conf():
             self.cv_split = self.conf.getfloat('Parameters','cv_split')
             self.fullSizeBatch = self.conf.getboolean('Parameters','fullSizeBatch')
             self.batch_size = self.conf.getint('Parameters','batch_size')
+            self.streamLearnFile = self.conf.getboolean('Parameters','streamLearnFile', fallback=False)
+            self.chunkSize = self.conf.getint('Parameters','chunkSize', fallback=1024)
+            self.shuffleBuffer = self.conf.getint('Parameters','shuffleBuffer', fallback=10000)
+            # On-the-fly augmentation. augmentSeed = 0: random seed
+            self.augment = self.conf.getboolean('Parameters','augment', fallback=False)
+            self.augmentCopies = self.conf.getint('Parameters','augmentCopies', fallback=4)
+            self.augmentNoise = self.conf.getfloat('Parameters','augmentNoise', fallback=0)
+            self.augmentRelNoise = self.conf.getfloat('Parameters','augmentRelNoise', fallback=1)
+            self.augmentHorOffset = self.conf.getfloat('Parameters','augmentHorOffset', fallback=2)
+            self.augmentVertOffset = self.conf.getfloat('Parameters','augmentVertOffset', fallback=0)
+            self.augmentLinBackground = self.conf.getfloat('Parameters','augmentLinBackground', fallback=0)
+            self.augmentSeed = self.conf.getint('Parameters','augmentSeed', fallback=0) or None
+            self.augmentQueue = self.conf.getint('Parameters','augmentQueue', fallback=8)
             self.numLabels = self.conf.getint('Parameters','numLabels')
             self.plotWeightsFlag = self.conf.getboolean('Parameters','plotWeightsFlag')
             self.plotActivations = self.conf.getboolean('Parameters','plotActivations')
@@ -114,6 +165,21 @@ class Conf():
             self.useTFlitePred = self.conf.getboolean('System','useTFlitePred')
             self.TFliteRuntime = self.conf.getboolean('System','TFliteRuntime')
             self.runCoralEdge = self.conf.getboolean('System','runCoralEdge')
+            self.batchSizePredict = self.conf.getint('System','batchSizePredict', fallback=64)
+            self.poolSizeTFlite = self.conf.getint('System','poolSizeTFlite', fallback=1)
+            self.numThreadsTFlite = self.conf.getint('System','numThreadsTFlite', fallback=0)
+            self.serverHost = self.conf.get('System','serverHost', fallback='localhost')
+            self.serverPort = self.conf.getint('System','serverPort', fallback=5000)
+            self.serverMaxWait = self.conf.getfloat('System','serverMaxWait', fallback=0.005)
+            if not self.conf.has_section('Sweep'):
+                self.sweepDef()
+            self.sweepMode = self.conf.get('Sweep','sweepMode')
+            self.sweepTrials = self.conf.getint('Sweep','sweepTrials')
+            self.concurrentTrials = self.conf.getint('Sweep','concurrentTrials')
+            self.sweepEpochs = self.conf.getint('Sweep','sweepEpochs')
+            self.sweepPatience = self.conf.getint('Sweep','sweepPatience')
+            self.sweepWarmup = self.conf.getint('Sweep','sweepWarmup')
+            self.sweepGrid = {k : eval(v) for k, v in self.conf['SweepGrid'].items()}
         except:
             print(" Error in reading configuration file. Please check it\n")
 
@@ -122,6 +188,7 @@ class Conf():
         try:
             self.SKDef()
             self.sysDef()
+            self.sweepDef()
             with open(self.configFile, 'w') as configfile:
                 self.conf.write(configfile)
         except:
@@ -136,7 +203,7 @@ def main():
     
     try:
         opts, args = getopt.getopt(sys.argv[1:],
-                                   "tnpbh:", ["train", "net", "predict", "batch", "help"])
+                                   "tnpbscwh:", ["train", "net", "predict", "batch", "server", "client", "sweep", "help"])
     except:
         usage()
         sys.exit(2)
@@ -180,6 +247,26 @@ def main():
                 usage()
                 sys.exit(2)
 
+        if o in ("-s" , "--server"):
+            PredictionServer(dP, formatForCNN).serve()
+
+        if o in ("-c" , "--client"):
+            try:
+                predictClient(sys.argv[2], dP)
+            except:
+                usage()
+                sys.exit(2)
+
+        if o in ("-w" , "--sweep"):
+            try:
+                if len(sys.argv)<4:
+                    sweep(sys.argv[2], None)
+                else:
+                    sweep(sys.argv[2], sys.argv[3])
+            except:
+                usage()
+                sys.exit(2)
+
     total_time = time.perf_counter() - start_time
     print(" Total time: {0:.1f}s or {1:.1f}m or {2:.1f}h".format(total_time,
                             total_time/60, total_time/3600),"\n")
@@ -195,9 +282,8 @@ def train(learnFile, testFile, flag):
     
     import tensorflow as tf
     import tensorflow.keras as keras
-    from pkg_resources import parse_version
 
-    if parse_version(tf.version.VERSION) < parse_version('2.0.0'):
+    if int(tf.version.VERSION.split('.')[0]) < 2:
         useTF2 = False
     else:
         useTF2 = True
@@ -231,13 +317,13 @@ def train(learnFile, testFile, flag):
         def_val_acc = 'val_acc'
         
     learnFileRoot = os.path.splitext(learnFile)[0]
-    En, A, Cl = readLearnFile(learnFile, dP)
+    En, A, Cl = readLearnFile(learnFile, dP, dP.streamLearnFile)
+    Cl = np.asarray(Cl)
     if testFile != None:
-        En_test, A_test, Cl_test = readLearnFile(testFile, dP)
-        totA = np.vstack((A, A_test))
+        En_test, A_test, Cl_test = readLearnFile(testFile, dP, dP.streamLearnFile)
+        Cl_test = np.asarray(Cl_test)
         totCl = np.append(Cl, Cl_test)
     else:
-        totA = A
         totCl = Cl
 
     if flag == False:
@@ -297,64 +383,17 @@ def train(learnFile, testFile, flag):
     # CNN specific
     # Format spectra as images for loading
     #************************************
-    x_train = formatForCNN(A)
-    if testFile != None:
-        x_test = formatForCNN(A_test)
-
-    #************************************
-    ### Define optimizer
-    #************************************
-    #optim = opt.SGD(lr=0.0001, decay=1e-6, momentum=0.9, nesterov=True)
-    optim = keras.optimizers.Adam(lr=dP.l_rate, beta_1=0.9,
-                    beta_2=0.999, epsilon=1e-08,
-                    decay=dP.l_rdecay,
-                    amsgrad=False)
-    #************************************
-    ### Build model
-    #************************************
-    model = keras.models.Sequential()
-
-    for i in range(len(dP.CL_filter)):
-        model.add(keras.layers.Conv2D(dP.CL_filter[i], (1, dP.CL_size[i]),
-            activation='relu',
-            input_shape=x_train[0].shape))
-        try:
-            model.add(keras.layers.MaxPooling2D(pool_size=(1, dP.max_pooling[i])))
-        except:
-            print("  WARNING: Pooling layer is larger than last convolution layer\n  Aborting\n")
-            return
-        model.add(keras.layers.Dropout(dP.dropCNN[i]))
-    '''
-    try:
-        model.add(keras.layers.MaxPooling2D(pool_size=(1, dP.max_pooling)))
-    except:
-        if dP.max_pooling > dP.CL_size[-1]:
-            dP.max_pooling -= dP.CL_size[-1] - 1
-            print(" Rescaled pool size: ", dP.max_pooling, "\n")
-            model.add(keras.layers.MaxPooling2D(pool_size=(1, dP.max_pooling)))
-        else:
-            print(" Final conv-layer needs to be smaller than pooling layer")
-            return
-    '''
-    model.add(keras.layers.Flatten())
-
-    for i in range(len(dP.HL)):
-        model.add(keras.layers.Dense(dP.HL[i],
-            activation = 'relu',
-            input_dim=A.shape[1],
-            kernel_regularizer=keras.regularizers.l2(dP.l2)))
-        model.add(keras.layers.Dropout(dP.dropFCL))
-
-    if dP.regressor:
-        model.add(keras.layers.Dense(1))
-        model.compile(loss='mse',
-        optimizer=optim,
-        metrics=['mae'])
+    if dP.streamLearnFile:
+        x_shape = (1, En.size, 1)
     else:
-        model.add(keras.layers.Dense(np.unique(totCl).size+1, activation = 'softmax'))
-        model.compile(loss='categorical_crossentropy',
-            optimizer=optim,
-            metrics=['accuracy'])
+        x_train = formatForCNN(A)
+        x_shape = x_train[0].shape
+        if testFile != None:
+            x_test = formatForCNN(A_test)
+
+    model = buildModel(dP, x_shape, np.unique(totCl).size+1)
+    if model is None:
+        return
 
     tbLog = keras.callbacks.TensorBoard(log_dir=dP.tb_directory, histogram_freq=120,
             write_graph=True, write_images=True)
@@ -365,7 +404,39 @@ def train(learnFile, testFile, flag):
     if flag:
         return
     
-    if testFile != None:
+    if dP.streamLearnFile or dP.augment:
+        #************************************
+        # Stream learning data from disk
+        # and/or augment it on the fly
+        #************************************
+        if testFile != None:
+            A_train, Cl2_train = A, Cl2
+            valid_data = getStreamDataset(A_test, Cl2_test, x_shape, dP, False)
+        else:
+            # Same split as validation_split: last cv_split fraction of the data
+            split = int(A.shape[0]*(1-dP.cv_split))
+            A_train, Cl2_train = A[:split], Cl2[:split]
+            valid_data = getStreamDataset(A[split:], Cl2[split:], x_shape, dP, False)
+        if dP.augment:
+            train_data, steps = getAugmentedDataset(A_train, Cl2_train, En, x_shape, dP)
+        else:
+            train_data, steps = getStreamDataset(A_train, Cl2_train, x_shape, dP), None
+        log = model.fit(train_data,
+            epochs=dP.epochs,
+            steps_per_epoch=steps,
+            callbacks = tbLogs,
+            verbose=2,
+            validation_data=valid_data)
+
+        if dP.streamLearnFile:
+            # Only the first chunk is loaded as representative dataset
+            x_train = formatForCNN(next(readLearnChunks(A, dP.chunkSize, dP)))
+            if testFile != None and dP.showValidPred:
+                x_test = formatForCNN(np.vstack(list(readLearnChunks(A_test, dP.chunkSize, dP))))
+            if testFile != None:
+                closeLearnData(A_test)
+
+    elif testFile != None:
         log = model.fit(x_train, Cl2,
             epochs=dP.epochs,
             batch_size=dP.batch_size,
@@ -382,7 +453,7 @@ def train(learnFile, testFile, flag):
 
     # Plot activations
     if dP.plotActivations:
-        plotActivationsTrain(model)
+        plotActivationsTrain(model, dP)
 
     if useTF2:
         model.save(dP.model_name, save_format='h5')
@@ -408,7 +479,7 @@ def train(learnFile, testFile, flag):
 
     if dP.regressor:
         val_mae = np.asarray(log.history[def_val_mae])
-        printParam()
+        printParam(dP)
         print('\n  ==========================================================')
         print('  \033[1m CNN - Regressor\033[0m - Training Summary')
         print('  ==========================================================')
@@ -420,7 +491,7 @@ def train(learnFile, testFile, flag):
         print("  \033[1mMean Abs Err\033[0m - Average: {0:.4f}; Min: {1:.4f}; Last: {2:.4f}\n".format(np.average(val_mae), np.amin(val_mae), val_mae[-1]))
         print('  ========================================================\n')
         if testFile != None and dP.showValidPred:
-            predictions = model.predict(A_test)
+            predictions = model.predict(x_test)
             print('  ========================================================')
             print("  Real value | Predicted value | val_loss | val_mean_abs_err")
             print("  -----------------------------------------------------------")
@@ -437,7 +508,7 @@ def train(learnFile, testFile, flag):
             Cl2_test = le.transform(Cl_test)
             print("  Number unique classes (validation):", np.unique(Cl_test).size)
             print("  Number unique classes (total): ", np.unique(totCl).size)
-        printParam()
+        printParam(dP)
         print('\n  ========================================================')
         print('  \033[1m CNN - Classifier \033[0m - Training Summary')
         print('  ========================================================')
@@ -466,24 +537,149 @@ def train(learnFile, testFile, flag):
 
     if dP.plotWeightsFlag == True:
         plotWeights(En, A, model, "CNN")
+    closeLearnData(A)
 
     getTFVersion(dP)
 
+#************************************
+# Build and compile the CNN
+# numClasses is ignored for regressors
+#************************************
+def buildModel(dP, x_shape, numClasses):
+    import tensorflow.keras as keras
+    #************************************
+    ### Define optimizer
+    #************************************
+    #optim = opt.SGD(lr=0.0001, decay=1e-6, momentum=0.9, nesterov=True)
+    optim = keras.optimizers.Adam(lr=dP.l_rate, beta_1=0.9,
+                    beta_2=0.999, epsilon=1e-08,
+                    decay=dP.l_rdecay,
+                    amsgrad=False)
+    #************************************
+    ### Build model
+    #************************************
+    model = keras.models.Sequential()
+
+    for i in range(len(dP.CL_filter)):
+        model.add(keras.layers.Conv2D(dP.CL_filter[i], (1, dP.CL_size[i]),
+            activation='relu',
+            input_shape=x_shape))
+        try:
+            model.add(keras.layers.MaxPooling2D(pool_size=(1, dP.max_pooling[i])))
+        except:
+            print("  WARNING: Pooling layer is larger than last convolution layer\n  Aborting\n")
+            return None
+        model.add(keras.layers.Dropout(dP.dropCNN[i]))
+    '''
+    try:
+        model.add(keras.layers.MaxPooling2D(pool_size=(1, dP.max_pooling)))
+    except:
+        if dP.max_pooling > dP.CL_size[-1]:
+            dP.max_pooling -= dP.CL_size[-1] - 1
+            print(" Rescaled pool size: ", dP.max_pooling, "\n")
+            model.add(keras.layers.MaxPooling2D(pool_size=(1, dP.max_pooling)))
+        else:
+            print(" Final conv-layer needs to be smaller than pooling layer")
+            return
+    '''
+    model.add(keras.layers.Flatten())
+
+    for i in range(len(dP.HL)):
+        model.add(keras.layers.Dense(dP.HL[i],
+            activation = 'relu',
+            input_dim=x_shape[1],
+            kernel_regularizer=keras.regularizers.l2(dP.l2)))
+        model.add(keras.layers.Dropout(dP.dropFCL))
+
+    if dP.regressor:
+        model.add(keras.layers.Dense(1))
+        model.compile(loss='mse',
+        optimizer=optim,
+        metrics=['mae'])
+    else:
+        model.add(keras.layers.Dense(numClasses, activation = 'softmax'))
+        model.compile(loss='categorical_crossentropy',
+            optimizer=optim,
+            metrics=['accuracy'])
+    return model
+
+#************************************
+# Hyperparameter sweep
+#************************************
+def sweep(learnFile, testFile):
+    dP = Conf()
+    En, A, Cl = readLearnFile(learnFile, dP)
+    Cl = np.asarray(Cl)
+    if testFile != None:
+        En_test, A_test, Cl_test = readLearnFile(testFile, dP)
+        Cl_test = np.asarray(Cl_test)
+    else:
+        # Same split as validation_split: last cv_split fraction of the data
+        split = int(A.shape[0]*(1-dP.cv_split))
+        A, A_test = A[:split], A[split:]
+        Cl, Cl_test = Cl[:split], Cl[split:]
+
+    if dP.regressor:
+        Cl2 = np.copy(Cl)
+        Cl2_test = np.copy(Cl_test)
+    else:
+        # Same encoding as train(), one-hot without loading TensorFlow here
+        totCl = np.append(Cl, Cl_test)
+        le = MultiClassReductor()
+        le.fit(np.unique(totCl, axis=0))
+        numClasses = np.unique(totCl).size+1
+        Cl2 = np.eye(numClasses, dtype=np.float32)[le.transform(Cl).astype(int)]
+        Cl2_test = np.eye(numClasses, dtype=np.float32)[le.transform(Cl_test).astype(int)]
+
+    summaryFile = os.path.splitext(learnFile)[0] + '_sweep_CNN' + time.strftime('_%Y-%m-%d_%H-%M-%S') + '.csv'
+    HyperSweep(dP).run(trainSweepTrial, [A, Cl2, A_test, Cl2_test], summaryFile)
+
+# Train one sweep trial (in a worker process)
+def trainSweepTrial(params, arrays, callbacks):
+    import tensorflow.keras as keras
+    dP = Conf()
+    for k, v in params.items():
+        setattr(dP, k, v)
+    A, Cl2, A_test, Cl2_test = arrays
+    x_train = formatForCNN(A)
+    model = buildModel(dP, x_train[0].shape, None if dP.regressor else Cl2.shape[1])
+    if model is None:
+        return {'status' : 'invalid'}
+    if dP.fullSizeBatch == True:
+        dP.batch_size = A.shape[0]
+    epochs = dP.sweepEpochs if dP.sweepEpochs > 0 else dP.epochs
+    earlyStop = keras.callbacks.EarlyStopping(monitor='val_loss', patience=dP.sweepPatience)
+    log = model.fit(x_train, Cl2,
+        epochs=epochs,
+        batch_size=dP.batch_size,
+        callbacks = [earlyStop] + callbacks,
+        verbose=0,
+        validation_data=(formatForCNN(A_test), Cl2_test))
+
+    val_loss = np.asarray(log.history['val_loss'])
+    result = {'epochs' : val_loss.size, 'val_loss' : float(np.amin(val_loss)),
+        'status' : 'completed' if val_loss.size == epochs else 'early stop'}
+    if dP.regressor:
+        result['val_mae'] = float(np.amin(log.history[[k for k in log.history if k.startswith('val_m')][0]]))
+    else:
+        result['val_accuracy'] = float(np.amax(log.history[[k for k in log.history if k.startswith('val_acc')][0]]))
+    return result
+
 #************************************
 # Prediction
 #************************************
 def predict(testFile):
     dP = Conf()
-    model = loadModel(dP)
+    bundle = ModelBundle(dP)
 
-    R, good = readTestFile(testFile, dP)
+    R, good = bundle.readTestFile(testFile)
     if not good:
         return
     R = formatForCNN(R)
 
     if dP.regressor:
         #predictions = model.predict(R).flatten()[0]
-        predictions = getPredictions(R, model, dP).flatten()[0]
+        predictions = bundle.predict(R).flatten()[0]
         print('\n  ========================================================')
         print('  \033[1m CNN - Regressor\033[0m - Prediction')
         print('  ========================================================')
@@ -492,9 +688,9 @@ def predict(testFile):
         print('  ========================================================\n')
         
     else:
-        le = pickle.loads(open(dP.model_le, "rb").read())
+        le = bundle.le
         #predictions = model.predict(R, verbose=0)
-        predictions = getPredictions(R, model,dP)
+        predictions = bundle.predict(R)
         pred_class = np.argmax(predictions)
         if dP.useTFlitePred:
             predProb = round(100*predictions[0][pred_class]/255,2)
@@ -531,26 +727,25 @@ def predict(testFile):
             print(' ==========================================\n')
 
     if dP.plotActivations and not dP.useTFlitePred:
-        plotActivationsPredictions(R,model)
+        plotActivationsPredictions(R, bundle.model, dP)
+
+    bundle.printTimings()
 
 #************************************
 # Batch Prediction
 #************************************
 def batchPredict(folder):
     dP = Conf()
-    model = loadModel(dP)
-
-    predictions = np.zeros((0,0))
-    fileName = []
-    for file in glob.glob(folder+'/*.txt'):
-        R, good = readTestFile(file, dP)
-        if good:
-            R = formatForCNN(R)
-            try:
-                predictions = np.vstack((predictions,getPredictions(R, model, dP).flatten()))
-            except:
-                predictions = np.array([getPredictions(R, model,dP).flatten()])
-            fileName.append(file)
+    bundle = ModelBundle(dP)
+
+    pred_time = time.perf_counter()
+    R, fileName = bundle.readTestFiles(glob.glob(folder+'/*.txt'))
+    if len(fileName) == 0:
+        print("\033[1m\n No valid spectra found in:",folder,"\033[0m\n")
+        return
+    R = formatForCNN(R)
+    predictions = bundle.predict(R).reshape(len(fileName),-1)
+    pred_time = time.perf_counter() - pred_time
 
     if dP.regressor:
         summaryFile = np.array([['SpectraKeras_CNN','Regressor','',],['File name','Prediction','']])
@@ -564,7 +759,7 @@ def batchPredict(folder):
         print('  ========================================================\n')
 
     else:
-        le = pickle.loads(open(dP.model_le, "rb").read())
+        le = bundle.le
         summaryFile = np.array([['SpectraKeras_CNN','Classifier',''],['File name','Predicted Class', 'Probability']])
         print('\n  ========================================================')
         print('  \033[1m CNN - Classifier\033[0m - Prediction')
@@ -590,23 +785,21 @@ def batchPredict(folder):
     df = pd.DataFrame(summaryFile)
     df.to_csv(dP.summaryFileName, index=False, header=False)
     print(" Prediction summary saved in:",dP.summaryFileName,"\n")
+    print(" Batch prediction: {0:d} spectra in {1:.2f}s ({2:.1f} spectra/s)\n".format(len(fileName),
+        pred_time, len(fileName)/pred_time))
+    bundle.printTimings()
 
 #****************************************************
 # Format data for CNN
 #****************************************************
 def formatForCNN(A):
-    listmatrix = []
-    for i in range(A.shape[0]):
-        spectra = np.dstack([A[i]])
-        listmatrix.append(spectra)
-    x = np.stack(listmatrix, axis=0)
-    return x
+    # (N,L) -> (N,1,L,1): a view of A, no copy when A is contiguous
+    return np.asarray(A).reshape(A.shape[0], 1, -1, 1)
 
 #************************************
 # Print NN Info
 #************************************
-def printParam():
-    dP = Conf()
+def printParam(dP):
     print('\n  ================================================')
     print('  \033[1m CNN\033[0m - Parameters')
     print('  ================================================')
@@ -626,14 +819,17 @@ def printParam():
     else:
         print('  Batch size:', dP.batch_size)
     print('  Number of labels:', dP.numLabels)
+    if dP.augment:
+        print('  Augmentation: {0:d} copies; noise: {1:g}%, relative: {2:g}%; offsets: {3:g} (x), {4:g} (y); slope: {5:g}'.format(
+            dP.augmentCopies, dP.augmentNoise, dP.augmentRelNoise, dP.augmentHorOffset, dP.augmentVertOffset,
+            dP.augmentLinBackground))
     #print('  ================================================\n')
 
 #************************************
 # Plot Activations in Predictions
 #************************************
-def plotActivationsTrain(model):
+def plotActivationsTrain(model, dP):
     import matplotlib.pyplot as plt
-    dP = Conf()
     weight_conv2d_1 = model.layers[0].get_weights()[0][:,:,0,:]
     col_size = dP.sizeColPlot
     row_size = int(dP.CL_filter[0]/dP.sizeColPlot)
@@ -651,11 +847,10 @@ def plotActivationsTrain(model):
 #************************************
 # Plot Activations in Predictions
 #************************************
-def plotActivationsPredictions(R, model):
+def plotActivationsPredictions(R, model, dP):
     print(" Saving activation plots...\n")
     import matplotlib.pyplot as plt
     from tensorflow.keras.models import Model
-    dP = Conf()
     layer_outputs = [layer.output for layer in model.layers]
     activation_model = Model(inputs=model.input, outputs=layer_outputs)
     activations = activation_model.predict(R)
@@ -704,6 +899,13 @@ def usage():
     print('  python3 SpectraKeras_CNN.py -p <testFile>\n')
     print(' Batch predict:')
     print('  python3 SpectraKeras_CNN.py -b <folder>\n')
+    print(' Start prediction server (model is loaded once):')
+    print('  python3 SpectraKeras_CNN.py -s\n')
+    print(' Predict using a running server:')
+    print('  python3 SpectraKeras_CNN.py -c <testFile or folder>\n')
+    print(' Hyperparameter sweep ([Sweep] and [SweepGrid] in SpectraKeras_CNN.ini):')
+    print('  python3 SpectraKeras_CNN.py -w <learningFile>')
+    print('  python3 SpectraKeras_CNN.py -w <learningFile> <validationFile>\n')
     print(' Display Neural Network Configuration:')
     print('  python3 SpectraKeras_CNN.py -n <learningFile>\n')
     print(' Requires python 3.x. Not compatible with python 2.x\n')
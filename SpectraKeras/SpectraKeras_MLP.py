@@ -11,7 +11,7 @@
 print(__doc__)
 
 import numpy as np
-import sys, os.path, getopt, time, configparser, pickle, h5py, csv, glob
+import sys, os.path, getopt, time, configparser, pickle, csv, glob
 from libSpectraKeras import *
 
 #***************************************************
@@ -63,6 +63,18 @@ class Conf():
             'cv_split' : 0.01,
             'fullSizeBatch' : False,
             'batch_size' : 64,
+            'streamLearnFile' : False,
+            'chunkSize' : 1024,
+            'shuffleBuffer' : 10000,
+            'augment' : False,
+            'augmentCopies' : 4,
+            'augmentNoise' : 0,
+            'augmentRelNoise' : 1,
+            'augmentHorOffset' : 2,
+            'augmentVertOffset' : 0,
+            'augmentLinBackground' : 0,
+            'augmentSeed' : 0,
+            'augmentQueue' : 8,
             'numLabels' : 1,
             'plotWeightsFlag' : False,
             'showValidPred' : False,
@@ -74,6 +86,12 @@ class Conf():
             'useTFlitePred' : False,
             'TFliteRuntime' : False,
             'runCoralEdge' : False,
+            'batchSizePredict' : 64,
+            'poolSizeTFlite' : 1,
+            'numThreadsTFlite' : 0,
+            'serverHost' : 'localhost',
+            'serverPort' : 5000,
+            'serverMaxWait' : 0.005,
             }
 
     def readConfig(self,configFile):
@@ -93,6 +111,19 @@ class Conf():
             self.cv_split = self.conf.getfloat('Parameters','cv_split')
             self.fullSizeBatch = self.conf.getboolean('Parameters','fullSizeBatch')
             self.batch_size = self.conf.getint('Parameters','batch_size')
+            self.streamLearnFile = self.conf.getboolean('Parameters','streamLearnFile', fallback=False)
+            self.chunkSize = self.conf.getint('Parameters','chunkSize', fallback=1024)
+            self.shuffleBuffer = self.conf.getint('Parameters','shuffleBuffer', fallback=10000)
+            # On-the-fly augmentation. augmentSeed = 0: random seed
+            self.augment = self.conf.getboolean('Parameters','augment', fallback=False)
+            self.augmentCopies = self.conf.getint('Parameters','augmentCopies', fallback=4)
+            self.augmentNoise = self.conf.getfloat('Parameters','augmentNoise', fallback=0)
+            self.augmentRelNoise = self.conf.getfloat('Parameters','augmentRelNoise', fallback=1)
+            self.augmentHorOffset = self.conf.getfloat('Parameters','augmentHorOffset', fallback=2)
+            self.augmentVertOffset = self.conf.getfloat('Parameters','augmentVertOffset', fallback=0)
+            self.augmentLinBackground = self.conf.getfloat('Parameters','augmentLinBackground', fallback=0)
+            self.augmentSeed = self.conf.getint('Parameters','augmentSeed', fallback=0) or None
+            self.augmentQueue = self.conf.getint('Parameters','augmentQueue', fallback=8)
             self.numLabels = self.conf.getint('Parameters','numLabels')
             self.plotWeightsFlag = self.conf.getboolean('Parameters','plotWeightsFlag')
             self.showValidPred = self.conf.getboolean('Parameters','showValidPred')
@@ -100,6 +131,12 @@ class Conf():
             self.useTFlitePred = self.conf.getboolean('System','useTFlitePred')
             self.TFliteRuntime = self.conf.getboolean('System','TFliteRuntime')
             self.runCoralEdge = self.conf.getboolean('System','runCoralEdge')
+            self.batchSizePredict = self.conf.getint('System','batchSizePredict', fallback=64)
+            self.poolSizeTFlite = self.conf.getint('System','poolSizeTFlite', fallback=1)
+            self.numThreadsTFlite = self.conf.getint('System','numThreadsTFlite', fallback=0)
+            self.serverHost = self.conf.get('System','serverHost', fallback='localhost')
+            self.serverPort = self.conf.getint('System','serverPort', fallback=5000)
+            self.serverMaxWait = self.conf.getfloat('System','serverMaxWait', fallback=0.005)
         except:
             print(" Error in reading configuration file. Please check it\n")
 
@@ -122,7 +159,7 @@ def main():
     
     try:
         opts, args = getopt.getopt(sys.argv[1:],
-                                   "tpbh:", ["train", "predict", "batch", "help"])
+                                   "tpbsch:", ["train", "predict", "batch", "server", "client", "help"])
     except:
         usage()
         sys.exit(2)
@@ -156,6 +193,16 @@ def main():
                 usage()
                 sys.exit(2)
 
+        if o in ("-s" , "--server"):
+            PredictionServer(dP, None).serve()
+
+        if o in ("-c" , "--client"):
+            try:
+                predictClient(sys.argv[2], dP)
+            except:
+                usage()
+                sys.exit(2)
+
     total_time = time.perf_counter() - start_time
     print(" Total time: {0:.1f}s or {1:.1f}m or {2:.1f}h".format(total_time,
                             total_time/60, total_time/3600),"\n")
@@ -171,9 +218,8 @@ def train(learnFile, testFile):
     
     import tensorflow as tf
     import tensorflow.keras as keras
-    from pkg_resources import parse_version
 
-    if parse_version(tf.version.VERSION) < parse_version('2.0.0'):
+    if int(tf.version.VERSION.split('.')[0]) < 2:
         useTF2 = False
     else:
         useTF2 = True
@@ -208,13 +254,13 @@ def train(learnFile, testFile):
 
     learnFileRoot = os.path.splitext(learnFile)[0]
 
-    En, A, Cl = readLearnFile(learnFile, dP)
+    En, A, Cl = readLearnFile(learnFile, dP, dP.streamLearnFile)
+    Cl = np.asarray(Cl)
     if testFile != None:
-        En_test, A_test, Cl_test = readLearnFile(testFile, dP)
-        totA = np.vstack((A, A_test))
+        En_test, A_test, Cl_test = readLearnFile(testFile, dP, dP.streamLearnFile)
+        Cl_test = np.asarray(Cl_test)
         totCl = np.append(Cl, Cl_test)
     else:
-        totA = A
         totCl = Cl
 
     with open(dP.spectral_range, 'ab') as f:
@@ -268,6 +314,9 @@ def train(learnFile, testFile):
     if dP.fullSizeBatch == True:
         dP.batch_size = A.shape[0]
 
+    x_train = A
+    x_shape = (En.size,)
+
     #************************************
     ### Define optimizer
     #************************************
@@ -305,7 +354,40 @@ def train(learnFile, testFile):
     
     model.summary()
     
-    if testFile != None:
+    if dP.streamLearnFile or dP.augment:
+        #************************************
+        # Stream learning data from disk
+        # and/or augment it on the fly
+        #************************************
+        if testFile != None:
+            A_train, Cl2_train = A, Cl2
+            valid_data = getStreamDataset(A_test, Cl2_test, x_shape, dP, False)
+        else:
+            # Same split as validation_split: last cv_split fraction of the data
+            split = int(A.shape[0]*(1-dP.cv_split))
+            A_train, Cl2_train = A[:split], Cl2[:split]
+            valid_data = getStreamDataset(A[split:], Cl2[split:], x_shape, dP, False)
+        if dP.augment:
+            train_data, steps = getAugmentedDataset(A_train, Cl2_train, En, x_shape, dP)
+        else:
+            train_data, steps = getStreamDataset(A_train, Cl2_train, x_shape, dP), None
+        log = model.fit(train_data,
+            epochs=dP.epochs,
+            steps_per_epoch=steps,
+            callbacks = tbLogs,
+            verbose=2,
+            validation_data=valid_data)
+
+        if dP.streamLearnFile:
+            # Only the first chunk is loaded as representative dataset
+            x_train = next(readLearnChunks(A, dP.chunkSize, dP))
+            if testFile != None:
+                A_h5 = A_test
+                if dP.showValidPred:
+                    A_test = np.vstack(list(readLearnChunks(A_h5, dP.chunkSize, dP)))
+                closeLearnData(A_h5)
+
+    elif testFile != None:
         log = model.fit(A, Cl2,
             epochs=dP.epochs,
             batch_size=dP.batch_size,
@@ -328,7 +410,7 @@ def train(learnFile, testFile):
     model.summary()
     
     if dP.makeQuantizedTFlite:
-        makeQuantizedTFmodel(A, model, dP)
+        makeQuantizedTFmodel(x_train, model, dP)
 
     print('\n  =============================================')
     print('  \033[1m MLP\033[0m - Model Configuration')
@@ -344,7 +426,7 @@ def train(learnFile, testFile):
 
     if dP.regressor:
         val_mae = np.asarray(log.history[def_val_mae])
-        printParam()
+        printParam(dP)
         print('\n  ==========================================================')
         print('  \033[1m MLP - Regressor\033[0m - Training Summary')
         print('  ==========================================================')
@@ -372,7 +454,7 @@ def train(learnFile, testFile):
             Cl2_test = le.transform(Cl_test)
             print("  Number unique classes (validation):", np.unique(Cl_test).size)
             print("  Number unique classes (total): ", np.unique(totCl).size)
-        printParam()
+        printParam(dP)
         print('\n  ========================================================')
         print('  \033[1m MLP - Classifier \033[0m - Training Summary')
         print('  ========================================================')
@@ -401,6 +483,7 @@ def train(learnFile, testFile):
 
     if dP.plotWeightsFlag == True:
         plotWeights(En, A, model, MLP)
+    closeLearnData(A)
     
     getTFVersion(dP)
 
@@ -409,15 +492,15 @@ def train(learnFile, testFile):
 #************************************
 def predict(testFile):
     dP = Conf()
-    model = loadModel(dP)
+    bundle = ModelBundle(dP)
 
-    R, good = readTestFile(testFile, dP)
+    R, good = bundle.readTestFile(testFile)
     if not good:
         return
 
     if dP.regressor:
         #predictions = model.predict(R).flatten()[0]
-        predictions = getPredictions(R, model, dP).flatten()[0]
+        predictions = bundle.predict(R).flatten()[0]
         print('\n  ========================================================')
         print('  \033[1m MLP - Regressor\033[0m - Prediction')
         print('  ========================================================')
@@ -426,9 +509,9 @@ def predict(testFile):
         print('  ========================================================\n')
         
     else:
-        le = pickle.loads(open(dP.model_le, "rb").read())
+        le = bundle.le
         #predictions = model.predict(R, verbose=0)
-        predictions = getPredictions(R, model,dP)
+        predictions = bundle.predict(R)
         pred_class = np.argmax(predictions)
         if dP.useTFlitePred:
             predProb = round(100*predictions[0][pred_class]/255,2)
@@ -466,23 +549,22 @@ def predict(testFile):
             print("  3:",str((predValue[1]/0.5)*(100-99.2-.3)),"%\n")
             print(' ==========================================\n')
 
+    bundle.printTimings()
+
 #************************************
 # Batch Prediction
 #************************************
 def batchPredict(folder):
     dP = Conf()
-    model = loadModel(dP)
+    bundle = ModelBundle(dP)
 
-    predictions = np.zeros((0,0))
-    fileName = []
-    for file in glob.glob(folder+'/*.txt'):
-        R, good = readTestFile(file, dP)
-        if good:
-            try:
-                predictions = np.vstack((predictions,getPredictions(R, model, dP).flatten()))
-            except:
-                predictions = np.array([getPredictions(R, model, dP).flatten()])
-            fileName.append(file)
+    pred_time = time.perf_counter()
+    R, fileName = bundle.readTestFiles(glob.glob(folder+'/*.txt'))
+    if len(fileName) == 0:
+        print("\033[1m\n No valid spectra found in:",folder,"\033[0m\n")
+        return
+    predictions = bundle.predict(R).reshape(len(fileName),-1)
+    pred_time = time.perf_counter() - pred_time
 
     if dP.regressor:
         summaryFile = np.array([['SpectraKeras_MLP','Regressor','',],['File name','Prediction','']])
@@ -496,7 +578,7 @@ def batchPredict(folder):
         print('  ========================================================\n')
 
     else:
-        le = pickle.loads(open(dP.model_le, "rb").read())
+        le = bundle.le
         summaryFile = np.array([['SpectraKeras_MLP','Classifier',''],['File name','Predicted Class', 'Probability']])
         print('\n  ========================================================')
         print('  \033[1mKeras MLP - Classifier\033[0m - Prediction')
@@ -521,12 +603,14 @@ def batchPredict(folder):
     df = pd.DataFrame(summaryFile)
     df.to_csv(dP.summaryFileName, index=False, header=False)
     print(" Prediction summary saved in:",dP.summaryFileName,"\n")
+    print(" Batch prediction: {0:d} spectra in {1:.2f}s ({2:.1f} spectra/s)\n".format(len(fileName),
+        pred_time, len(fileName)/pred_time))
+    bundle.printTimings()
 
 #************************************
 # Print NN Info
 #************************************
-def printParam():
-    dP = Conf()
+def printParam(dP):
     print('\n  ================================================')
     print('  \033[1m MLP\033[0m - Parameters')
     print('  ================================================')
@@ -542,6 +626,10 @@ def printParam():
     else:
         print('  Batch size:', dP.batch_size)
     print('  Number of labels:', dP.numLabels)
+    if dP.augment:
+        print('  Augmentation: {0:d} copies; noise: {1:g}%, relative: {2:g}%; offsets: {3:g} (x), {4:g} (y); slope: {5:g}'.format(
+            dP.augmentCopies, dP.augmentNoise, dP.augmentRelNoise, dP.augmentHorOffset, dP.augmentVertOffset,
+            dP.augmentLinBackground))
     #print('  ================================================\n')
         
 #************************************
@@ -557,6 +645,10 @@ def usage():
     print('  python3 SpectraKeras_MLP.py -p <testFile>\n')
     print(' Batch predict:')
     print('  python3 SpectraKeras_MLP.py -b <folder>\n')
+    print(' Start prediction server (model is loaded once):')
+    print('  python3 SpectraKeras_MLP.py -s\n')
+    print(' Predict using a running server:')
+    print('  python3 SpectraKeras_MLP.py -c <testFile or folder>\n')
     print(' Requires python 3.x. Not compatible with python 2.x\n')
 
 #************************************
@@ -8,19 +8,27 @@
 ***********************************************************
 '''
 import numpy as np
-import os.path, pickle, h5py
+import os.path, pickle, time, json, threading
 
 #************************************
 # Open Learning Data
 #************************************
-def readLearnFile(learnFile, dP):
+def readLearnFile(learnFile, dP, lazy=False):
     print("\n  Opening learning file: ",learnFile)
     try:
         if os.path.splitext(learnFile)[1] == ".npy":
-            M = np.load(learnFile)
+            if lazy:
+                M = np.load(learnFile, mmap_mode='r')
+            else:
+                M = np.load(learnFile)
         elif os.path.splitext(learnFile)[1] == ".h5":
-            with h5py.File(learnFile, 'r') as hf:
-                M = hf["M"][:]
+            import h5py
+            if lazy:
+                hf = h5py.File(learnFile, 'r')
+                M = H5Matrix(hf["M"], h5file=hf)
+            else:
+                with h5py.File(learnFile, 'r') as hf:
+                    M = hf["M"][:]
         else:
             with open(learnFile, 'r') as f:
                 M = np.loadtxt(f, unpack =False)
@@ -28,39 +36,129 @@ def readLearnFile(learnFile, dP):
         print("\033[1m Learning file not found\033[0m")
         return
 
-    En = M[0,dP.numLabels:]
+    En = np.asarray(M[0,dP.numLabels:])
     A = M[1:,dP.numLabels:]
     
     if dP.normalize:
-        norm = Normalizer()
-        A = norm.transform_matrix(A)
+        if lazy:
+            # Normalization is applied chunk by chunk through readLearnChunks
+            print("  Lazy loading: normalization deferred to each chunk")
+        else:
+            norm = Normalizer()
+            A = norm.transform_matrix(A)
 
     if dP.numLabels == 1:
         Cl = M[1:,0]
     else:
-        Cl = M[1:,[0,dP.numLabels-1]]
+        Cl = M[1:,0:dP.numLabels:dP.numLabels-1]
         
     return En, A, Cl
 
+#************************************
+# Read learning data in row chunks
+#************************************
+def readLearnChunks(A, chunkSize, dP):
+    if dP.normalize:
+        norm = Normalizer()
+    for i in range(0, A.shape[0], chunkSize):
+        a = np.asarray(A[i:i+chunkSize])
+        if dP.normalize:
+            a = norm.transform_matrix(a)
+        yield a
+
+#************************************
+# Close lazily read learning data
+#************************************
+def closeLearnData(*arrays):
+    for M in arrays:
+        if isinstance(M, H5Matrix):
+            M.close()
+
+#************************************
+# Streaming input pipeline (tf.data)
+#************************************
+def getStreamDataset(A, Cl2, shape, dP, shuffle=True):
+    import tensorflow as tf
+    if dP.normalize:
+        norm = Normalizer()
+
+    def readChunks():
+        ind = np.arange(0, A.shape[0], dP.chunkSize)
+        if shuffle:
+            np.random.shuffle(ind)
+        for i in ind:
+            a = np.asarray(A[i:i+dP.chunkSize])
+            if dP.normalize:
+                a = norm.transform_matrix(a)
+            yield a.reshape((-1,)+shape).astype(np.float32), \
+                np.asarray(Cl2[i:i+dP.chunkSize], dtype=np.float32)
+
+    # Only one chunk, the shuffle buffer and one prefetched batch are in memory
+    dataset = tf.data.Dataset.from_generator(readChunks,
+        output_types=(tf.float32, tf.float32),
+        output_shapes=(tf.TensorShape((None,)+shape), tf.TensorShape((None,)+Cl2.shape[1:])))
+    dataset = dataset.apply(tf.data.experimental.unbatch())
+    if shuffle:
+        dataset = dataset.shuffle(dP.shuffleBuffer)
+    return dataset.batch(dP.batch_size).prefetch(1)
+
 #************************************
 # Open Testing Data
 #************************************
-def readTestFile(testFile, dP):
+def readTestFile(testFile, dP, En=None, resampler=None):
     try:
         with open(testFile, 'r') as f:
             print('\n  Opening sample data for prediction:\n  ',testFile)
             Rtot = np.loadtxt(f, unpack =True)
-        R = preProcess(Rtot, dP)
+        R = preProcess(Rtot, dP, En, resampler)
     except:
         print("\033[1m\n File not found or corrupt\033[0m\n")
         return 0, False
     return R, True
+
+#************************************
+# Open Testing Data - Batch
+# Spectra sharing the same x-axis are
+# normalized and resampled together
+#************************************
+def readTestFiles(files, dP, En=None, resampler=None):
+    if En is None:
+        En = pickle.loads(open(dP.spectral_range, "rb").read())
+    if resampler is None:
+        resampler = Resampler()
+    groups = {}
+    fileName = []
+    for file in files:
+        try:
+            with open(file, 'r') as f:
+                print('\n  Opening sample data for prediction:\n  ',file)
+                Rtot = np.loadtxt(f, unpack =True)
+            Rx, Ry = Rtot[0,:], Rtot[1,:]
+        except:
+            print("\033[1m\n File not found or corrupt\033[0m\n")
+            continue
+        groups.setdefault(Rx.tobytes(), []).append((len(fileName), Rx, Ry))
+        fileName.append(file)
+
+    R = np.zeros((len(fileName), len(En)))
+    for group in groups.values():
+        ind = [g[0] for g in group]
+        Rg = np.array([g[2] for g in group])
+        if dP.normalize:
+            norm = Normalizer()
+            Rg = norm.transform_matrix(Rg, inplace=True)
+        if(Rg.shape[1] != len(En)):
+            print('  Rescaling x-axis from',str(Rg.shape[1]),'to',str(len(En)),'for',len(ind),'spectra')
+            Rg = resampler.transform(En, group[0][1], Rg)
+        R[ind] = Rg
+    return R, fileName
     
 #****************************************************
 # Check Energy Range and convert to fit training set
 #****************************************************
-def preProcess(Rtot, dP):
-    En = pickle.loads(open(dP.spectral_range, "rb").read())
+def preProcess(Rtot, dP, En=None, resampler=None):
+    if En is None:
+        En = pickle.loads(open(dP.spectral_range, "rb").read())
     R = np.array([Rtot[1,:]])
     Rx = np.array([Rtot[0,:]])
     
@@ -70,58 +168,572 @@ def preProcess(Rtot, dP):
     
     if(R.shape[1] != len(En)):
         print('  Rescaling x-axis from',str(R.shape[1]),'to',str(len(En)))
-        R = np.interp(En, Rx[0], R[0])
-        R = R.reshape(1,-1)
+        if resampler is None:
+            resampler = Resampler()
+        R = resampler.transform(En, Rx[0], R)
     return R
-    
+
+#****************************************************
+# Linear resampling onto the training x-axis
+# Equivalent to np.interp(En, Rx, r) for each row r,
+# with index and weight arrays computed once per
+# (En, Rx) pair and applied to the whole stack.
+# Same as Resampler in SpectraLearnPredict2's
+# slp_preprocess: the packages are installed
+# separately. Keep them in sync.
+#****************************************************
+class Resampler(object):
+    def __init__(self, maxPlans=32):
+        self.maxPlans = maxPlans
+        self.plans = {}
+        # Shared by the prediction server threads
+        self.lock = threading.Lock()
+
+    def getPlan(self, En, Rx):
+        En = np.asarray(En, dtype=np.float64)
+        Rx = np.asarray(Rx, dtype=np.float64)
+        key = (En.tobytes(), Rx.tobytes())
+        plan = self.plans.get(key)
+        if plan is None:
+            ind = np.clip(np.searchsorted(Rx, En, side='right')-1, 0, max(Rx.size-2, 0))
+            ind2 = np.minimum(ind+1, Rx.size-1)
+            dx = Rx[ind2] - Rx[ind]
+            w = np.zeros(En.size)
+            np.divide(En - Rx[ind], dx, out=w, where=dx!=0)
+            # Outside of Rx, np.interp holds the first/last value
+            plan = (ind, ind2, np.clip(w, 0, 1))
+            with self.lock:
+                if len(self.plans) >= self.maxPlans:
+                    self.plans.clear()
+                self.plans[key] = plan
+        return plan
+
+    def transform(self, En, Rx, R):
+        ind, ind2, w = self.getPlan(En, Rx)
+        R = np.asarray(R)
+        return R[...,ind]*(1-w) + R[...,ind2]*w
+
 #************************************
 # Make prediction based on framework
 #************************************
 def getPredictions(R, model, dP):
-    if dP.useTFlitePred:
-        interpreter = model  #needed to keep consistency with documentation
-        # Get input and output tensors.
+    if dP.useTFlitePred or dP.TFliteRuntime:
+        # The interpreter input may have been resized by a previous batch
+        predictions = getPredictionsBatch(R, model, dP)
+    else:
+        predictions = model.predict(R)
+    return predictions
+
+#************************************
+# Make batch predictions based on framework
+#************************************
+def getPredictionsBatch(R, model, dP):
+    if isinstance(model, InterpreterPool):
+        predictions = model.predict(R)
+    elif dP.useTFlitePred or dP.TFliteRuntime:
+        interpreter = model
         input_details = interpreter.get_input_details()
         output_details = interpreter.get_output_details()
-
-        # Test model on random input data.
-        input_shape = input_details[0]['shape']
-        input_data = np.array(R, dtype=np.float32)
-        interpreter.set_tensor(input_details[0]['index'], input_data)
-        interpreter.invoke()
-
-        # The function `get_tensor()` returns a copy of the tensor data.
-        # Use `tensor()` in order to get a pointer to the tensor.
-        predictions = interpreter.get_tensor(output_details[0]['index'])
-        
+        # Edge TPU models are compiled for a fixed input shape
+        if dP.TFliteRuntime and dP.runCoralEdge:
+            batchSize = 1
+        else:
+            batchSize = dP.batchSizePredict
+        predictions = None
+        for i in range(0, R.shape[0], batchSize):
+            input_data = np.array(R[i:i+batchSize], dtype=np.float32)
+            # Resize the input tensor only when the mini-batch size changes
+            if input_details[0]['shape'][0] != input_data.shape[0]:
+                interpreter.resize_tensor_input(input_details[0]['index'], input_data.shape)
+                interpreter.allocate_tensors()
+                input_details = interpreter.get_input_details()
+            interpreter.set_tensor(input_details[0]['index'], input_data)
+            interpreter.invoke()
+            # The function `get_tensor()` returns a copy of the tensor data.
+            output_data = interpreter.get_tensor(output_details[0]['index'])
+            if predictions is None:
+                predictions = np.zeros((R.shape[0],)+output_data.shape[1:], dtype=output_data.dtype)
+            predictions[i:i+input_data.shape[0]] = output_data
     else:
-        predictions = model.predict(R)
+        predictions = model.predict(R, batch_size=dP.batchSizePredict)
     return predictions
 
 #************************************
 # Load saved models
 #************************************
 def loadModel(dP):
+    if dP.TFliteRuntime or dP.useTFlitePred:
+        # model here is intended as interpreter
+        if not dP.TFliteRuntime:
+            getTFVersion(dP)
+        if dP.poolSizeTFlite > 1 and not (dP.TFliteRuntime and dP.runCoralEdge):
+            model = InterpreterPool(dP)
+        else:
+            model = loadInterpreter(dP)
+    else:
+        getTFVersion(dP)
+        import tensorflow as tf
+        model = tf.keras.models.load_model(dP.model_name)
+    return model
+
+#************************************
+# Create a TensorFlow Lite interpreter
+#************************************
+def loadInterpreter(dP):
+    kwargs = {}
     if dP.TFliteRuntime:
         import tflite_runtime.interpreter as tflite
-        # model here is intended as interpreter
+        Interpreter = tflite.Interpreter
         if dP.runCoralEdge:
             print(" Running on Coral Edge TPU")
-            model = tflite.Interpreter(model_path=os.path.splitext(dP.model_name)[0]+'_edgetpu.tflite',
-                experimental_delegates=[tflite.load_delegate(dP.edgeTPUSharedLib,{})])
+            model_path = os.path.splitext(dP.model_name)[0]+'_edgetpu.tflite'
+            kwargs['experimental_delegates'] = [tflite.load_delegate(dP.edgeTPUSharedLib,{})]
         else:
-            model = tflite.Interpreter(model_path=os.path.splitext(dP.model_name)[0]+'.tflite')
-        model.allocate_tensors()
+            model_path = os.path.splitext(dP.model_name)[0]+'.tflite'
     else:
-        getTFVersion(dP)
         import tensorflow as tf
-        if dP.useTFlitePred:
-            # model here is intended as interpreter
-            model = tf.lite.Interpreter(model_path=os.path.splitext(dP.model_name)[0]+'.tflite')
-            model.allocate_tensors()
+        Interpreter = tf.lite.Interpreter
+        model_path = os.path.splitext(dP.model_name)[0]+'.tflite'
+    if dP.numThreadsTFlite > 0:
+        kwargs['num_threads'] = dP.numThreadsTFlite
+    try:
+        interpreter = Interpreter(model_path=model_path, **kwargs)
+    except TypeError:
+        # num_threads is not available in older versions of TensorFlow Lite
+        kwargs.pop('num_threads', None)
+        interpreter = Interpreter(model_path=model_path, **kwargs)
+    interpreter.allocate_tensors()
+    return interpreter
+
+#************************************
+# Pool of TensorFlow Lite interpreters
+# Mini-batches are spread across the
+# interpreters; predictions are returned
+# in the same order as the input spectra
+#************************************
+class InterpreterPool(object):
+    def __init__(self, dP):
+        import queue
+        from concurrent.futures import ThreadPoolExecutor
+        self.dP = dP
+        self.interpreters = [loadInterpreter(dP) for i in range(dP.poolSizeTFlite)]
+        self.free = queue.Queue()
+        for interpreter in self.interpreters:
+            self.free.put(interpreter)
+        self.executor = ThreadPoolExecutor(len(self.interpreters))
+        print(" TensorFlow Lite interpreter pool:",len(self.interpreters),"interpreters,",
+            dP.numThreadsTFlite if dP.numThreadsTFlite > 0 else "default","threads each\n")
+
+    def run(self, R):
+        interpreter = self.free.get()
+        try:
+            return getPredictionsBatch(R, interpreter, self.dP)
+        finally:
+            self.free.put(interpreter)
+
+    def predict(self, R):
+        step = self.dP.batchSizePredict
+        if R.shape[0] <= step:
+            return self.run(R)
+        chunks = [R[i:i+step] for i in range(0, R.shape[0], step)]
+        return np.concatenate(list(self.executor.map(self.run, chunks)))
+
+#************************************
+# Model bundle: model, spectral range,
+# label encoder and configuration are
+# loaded once and reused for each spectrum
+#************************************
+class ModelBundle(object):
+    def __init__(self, dP):
+        start_time = time.perf_counter()
+        self.dP = dP
+        self.model = loadModel(dP)
+        with open(dP.spectral_range, "rb") as f:
+            self.En = pickle.loads(f.read())
+        self.resampler = Resampler()
+        if dP.regressor:
+            self.le = None
         else:
-            model = tf.keras.models.load_model(dP.model_name)
-    return model
+            with open(dP.model_le, "rb") as f:
+                self.le = pickle.loads(f.read())
+        self.loadTime = time.perf_counter() - start_time
+        self.inferenceTime = 0
+        self.numSpectra = 0
+
+    def readTestFile(self, testFile):
+        return readTestFile(testFile, self.dP, self.En, self.resampler)
+
+    def readTestFiles(self, files):
+        return readTestFiles(files, self.dP, self.En, self.resampler)
+
+    def predict(self, R):
+        start_time = time.perf_counter()
+        if R.shape[0] == 1:
+            predictions = getPredictions(R, self.model, self.dP)
+        else:
+            predictions = getPredictionsBatch(R, self.model, self.dP)
+        self.inferenceTime += time.perf_counter() - start_time
+        self.numSpectra += R.shape[0]
+        return predictions
+
+    def printTimings(self):
+        print(" Model load time: {0:.3f}s".format(self.loadTime))
+        if self.numSpectra > 0:
+            print(" Inference time: {0:.3f}s for {1:d} spectra ({2:.2f} ms/spectrum)\n".format(self.inferenceTime,
+                self.numSpectra, 1000*self.inferenceTime/self.numSpectra))
+
+#************************************
+# Prediction server
+# The model is loaded once. Requests are
+# preprocessed in their own thread, then
+# gathered into micro-batches by a single
+# worker that owns the model
+#************************************
+class PredictionServer(object):
+    def __init__(self, dP, formatFn=None):
+        import queue
+        self.dP = dP
+        self.formatFn = formatFn
+        self.bundle = ModelBundle(dP)
+        self.queue = queue.Queue()
+        self.numRequests = 0
+        self.lock = threading.Lock()
+
+    def serve(self):
+        from http.server import ThreadingHTTPServer
+        threading.Thread(target=self.batchWorker, daemon=True).start()
+        httpd = ThreadingHTTPServer((self.dP.serverHost, self.dP.serverPort), self.makeHandler())
+        print("\n  Prediction server for",self.dP.model_name,"listening on http://{0}:{1}".format(self.dP.serverHost,
+            self.dP.serverPort))
+        print("  Press Ctrl+C to stop\n")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        httpd.server_close()
+        print("\n  Requests served:",self.numRequests)
+        self.bundle.printTimings()
+
+    # Queue spectra for the worker and wait for their predictions
+    def submit(self, R):
+        job = {'R': R, 'done': threading.Event()}
+        self.queue.put(job)
+        job['done'].wait()
+        if 'error' in job:
+            raise job['error']
+        return job['predictions']
+
+    def batchWorker(self):
+        import queue
+        while True:
+            jobs = [self.queue.get()]
+            numSpectra = jobs[0]['R'].shape[0]
+            deadline = time.perf_counter() + self.dP.serverMaxWait
+            while numSpectra < self.dP.batchSizePredict:
+                try:
+                    job = self.queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                numSpectra += job['R'].shape[0]
+            try:
+                R = np.vstack([job['R'] for job in jobs])
+                if self.formatFn is not None:
+                    R = self.formatFn(R)
+                predictions = self.bundle.predict(R).reshape(numSpectra,-1)
+                i = 0
+                for job in jobs:
+                    job['predictions'] = predictions[i:i+job['R'].shape[0]]
+                    i += job['R'].shape[0]
+            except Exception as e:
+                for job in jobs:
+                    job['error'] = e
+            for job in jobs:
+                job['done'].set()
+
+    # Request: {"files": [paths on the server]} and/or
+    # {"spectra": [{"name": .., "x": [..], "y": [..]}]}
+    def readRequest(self, request):
+        R = np.zeros((0, len(self.bundle.En)))
+        names = []
+        if request.get('files'):
+            R, names = readTestFiles(request['files'], self.dP, self.bundle.En, self.bundle.resampler)
+        spectra = request.get('spectra', [])
+        if len(spectra) > 0:
+            Rs = np.vstack([preProcess(np.array([sp['x'], sp['y']], dtype=np.float64), self.dP,
+                self.bundle.En, self.bundle.resampler) for sp in spectra])
+            R = np.vstack([R, Rs])
+            names.extend([sp.get('name', str(i)) for i, sp in enumerate(spectra)])
+        return R, names
+
+    def decode(self, predictions, names):
+        results = []
+        for i in range(predictions.shape[0]):
+            if self.dP.regressor:
+                results.append({'name': names[i], 'value': float(predictions[i][0])})
+            else:
+                pred_class = int(np.argmax(predictions[i]))
+                if self.dP.useTFlitePred:
+                    predProb = 100*predictions[i][pred_class]/255
+                else:
+                    predProb = 100*predictions[i][pred_class]
+                predValue = np.asarray(self.bundle.le.inverse_transform(pred_class)[0]).tolist()
+                results.append({'name': names[i], 'value': predValue, 'probability': round(float(predProb),2)})
+        return results
+
+    def status(self):
+        return {'model': self.dP.model_name, 'regressor': self.dP.regressor, 'numPoints': len(self.bundle.En),
+            'requests': self.numRequests, 'spectra': self.bundle.numSpectra,
+            'loadTime': self.bundle.loadTime, 'inferenceTime': self.bundle.inferenceTime}
+
+    def makeHandler(self):
+        from http.server import BaseHTTPRequestHandler
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/status':
+                    self.sendJSON(200, server.status())
+                else:
+                    self.sendJSON(404, {'error': 'Unknown endpoint: '+self.path})
+
+            def do_POST(self):
+                if self.path != '/predict':
+                    self.sendJSON(404, {'error': 'Unknown endpoint: '+self.path})
+                    return
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                    R, names = server.readRequest(request)
+                except Exception as e:
+                    self.sendJSON(400, {'error': 'Invalid request: '+str(e)})
+                    return
+                try:
+                    results = []
+                    if len(names) > 0:
+                        results = server.decode(server.submit(R), names)
+                except Exception as e:
+                    self.sendJSON(500, {'error': 'Prediction failed: '+str(e)})
+                    return
+                with server.lock:
+                    server.numRequests += 1
+                self.sendJSON(200, {'results': results})
+
+            def sendJSON(self, code, data):
+                body = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+        return Handler
+
+#************************************
+# Prediction client
+# Spectra are read locally and sent as
+# raw arrays, so that no TensorFlow
+# import is needed on the client side
+#************************************
+def predictClient(path, dP):
+    import glob
+    from urllib import request as urlrequest
+    if os.path.isdir(path):
+        files = sorted(glob.glob(path+'/*.txt'))
+    else:
+        files = [path]
+    spectra = []
+    for file in files:
+        try:
+            with open(file, 'r') as f:
+                Rtot = np.loadtxt(f, unpack =True)
+            spectra.append({'name': file, 'x': Rtot[0,:].tolist(), 'y': Rtot[1,:].tolist()})
+        except:
+            print("\033[1m\n File not found or corrupt:",file,"\033[0m\n")
+    if len(spectra) == 0:
+        return
+
+    url = "http://{0}:{1}/predict".format(dP.serverHost, dP.serverPort)
+    req = urlrequest.Request(url, data=json.dumps({'spectra': spectra}).encode(),
+        headers={'Content-Type': 'application/json'})
+    try:
+        with urlrequest.urlopen(req) as response:
+            results = json.loads(response.read())['results']
+    except Exception as e:
+        print("\033[1m\n Prediction server not available at",url,"(",e,")\033[0m\n")
+        return
+
+    print('\n  ========================================================')
+    print('  \033[1m Prediction server\033[0m -',url)
+    print('  ========================================================')
+    for result in results:
+        if 'probability' in result:
+            print('  {0:s}:\033[1m\n   Predicted value = {1} (probability = {2:.2f}%)\033[0m\n'.format(result['name'],
+                result['value'], result['probability']))
+        else:
+            print('  {0:s}:\033[1m\n   Predicted value = {1:.2f}\033[0m\n'.format(result['name'], result['value']))
+    print('  ========================================================\n')
+    return results
+
+#************************************
+# Hyperparameter sweep
+# Trials (grid or random search over dP.sweepGrid) run in
+# dP.concurrentTrials worker processes. The learning data is placed
+# once in shared memory and attached by each worker. Trials whose
+# validation loss is above the median of the other trials at the same
+# epoch (after dP.sweepWarmup epochs) are stopped early.
+#************************************
+class HyperSweep(object):
+    def __init__(self, dP):
+        self.dP = dP
+
+    def getTrials(self):
+        names = list(self.dP.sweepGrid.keys())
+        if self.dP.sweepMode == 'random':
+            import random
+            rnd = random.Random(0)
+            return [{n : self.sample(self.dP.sweepGrid[n], rnd) for n in names} for i in range(self.dP.sweepTrials)]
+        import itertools
+        return [dict(zip(names, v)) for v in itertools.product(*[self.dP.sweepGrid[n] for n in names])]
+
+    # Lists are sampled uniformly, (low, high) tuples log-uniformly
+    def sample(self, values, rnd):
+        if isinstance(values, tuple):
+            return float(np.exp(rnd.uniform(np.log(values[0]), np.log(values[1]))))
+        return rnd.choice(values)
+
+    def run(self, trainFn, arrays, summaryFile):
+        import multiprocessing as mp
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        trials = self.getTrials()
+        numWorkers = max(1, min(self.dP.concurrentTrials, len(trials)))
+        numThreads = max(1, (os.cpu_count() or 1)//numWorkers)
+        print("\n  Hyperparameter sweep ({0:s}): {1:d} trials, {2:d} concurrent, {3:d} thread(s) each\n".format(
+            self.dP.sweepMode, len(trials), numWorkers, numThreads))
+
+        # TensorFlow is not fork-safe: workers are started fresh
+        ctx = mp.get_context('spawn')
+        manager = ctx.Manager()
+        history = manager.dict()
+        lock = manager.Lock()
+        shms, specs = shareArrays(arrays)
+        results = []
+        try:
+            with ProcessPoolExecutor(max_workers=numWorkers, mp_context=ctx) as executor:
+                futures = [executor.submit(runSweepTrial, trainFn, i, trials[i], specs, history, lock,
+                    numThreads, self.dP.sweepWarmup) for i in range(len(trials))]
+                for f in as_completed(futures):
+                    r = f.result()
+                    results.append(r)
+                    print("  Trial {0:d} ({1:d}/{2:d}): {3:s} - val_loss: {4:.4f} - {5:.1f}s".format(r['trial'],
+                        len(results), len(trials), r['status'], r.get('val_loss', np.nan), r['time']))
+        finally:
+            freeArrays(shms)
+            manager.shutdown()
+
+        self.saveSummary(results, trials, summaryFile)
+        return results
+
+    # Ranked by validation accuracy (classifier) or validation loss (regressor)
+    def saveSummary(self, results, trials, summaryFile):
+        import csv
+        names = list(self.dP.sweepGrid.keys())
+        if self.dP.regressor:
+            metric = 'val_mae'
+            key = lambda r: (r.get('val_loss') is None, r.get('val_loss', 0))
+        else:
+            metric = 'val_accuracy'
+            key = lambda r: (r.get(metric) is None, -r.get(metric, 0), r.get('val_loss', 0))
+        results = sorted(results, key=key)
+        with open(summaryFile, 'w', newline='') as f:
+            csv_out = csv.writer(f)
+            csv_out.writerow(['Rank', 'Trial'] + names + ['Status', 'Epochs', 'val_loss', metric, 'Time [s]'])
+            for i, r in enumerate(results):
+                csv_out.writerow([i+1, r['trial']] + [r['params'][n] for n in names] +
+                    [r['status'], r.get('epochs', ''), r.get('val_loss', ''), r.get(metric, ''), '{0:.1f}'.format(r['time'])])
+
+        print('\n  ========================================================')
+        print('  \033[1m Hyperparameter sweep\033[0m - Best trials')
+        print('  ========================================================')
+        for r in results[:5]:
+            print("  Trial {0:d}: {1:s} = {2:s}, val_loss = {3:s}\n   {4:s}".format(r['trial'], metric,
+                str(r.get(metric, 'n/a')), str(r.get('val_loss', 'n/a')), str(r['params'])))
+        print('  ========================================================')
+        print("  Sweep summary saved in:", summaryFile, "\n")
+
+# Run in a worker process: attach the shared arrays and train one trial.
+# trainFn(params, arrays, callbacks) returns a dictionary of metrics.
+def runSweepTrial(trainFn, trial, params, specs, history, lock, numThreads, warmup):
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(numThreads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except:
+        pass
+    shms, arrays = attachArrays(specs)
+    start_time = time.perf_counter()
+    pruning = getSweepPruning(history, lock, warmup)
+    try:
+        result = trainFn(params, arrays, [pruning])
+        if pruning.pruned:
+            result['status'] = 'pruned'
+    except Exception as e:
+        result = {'status' : 'failed: ' + str(e)}
+    result.update({'trial' : trial, 'params' : params, 'time' : time.perf_counter() - start_time})
+    del arrays
+    freeArrays(shms, False)
+    return result
+
+# Median stopping rule across concurrent trials
+def getSweepPruning(history, lock, warmup):
+    import tensorflow.keras as keras
+    class SweepPruning(keras.callbacks.Callback):
+        def __init__(self):
+            super().__init__()
+            self.pruned = False
+        def on_epoch_end(self, epoch, logs=None):
+            val_loss = (logs or {}).get('val_loss')
+            if val_loss is None:
+                return
+            with lock:
+                others = list(history.get(epoch, []))
+                history[epoch] = others + [float(val_loss)]
+            if epoch+1 >= warmup and len(others) >= 2 and val_loss > np.median(others):
+                self.pruned = True
+                self.model.stop_training = True
+    return SweepPruning()
+
+#************************************
+# Share arrays between processes
+# specs: [name, shape, dtype] for each array
+# Also used by SpectraLearnPredict2 for its
+# concurrent training. Workers should be
+# started with the 'spawn' context
+#************************************
+def shareArrays(arrays):
+    from multiprocessing import shared_memory
+    shms = []
+    specs = []
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+        shms.append(shm)
+        specs.append([shm.name, a.shape, a.dtype.str])
+    return shms, specs
+
+def attachArrays(specs):
+    from multiprocessing import shared_memory
+    shms = [shared_memory.SharedMemory(name=s[0]) for s in specs]
+    arrays = [np.ndarray(s[1], dtype=np.dtype(s[2]), buffer=shm.buf) for s, shm in zip(specs, shms)]
+    return shms, arrays
+
+# unlink: only by the process that created the arrays
+def freeArrays(shms, unlink=True):
+    for shm in shms:
+        shm.close()
+        if unlink:
+            shm.unlink()
 
 #************************************
 ### Create Quantized tflite model
@@ -180,12 +792,79 @@ def plotWeights(En, A, model, type):
 # Get TensorFlow Version
 #************************************
 def getTFVersion(dP):
+    if dP.TFliteRuntime:
+        # Avoid loading the full TensorFlow when only the runtime is used
+        import tflite_runtime
+        print(" TensorFlow Lite runtime v.",getattr(tflite_runtime, '__version__', 'n/a'),"\n")
+        return
     import tensorflow as tf
-    from pkg_resources import parse_version
     if dP.useTFlitePred:
-        print(" TensorFlow (Lite) v.",parse_version(tf.version.VERSION),"\n")
+        print(" TensorFlow (Lite) v.",tf.version.VERSION,"\n")
     else:
-        print(" TensorFlow v.",parse_version(tf.version.VERSION),"\n" )
+        print(" TensorFlow v.",tf.version.VERSION,"\n" )
+
+#************************************
+# Lazy view of HDF5 learning data
+#************************************
+class H5Matrix(object):
+    def __init__(self, dataset, rows=None, cols=None, h5file=None):
+        self.dataset = dataset
+        self.h5file = h5file
+        self.dtype = dataset.dtype
+        if rows is None:
+            rows = range(dataset.shape[0])
+        if cols is None:
+            cols = range(dataset.shape[1])
+        self.rows = rows
+        self.cols = cols
+
+    @property
+    def shape(self):
+        if isinstance(self.cols, range):
+            return (len(self.rows), len(self.cols))
+        return (len(self.rows),)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Slicing rows returns a new view, nothing is read until needed
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        cols = self.cols[key[1]] if len(key) > 1 else self.cols
+        if isinstance(key[0], (int, np.integer, slice)):
+            rows = self.rows[key[0]]
+            if isinstance(rows, range):
+                return H5Matrix(self.dataset, rows, cols, self.h5file)
+            return self.dataset[rows, self.colKey(cols)]
+        # h5py requires increasing indexes for fancy selections
+        ind = np.asarray(self.rows)[key[0]]
+        uind, inv = np.unique(ind, return_inverse=True)
+        return self.dataset[uind.tolist(), self.colKey(cols)][inv]
+
+    def __array__(self, dtype=None, copy=None):
+        M = self.dataset[self.rows.start:self.rows.stop:self.rows.step, self.colKey(self.cols)]
+        if dtype is not None:
+            M = M.astype(dtype)
+        return M
+
+    # Views share the file handle, closing any of them closes the file
+    def close(self):
+        if self.h5file is not None and self.h5file.id.valid:
+            self.h5file.close()
+
+    def colKey(self, cols):
+        if isinstance(cols, range):
+            return slice(cols.start, cols.stop, cols.step)
+        return cols
 
 #************************************
 # Normalizer
@@ -195,14 +874,21 @@ class Normalizer(object):
         self.YnormTo = 1
         print("  Normalizing spectra between 0 and 1")
 
-    def transform_matrix(self,y):
-        yn = np.copy(y)
-        for i in range(0,y.shape[0]):
-            if np.amax(y[i,:]) - np.amin(y[i,:]) == 0:
-                pass
-            else:
-                yn[i,:] = np.multiply(y[i,:] - np.amin(y[i,:]),
-                    self.YnormTo/(np.amax(y[i,:]) - np.amin(y[i,:])))
+    # inplace overwrites y (which must be a float array); dtype sets the
+    # output type of the copy (e.g. np.float32), default: same as y
+    def transform_matrix(self, y, inplace=False, dtype=None):
+        if inplace:
+            yn = y
+        else:
+            yn = np.array(y, dtype=dtype)
+        ymin = np.amin(yn, axis=1, keepdims=True)
+        yrange = np.amax(yn, axis=1, keepdims=True) - ymin
+        # Rows with constant intensity are left untouched
+        const = yrange == 0
+        ymin[const] = 0
+        yrange[const] = self.YnormTo
+        yn -= ymin
+        yn *= self.YnormTo/yrange
         return yn
     
     def transform_single(self,y):
@@ -318,3 +1004,372 @@ class MultiClassReductor():
 
     def classes_(self):
         return self.totalClass
+
+#************************************
+# Data augmentation
+# Noise, horizontal shift, vertical offset and linear
+# background are applied to blocks of spectra at once.
+# Each block gets its own RNG stream from seed and block
+# position, so results do not depend on the number of workers
+#   noise: uniform noise, in % of the intensity scale
+#   relNoise: uniform noise, in % of the max of each spectrum
+#   horOffset, vertOffset: shift of x-axis and intensity
+#   linBackground: slope of the added linear background
+#   multNoise: spectra multiplied by uniform noise, in % of the
+#     max of each point over all spectra (AddRelativeNoisyData)
+#   randomize: offsets drawn in [-offset, offset], slope in [0, slope]
+#   flatland: add noise only where the intensity is zero
+#   shared: noise, multNoise and vertOffset drawn once per copy,
+#     the same for all spectra (Add* utilities)
+#   compound: copy j adds up the shared draws of copies 0 to j, as
+#     the Add* utilities did by modifying the spectra in place
+#   keepLabels: False sets the labels of the copies to 0
+#     (AddLinearBackground)
+#   vertOffsetLast: False leaves the last point out of the
+#     vertical offset (AddVerticalOffset)
+#************************************
+class Augmenter(object):
+    def __init__(self, En, noise=0, relNoise=0, horOffset=0, vertOffset=0, linBackground=0,
+            randomize=True, flatland=False, normalize=False, YnormTo=1, seed=None, multNoise=0,
+            shared=False, compound=False, keepLabels=True, vertOffsetLast=True):
+        self.En = np.asarray(En, dtype=np.float64)
+        dEn = np.diff(self.En)
+        self.step = dEn[0] if dEn.size > 0 and np.allclose(dEn, dEn[0], rtol=1e-6, atol=0) else None
+        self.noise = noise
+        self.relNoise = relNoise
+        self.horOffset = horOffset
+        self.vertOffset = vertOffset
+        self.linBackground = linBackground
+        self.randomize = randomize
+        self.flatland = flatland
+        self.normalize = normalize
+        self.YnormTo = YnormTo
+        self.multNoise = multNoise
+        self.shared = shared
+        self.compound = compound
+        self.keepLabels = keepLabels
+        self.vertOffsetLast = vertOffsetLast
+        self.colMax = None
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
+
+    def getRNG(self, *key):
+        return np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=key))
+
+    # Augmented copy of the spectra in A (rows), written in out if given.
+    # copy: index of the copy, for the shared draws
+    # labels: used by normalizeSpectra
+    def transform(self, A, rng, out=None, copy=0, labels=None):
+        if out is None:
+            out = np.empty(A.shape)
+        N = A.shape[0]
+        if self.shared:
+            vert, noise, factor = self.sharedDraws(copy)
+        if self.horOffset != 0:
+            self.shift(A, self.draw(rng, self.horOffset, N, -1), out)
+        else:
+            out[:] = A
+        if self.linBackground != 0:
+            slope = self.draw(rng, self.linBackground, N, 0)
+            out -= out[:,:1]
+            out += slope[:,None]*self.En
+        if self.vertOffset != 0:
+            cols = slice(None) if self.vertOffsetLast else slice(0, -1)
+            if self.shared:
+                out[:,cols] += vert
+            else:
+                out[:,cols] += self.draw(rng, self.vertOffset, N, -1)[:,None]
+        if self.noise != 0 or self.relNoise != 0:
+            if self.shared:
+                # relNoise is never shared
+                noise = np.broadcast_to(noise, out.shape).copy()
+                if self.relNoise != 0:
+                    noise += 0.01*self.relNoise*np.amax(out, axis=1, keepdims=True)*rng.uniform(-1, 1, size=out.shape)
+            else:
+                noise = rng.uniform(-1, 1, size=out.shape)
+                noise *= 0.01*self.noise + 0.01*self.relNoise*np.amax(out, axis=1, keepdims=True)
+            if self.flatland:
+                noise[out != 0] = 0
+            out += noise
+        if self.multNoise != 0:
+            out *= factor if self.shared else np.abs(rng.uniform(-1, 1, size=out.shape))*0.01*self.multNoise*self.colMax
+        if self.normalize:
+            self.normalizeSpectra(out, labels)
+        return out
+
+    # Vertical offset, noise and multiplicative factor of a copy, the same
+    # for all spectra. With compound, summed (multiplied) over copies 0 to copy
+    def sharedDraws(self, copy):
+        vert, noise, factor = 0, np.zeros(self.En.size), np.ones(self.En.size)
+        colMax = self.colMax
+        for k in range(copy+1) if self.compound else [copy]:
+            rng = self.getRNG(k)
+            vert += self.draw(rng, self.vertOffset, 1, -1)[0]
+            noise += 0.01*self.noise*rng.uniform(-1, 1, size=self.En.size)
+            if self.multNoise != 0:
+                f = np.abs(rng.uniform(-1, 1, size=self.En.size))*0.01*self.multNoise*colMax
+                factor *= f
+                colMax = colMax*f
+        return vert, noise, factor
+
+    def draw(self, rng, value, N, low):
+        if self.randomize:
+            return value*rng.uniform(low, 1, size=N)
+        return np.full(N, float(value))
+
+    # Same as np.interp(En, En+shift[i], A[i], left=0, right=0) for each row.
+    # On an evenly spaced x-axis, the shift is a fractional offset of the
+    # column index, the same for the whole row
+    def shift(self, A, shift, out):
+        L = self.En.size
+        if self.step is None:
+            for i in range(A.shape[0]):
+                out[i] = np.interp(self.En, self.En+shift[i], A[i], left=0, right=0)
+            return out
+        # Rows with the same integer offset are processed together with slices
+        pos0 = -shift/self.step
+        off = np.floor(pos0).astype(np.intp)
+        w = pos0 - off
+        out[:] = 0
+        for o in np.unique(off):
+            g = np.nonzero(off == o)[0]
+            wg = w[g,None]
+            Ag = A[g]
+            lo, hi = max(0, -o), min(L, L-1-o)
+            res = np.zeros((g.size, L))
+            if lo < hi:
+                res[:,lo:hi] = Ag[:,lo+o:hi+o]*(1-wg) + Ag[:,lo+o+1:hi+o+1]*wg
+            # Last point, reached only without fractional offset
+            if 0 <= L-1-o < L:
+                exact = wg[:,0] == 0
+                res[exact, L-1-o] = Ag[exact, L-1]
+            out[g] = res
+        return out
+
+    # Shift to positive intensities when needed, scale max to YnormTo.
+    # As in the Add* utilities, rows with label <= 0 are always shifted
+    def normalizeSpectra(self, A, labels=None):
+        Amin = np.amin(A, axis=1)
+        neg = Amin <= 0
+        if labels is not None:
+            neg |= np.asarray(labels) <= 0
+        A[neg] -= Amin[neg,None] - 1e-8
+        A *= self.YnormTo/np.amax(A, axis=1, keepdims=True)
+        return A
+
+    # Augmented copies of M ([label, spectrum] rows), in order, one block at
+    # a time: yields (copy, first row, block). Blocks run on numWorkers threads.
+    def augmentBlocks(self, M, numCopies, blockSize=4096, numWorkers=1):
+        if self.multNoise != 0:
+            self.colMax = np.amax(M[:,1:], axis=0)
+        jobs = [(j, i) for j in range(numCopies) for i in range(0, M.shape[0], blockSize)]
+        def run(job):
+            j, i = job
+            block = np.empty((min(blockSize, M.shape[0]-i), M.shape[1]))
+            block[:,0] = M[i:i+blockSize,0] if self.keepLabels else 0
+            self.transform(np.asarray(M[i:i+blockSize,1:], dtype=np.float64), self.getRNG(j, i//blockSize),
+                block[:,1:], j, block[:,0])
+            return j, i, block
+        if numWorkers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(numWorkers) as p:
+                # Bounded look-ahead: at most 2*numWorkers blocks in memory
+                pending = [p.submit(run, job) for job in jobs[:2*numWorkers]]
+                for k in range(len(jobs)):
+                    result = pending.pop(0).result()
+                    if k + 2*numWorkers < len(jobs):
+                        pending.append(p.submit(run, jobs[k + 2*numWorkers]))
+                    yield result
+        else:
+            for job in jobs:
+                yield run(job)
+
+    # Learning file with energy row, M (if includeOriginal) and numCopies
+    # augmented copies of M. h5: chunked dataset written block by block
+    # normalizeOriginal: copies are made from M, M is written normalized
+    def save(self, M, learnFile, numCopies, includeOriginal=True, blockSize=4096, numWorkers=1,
+            normalizeOriginal=False):
+        numRows = 1 + M.shape[0]*(numCopies + int(includeOriginal))
+        header = np.append([0], self.En)
+        original = M
+        if includeOriginal and normalizeOriginal:
+            original = np.array(M, dtype=np.float64)
+            self.normalizeSpectra(original[:,1:], original[:,0])
+        if os.path.splitext(learnFile)[1] == '.txt':
+            with open(learnFile, 'wb') as f:
+                np.savetxt(f, header.reshape(1,-1), delimiter='\t', fmt='%10.6f')
+                if includeOriginal:
+                    np.savetxt(f, original, delimiter='\t', fmt='%10.6f')
+                for j, i, block in self.augmentBlocks(M, numCopies, blockSize, numWorkers):
+                    np.savetxt(f, block, delimiter='\t', fmt='%10.6f')
+        else:
+            import h5py
+            with h5py.File(learnFile, 'w') as hf:
+                dataset = hf.create_dataset("M", shape=(numRows, M.shape[1]), dtype=np.float64, maxshape=(None, M.shape[1]),
+                    chunks=(min(blockSize, numRows), M.shape[1]))
+                dataset[0] = header
+                start = 1
+                if includeOriginal:
+                    dataset[1:1+M.shape[0]] = original
+                    start += M.shape[0]
+                for j, i, block in self.augmentBlocks(M, numCopies, blockSize, numWorkers):
+                    row = start + j*M.shape[0] + i
+                    dataset[row:row+block.shape[0]] = block
+        return numRows
+
+    # Endless batches for training. Each epoch covers numCopies augmented
+    # copies of A, plus A itself if includeOriginal. Epoch e, batch b always
+    # gets the same RNG stream, shuffling included.
+    def flow(self, A, Cl, batchSize, numCopies=1, includeOriginal=False, shuffle=True):
+        N = A.shape[0]
+        numRows = N*(numCopies + int(includeOriginal))
+        epoch = 0
+        while True:
+            rng = self.getRNG(epoch)
+            ind = rng.permutation(numRows) if shuffle else np.arange(numRows)
+            for b, i in enumerate(range(0, numRows, batchSize)):
+                # Sorted rows: faster reads from HDF5
+                v = np.sort(ind[i:i+batchSize])
+                v = v[np.argsort(v % N, kind='stable')]
+                rows = v % N
+                a = np.asarray(A[rows], dtype=np.float64)
+                out = self.transform(a, self.getRNG(epoch, b))
+                if includeOriginal:
+                    orig = v < N
+                    out[orig] = a[orig]
+                yield out, Cl[rows]
+            epoch += 1
+
+#************************************
+# Run a generator in a background thread,
+# with at most size items waiting
+#************************************
+def prefetchBatches(batches, size):
+    import threading, queue
+    q = queue.Queue(size)
+    def worker():
+        try:
+            for b in batches:
+                q.put(b)
+        except Exception as e:
+            q.put(e)
+    threading.Thread(target=worker, daemon=True).start()
+    while True:
+        b = q.get()
+        if isinstance(b, Exception):
+            raise b
+        yield b
+
+#************************************
+# On-the-fly augmentation (tf.data)
+# Each epoch covers the learning data and
+# augmentCopies augmented copies of it
+#************************************
+def getAugmentedDataset(A, Cl2, En, shape, dP):
+    import tensorflow as tf
+    aug = Augmenter(En, noise=dP.augmentNoise, relNoise=dP.augmentRelNoise, horOffset=dP.augmentHorOffset,
+        vertOffset=dP.augmentVertOffset, linBackground=dP.augmentLinBackground, seed=dP.augmentSeed)
+    if dP.normalize:
+        norm = Normalizer()
+    steps = int(np.ceil(A.shape[0]*(dP.augmentCopies+1)/dP.batch_size))
+    print("  Augmentation on the fly: {0:d} spectra per epoch, in {1:d} batches (seed: {2})\n".format(
+        A.shape[0]*(dP.augmentCopies+1), steps, aug.seed))
+
+    def batches():
+        for a, cl in aug.flow(A, Cl2, dP.batch_size, dP.augmentCopies, True):
+            if dP.normalize:
+                a = norm.transform_matrix(a, inplace=True)
+            yield a.reshape((-1,)+shape).astype(np.float32), np.asarray(cl, dtype=np.float32)
+
+    dataset = tf.data.Dataset.from_generator(lambda: prefetchBatches(batches(), dP.augmentQueue),
+        output_types=(tf.float32, tf.float32),
+        output_shapes=(tf.TensorShape((None,)+shape), tf.TensorShape((None,)+Cl2.shape[1:])))
+    return dataset, steps
+
+#************************************
+# Train/test splits of learning files
+# Row masks are computed once from the labels; the
+# subsets are then written in one pass over the
+# learning file, in blocks of rows (HDF5 and npy
+# files are never loaded in full)
+#************************************
+class LearnFileSplitter(object):
+    def __init__(self, learnFile, blockSize=65536):
+        self.hf = None
+        if os.path.splitext(learnFile)[1] == ".npy":
+            self.M = np.load(learnFile, mmap_mode='r')
+        elif os.path.splitext(learnFile)[1] == ".h5":
+            import h5py
+            self.hf = h5py.File(learnFile, 'r')
+            self.M = self.hf["M"]
+        else:
+            with open(learnFile, 'r') as f:
+                self.M = np.loadtxt(f, unpack =False)
+        self.En = np.asarray(self.M[0,1:])
+        self.Cl = np.asarray(self.M[1:,0])
+        self.numRows = self.Cl.shape[0]
+        self.blockSize = blockSize
+
+    # Rows of each class (stratified) or all rows
+    def groups(self, stratified):
+        if not stratified:
+            return [np.arange(self.numRows)]
+        classes, inv = np.unique(self.Cl, return_inverse=True)
+        order = np.argsort(inv, kind='stable')
+        return np.split(order, np.cumsum(np.bincount(inv))[:-1])
+
+    # True for the rows in the test set
+    def testMask(self, testFraction, stratified=False, seed=42):
+        rng = np.random.default_rng(seed)
+        test = np.zeros(self.numRows, dtype=bool)
+        for ind in self.groups(stratified):
+            test[rng.permutation(ind)[:int(round(testFraction*ind.size))]] = True
+        return test
+
+    # Fold of each row. With stratified, the fold sequence continues
+    # from one class to the next, so fold sizes differ by one at most
+    def kFolds(self, k, stratified=False, seed=42):
+        rng = np.random.default_rng(seed)
+        fold = np.zeros(self.numRows, dtype=np.intp)
+        start = 0
+        for ind in self.groups(stratified):
+            fold[rng.permutation(ind)] = (start + np.arange(ind.size)) % k
+            start += ind.size
+        return fold
+
+    # Rows where masks[i] is True go to files[i] (h5 or txt), with the energy row
+    def write(self, files, masks):
+        header = np.append([0], self.En).reshape(1,-1)
+        outputs = []
+        for file, mask in zip(files, masks):
+            print(' Writing', file, '- number of datapoints:', int(np.count_nonzero(mask)))
+            if os.path.splitext(file)[1] == ".txt":
+                f = open(file, 'wb')
+                np.savetxt(f, header, delimiter='\t', fmt='%10.6f')
+                outputs.append([f, None, mask, 0])
+            else:
+                import h5py
+                f = h5py.File(file, 'w')
+                numRows = 1 + int(np.count_nonzero(mask))
+                dataset = f.create_dataset("M", shape=(numRows, header.shape[1]), dtype=self.M.dtype,
+                    chunks=(min(numRows, 1024), header.shape[1]))
+                dataset[0] = header[0]
+                outputs.append([f, dataset, mask, 1])
+        for start in range(0, self.numRows, self.blockSize):
+            block = np.asarray(self.M[1+start:1+start+self.blockSize])
+            for out in outputs:
+                rows = block[out[2][start:start+block.shape[0]]]
+                if rows.shape[0] == 0:
+                    continue
+                if out[1] is None:
+                    np.savetxt(out[0], rows, delimiter='\t', fmt='%10.6f')
+                else:
+                    out[1][out[3]:out[3]+rows.shape[0]] = rows
+                    out[3] += rows.shape[0]
+        for out in outputs:
+            out[0].close()
+
+    def close(self):
+        if self.hf is not None:
+            self.hf.close()
@@ -13,18 +13,40 @@
 ***********************************************************
 '''
 
-import matplotlib
-if matplotlib.get_backend() == 'TkAgg':
-    matplotlib.use('Agg')
-
 import numpy as np
 import sys, os.path, getopt, glob, csv
 import random, time, configparser, os
 from os.path import exists, splitext
 from os import rename
 from datetime import datetime, date
-import tensorflow as tf
-from pkg_resources import parse_version
+
+#***************************************************************
+''' Heavy frameworks (TensorFlow, sklearn, matplotlib) are '''
+''' imported only within the functions that use them '''
+#***************************************************************
+def importPyplot():
+    import matplotlib
+    if matplotlib.get_backend() == 'TkAgg':
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def isTF2():
+    import tensorflow as tf
+    return int(tf.version.VERSION.split('.')[0]) >= 2
+
+#***************************************************************
+''' Prediction-only runs (preprocDef.predictOnly) have no learning data '''
+''' (A has 0 rows): saved models are loaded, never fitted or evaluated '''
+#***************************************************************
+def isLoadOnly(A, modelFile):
+    if A.shape[0] > 0:
+        return False
+    if os.path.exists(modelFile) == False:
+        print('\033[1m Prediction only: saved model not found: ' + modelFile)
+        print(' Train the model with the learning file first.\033[0m\n')
+        sys.exit(2)
+    return True
 
 #***************************************************************
 ''' Parameters and configuration  '''
@@ -38,10 +60,11 @@ class Configuration():
         if os.path.isfile(self.configFile) is False:
             print("Configuration file: \""+confFileName+"\" does not exist: Creating one.")
             self.createConfig()
-        if parse_version(tf.version.VERSION) < parse_version('2.0.0-alpha0'):
-            self.useTF2 = False
-        else:
-            self.useTF2 = True
+
+    # Evaluated on use, so that TensorFlow is not imported with the configuration
+    @property
+    def useTF2(self):
+        return isTF2()
 
     # Hadrcoded default definitions for the confoguration file
     def preprocDef(self):
@@ -62,6 +85,7 @@ class Configuration():
             'cherryPickEnPoint' : False,
             'enSel' : [1050, 1150, 1220, 1270, 1330, 1410, 1480, 1590, 1620, 1650],
             'enSelDelta' : [2, 2, 2, 2, 10, 2, 2, 15, 5, 2],
+            'predictOnly' : False,
             }
 
     def dnntfDef(self):
@@ -145,6 +169,8 @@ class Configuration():
             'runPCA' : False,
             'customNumCompPCA' : True,
             'numComponentsPCA' : 2,
+            'solverPCA' : 'full',
+            'batchSizePCA' : 10000,
             }
 
     def kmDef(self):
@@ -154,6 +180,9 @@ class Configuration():
             'numComponentsKM' : 20,
             'plotKM' : False,
             'plotMapKM' : True,
+            'alwaysRetrainKM' : True,
+            'miniBatchKM' : False,
+            'batchSizeKM' : 4096,
             }
 
     def tfDef(self):
@@ -188,6 +217,8 @@ class Configuration():
             'useAllCores' : False,
             'numCores' : 2,
             'fractionGPUmemory' : 1,
+            'mapTileSize' : 4096,
+            'parallelTraining' : False,
             }
 
     # Read configuration file into usable variables
@@ -221,6 +252,7 @@ class Configuration():
         self.cherryPickEnPoint = self.conf.getboolean('Preprocessing','cherryPickEnPoint')
         self.enSel = eval(self.preprocDef['enSel'])
         self.enSelDelta = eval(self.preprocDef['enSelDelta'])
+        self.predictOnly = self.conf.getboolean('Preprocessing','predictOnly',fallback=False)
         
         self.runDNNTF = self.conf.getboolean('DNNClassifier','runDNNTF')
         self.runSkflowDNNTF = self.conf.getboolean('DNNClassifier','runSkflowDNNTF')
@@ -289,12 +321,17 @@ class Configuration():
         self.runPCA = self.conf.getboolean('PCA','runPCA')
         self.customNumCompPCA = self.conf.getboolean('PCA','customNumCompPCA')
         self.numComponentsPCA = self.conf.getint('PCA','numComponentsPCA')
+        self.solverPCA = self.conf.get('PCA','solverPCA',fallback='full')
+        self.batchSizePCA = self.conf.getint('PCA','batchSizePCA',fallback=10000)
 
         self.runKM = self.conf.getboolean('KMeans','runKM')
         self.customNumCompKM = self.conf.getboolean('KMeans','customNumCompKM')
         self.numComponentsKM = self.conf.getint('KMeans','numComponentsKM')
         self.plotKM = self.conf.getboolean('KMeans','plotKM')
         self.plotMapKM = self.conf.getboolean('KMeans','plotMapKM')
+        self.alwaysRetrainKM = self.conf.getboolean('KMeans','alwaysRetrainKM',fallback=True)
+        self.miniBatchKM = self.conf.getboolean('KMeans','miniBatchKM',fallback=False)
+        self.batchSizeKM = self.conf.getint('KMeans','batchSizeKM',fallback=4096)
         
         self.runTF = self.conf.getboolean('TensorFlow','runTF')
         self.alwaysRetrainTF = self.conf.getboolean('TensorFlow','alwaysRetrainTF')
@@ -320,6 +357,8 @@ class Configuration():
         self.useAllCores = self.conf.getboolean('System','useAllCores')
         self.numCores = self.conf.getint('System','numCores')
         self.fractionGPUmemory = eval(self.sysDef['fractionGPUmemory'])
+        self.mapTileSize = self.conf.getint('System','mapTileSize',fallback=4096)
+        self.parallelTraining = self.conf.getboolean('System','parallelTraining',fallback=False)
 
     # Create configuration file
     def createConfig(self):
@@ -385,6 +424,10 @@ class preprocDef:
         print(' THIS IS AN EXPERIMENTAL FEATURE \n')
         print(' Restricted range: DISABLED')
 
+    # Use the preprocessing state saved with the models (<learnfile>.preproc.pkl)
+    # instead of reading the learning file. Also used if the learning file is missing.
+    predictOnly = config.predictOnly
+
 #***********************************************************
 ''' Deep Neural Networks - tensorflow via DNNClassifier'''
 #***********************************************************
@@ -448,8 +491,21 @@ class dnntfDef:
 
     #*************************************************
     # Setup variables and definitions- do not change.
+    # Run on first use, so that TensorFlow is imported
+    # only when a DNNClassifier is actually trained.
     #*************************************************
-    if runDNNTF == True:
+    isSetup = False
+
+    @classmethod
+    def setup(cls):
+        if cls.isSetup:
+            return
+        activation_function = cls.activation_function
+        optimizer = cls.optimizer
+        learning_rate = cls.learning_rate
+        l2_reg_strength = cls.l2_reg_strength
+        optimizer_tag = " "+str(optimizer)+", learn_rate: "+str(learning_rate)
+
         import tensorflow as tf
         if activation_function == "sigmoid" or activation_function == "tanh":
             actFn = "tf."+activation_function
@@ -494,6 +550,11 @@ class dnntfDef:
                                         use_locking=False,
                                         name="ProximalGradientDescent")
 
+        cls.activationFn = activationFn
+        cls.optimizer = optimizer
+        cls.optimizer_tag = optimizer_tag
+        cls.isSetup = True
+
 #***********************************************************
 ''' Deep Neural Networks - Keras'''
 #***********************************************************
@@ -547,8 +608,21 @@ class kerasDef:
 
     #*************************************************
     # Setup variables and definitions- do not change.
+    # Run on first use, so that TensorFlow/Keras are
+    # imported only when a Keras model is actually trained.
     #*************************************************
-    if runKeras == True:
+    isSetup = False
+
+    @classmethod
+    def setup(cls):
+        if cls.isSetup:
+            return
+        useTFKeras = cls.useTFKeras
+        optimizer = cls.optimizer
+        learning_rate = cls.learning_rate
+        learning_decay_rate = cls.learning_decay_rate
+        optimizer_tag = " "+str(optimizer)+", learn_rate: "+str(learning_rate)
+
         import tensorflow as tf
         if useTFKeras:
             print("Using tf.keras API")
@@ -597,6 +671,10 @@ class kerasDef:
             optimizer = TFOptimizer(optimizer)
         '''
 
+        cls.optimizer = optimizer
+        cls.optimizer_tag = optimizer_tag
+        cls.isSetup = True
+
 #**********************************************
 ''' Deep Neural Networks - sklearn'''
 #**********************************************
@@ -666,6 +744,10 @@ class pcaDef:
     runPCA = config.runPCA
     customNumPCAComp = config.customNumCompPCA
     numPCAcomponents = config.numComponentsPCA
+    # 'full', 'randomized' (randomized SVD) or 'incremental' (IncrementalPCA,
+    # streamed in chunks of batchSize spectra from .h5 learning files)
+    solver = config.solverPCA
+    batchSize = config.batchSizePCA
 
 #**********************************************
 ''' K-means '''
@@ -679,6 +761,10 @@ class kmDef:
     numKMcomponents = config.numComponentsKM
     plotKM = config.plotKM
     plotMap = config.plotMapKM
+    alwaysRetrain = config.alwaysRetrainKM
+    # MiniBatchKMeans fitted on mini-batches of batchSize spectra (for very large maps)
+    miniBatch = config.miniBatchKM
+    batchSize = config.batchSizeKM
 
 #**********************************************
 ''' TensorFlow '''
@@ -743,4 +829,10 @@ class sysDef:
     fractionGPUmemory = config.fractionGPUmemory
     print(" GPU memory reserved (if GPU is used) = ", str(fractionGPUmemory*100), "%\n")
 
+    # Number of map spectra predicted at once
+    mapTileSize = config.mapTileSize
+    # Train the sklearn models in worker processes while TensorFlow models
+    # train in the main process (-a), within a budget of numCores cores
+    parallelTraining = config.parallelTraining
+
 
@@ -13,10 +13,6 @@
 ***********************************************************
 '''
 
-import matplotlib
-if matplotlib.get_backend() == 'TkAgg':
-    matplotlib.use('Agg')
-
 import numpy as np
 import sys, os.path, getopt, glob, csv, pickle
 import random, time, configparser, os
@@ -44,6 +40,7 @@ def input_fn(A, Cl2):
 ''' Train DNNClassifier model training via TensorFlow-Estimators '''
 #********************************************************************************
 def trainDNNTF(A, Cl, A_test, Cl_test, Root):
+    dnntfDef.setup()
     import tensorflow as tf
     #import tensorflow.contrib.learn as skflow
     #from tensorflow.contrib.learn.python.learn import monitors as monitor_lib
@@ -58,6 +55,7 @@ def trainDNNTF(A, Cl, A_test, Cl_test, Root):
         dnntfDef.alwaysImprove = True
         model_directory = None
         print("\n  Training model not saved\n")
+    loadOnly = isLoadOnly(A, str(model_directory))
 
     #**********************************************
     ''' Initialize Estimator and training data '''
@@ -88,7 +86,7 @@ def trainDNNTF(A, Cl, A_test, Cl_test, Root):
         Cl2_test = Cl_test
     #############################
     
-    if dnntfDef.fullBatch == True:
+    if dnntfDef.fullBatch == True and loadOnly == False:
         batch_size_train = A.shape[0]
         batch_size_test = A_test.shape[0]
     else:
@@ -231,6 +229,9 @@ def trainDNNTF(A, Cl, A_test, Cl_test, Root):
     else:
         print("  Retreaving training model from: ", model_directory,"\n")
 
+    if loadOnly == True:
+        return clf, le
+
     accuracy_score = clf.evaluate(input_fn=test_input_fn, steps=1, hooks=hooks)
     
     print('\n  Number of spectra = ' + str(A.shape[0]))
@@ -329,6 +330,29 @@ def predDNNTF(clf, le, R, Cl):
 
     return predValue, predProb
 
+#********************************************************************************
+''' Batch prediction - tf.estimator.DNNClassifier or tf.estimator.DNNRegressor '''
+''' Predicted values and probabilities for each row of R '''
+#********************************************************************************
+def predDNNTFBatch(clf, le, R):
+    import tensorflow as tf
+
+    predict_input_fn = tf.estimator.inputs.numpy_input_fn(
+      x={"x": R},
+      num_epochs=1,
+      shuffle=False)
+
+    predictions = list(clf.predict(input_fn=predict_input_fn))
+    if dnntfDef.useRegressor == False:
+        pred_class = np.array([p["class_ids"][0] for p in predictions])
+        prob = np.array([p["probabilities"] for p in predictions])
+        predValue = le.inverse_transform(pred_class)
+        predProb = np.round(100*prob[np.arange(pred_class.shape[0]),pred_class],2)
+    else:
+        predValue = np.array([p["predictions"][0] for p in predictions])
+        predProb = np.zeros(predValue.shape[0])
+    return predValue, predProb
+
 #********************************************************************************
 ''' TensorFlow '''
 ''' Run SkFlow - DNN Classifier '''
@@ -337,6 +361,7 @@ def predDNNTF(clf, le, R, Cl):
 ''' Train DNNClassifier model training via TensorFlow-skflow '''
 #********************************************************************************
 def trainDNNTF2(A, Cl, A_test, Cl_test, Root):
+    dnntfDef.setup()
     print('==========================================================================\n')
     print('\033[1m Running Deep Neural Networks: skflow-DNNClassifier - TensorFlow...\033[0m')
     print('  Hidden layers:', dnntfDef.hidden_layers)
@@ -358,6 +383,7 @@ def trainDNNTF2(A, Cl, A_test, Cl_test, Root):
         dnntfDef.alwaysImprove = True
         model_directory = None
         print("\n  Training model not saved\n")
+    loadOnly = isLoadOnly(A, str(model_directory))
 
     #**********************************************
     ''' Initialize Estimator and training data '''
@@ -408,6 +434,9 @@ def trainDNNTF2(A, Cl, A_test, Cl_test, Root):
     else:
         print("  Retreaving training model from: ", model_directory,"\n")
 
+    if loadOnly == True:
+        return clf, le
+
     accuracy_score = clf.evaluate(input_fn=lambda: input_fn(A_test, Cl2_test), steps=1)
     print('\n  ===================================')
     print('  \033[1msk-DNN-TF\033[0m - Accuracy')
@@ -453,3 +482,20 @@ def predDNNTF2(clf, le, R, Cl):
           '  (probability = ' + str(predProb) + '%)\033[0m\n')
 
     return predValue, predProb
+
+#********************************************************************************
+''' Batch prediction - DNNClassifier via TensorFlow-skflow '''
+''' Predicted values and probabilities for each row of R '''
+#********************************************************************************
+def predDNNTF2Batch(clf, le, R):
+    import tensorflow as tf
+
+    def input_fn_predict():
+        x = tf.constant(R.astype(np.float32))
+        return x
+
+    pred_class = np.array(list(clf.predict_classes(input_fn=input_fn_predict)))
+    prob = np.array(list(clf.predict_proba(input_fn=input_fn_predict)))
+    predValue = le.inverse_transform(pred_class)
+    predProb = np.round(100*prob[np.arange(pred_class.shape[0]),pred_class],2)
+    return predValue, predProb
@@ -13,10 +13,6 @@
 ***********************************************************
 '''
 
-import matplotlib
-if matplotlib.get_backend() == 'TkAgg':
-    matplotlib.use('Agg')
-
 import numpy as np
 import sys, os.path, getopt, glob, csv
 import random, time, configparser, os
@@ -38,20 +34,26 @@ from .slp_kmeans import *
 ''' Learn and Predict - File'''
 #**********************************************
 def LearnPredictFile(learnFile, sampleFile):
-    ''' Open and process training data '''
-    En, Cl, A, YnormXind = readLearnFile(learnFile)
-
     learnFileRoot = os.path.splitext(learnFile)[0]
 
-    ''' Run PCA '''
-    if pcaDef.runPCA == True:
-        runPCA(En, Cl, A, YnormXind, pcaDef.numPCAcomponents)
+    if usePreprocState(learnFile):
+        En, Cl, A, Aorig, YnormXind = loadPreprocState(learnFileRoot)
+        R, Rx = readPredFile(sampleFile)
+    else:
+        ''' Open and process training data '''
+        En, Cl, A, YnormXind = readLearnFile(learnFile)
+
+        ''' Run PCA '''
+        if pcaDef.runPCA == True:
+            runPCA(En, Cl, A, YnormXind, pcaDef.numPCAcomponents, learnFileRoot)
 
-    ''' Open prediction file '''
-    R, Rx = readPredFile(sampleFile)
+        ''' Open prediction file '''
+        R, Rx = readPredFile(sampleFile)
+
+        A, Cl, En, Aorig = preProcessNormLearningData(A, En, Cl, YnormXind, 0)
+        savePreprocState(learnFileRoot, En, Cl, A, YnormXind)
 
     ''' Preprocess prediction data '''
-    A, Cl, En, Aorig = preProcessNormLearningData(A, En, Cl, YnormXind, 0)
     R, Rorig = preProcessNormPredData(R, Rx, En, YnormXind, 0)
     
     ''' Run Neural Network - TensorFlow'''
@@ -90,7 +92,20 @@ def LearnPredictFile(learnFile, sampleFile):
 
     ''' Run K-Means '''
     if kmDef.runKM == True:
-        runKMmain(A, Cl, En, R, Aorig, Rorig)
+        runKMmain(A, Cl, En, R, Aorig, Rorig, learnFileRoot)
+
+#**********************************************
+''' Preprocessed learning data, or only the saved '''
+''' preprocessing state for prediction-only runs '''
+#**********************************************
+def getLearningData(learnFile):
+    learnFileRoot = os.path.splitext(learnFile)[0]
+    if usePreprocState(learnFile):
+        return loadPreprocState(learnFileRoot)
+    En, Cl, A, YnormXind = readLearnFile(learnFile)
+    A, Cl, En, Aorig = preProcessNormLearningData(A, En, Cl, YnormXind, 0)
+    savePreprocState(learnFileRoot, En, Cl, A, YnormXind)
+    return En, Cl, A, Aorig, YnormXind
 
 #**********************************************
 ''' Train and accuracy'''
@@ -120,190 +135,325 @@ def trainAccuracy(learnFile, testFile):
     
     ''' Preprocess prediction data '''
     A, Cl, En, Aorig = preProcessNormLearningData(A, En, Cl, YnormXind, 0)
+    savePreprocState(learnFileRoot, En, Cl, A, YnormXind)
     A_test, Cl_test, En_test, Aorig_test = preProcessNormLearningData(A_test, En_test, Cl_test, YnormXind, 0)
-    
-    ''' Run Neural Network - TensorFlow'''
-    if dnntfDef.runDNNTF == True:
-        if dnntfDef.runSkflowDNNTF == False:
-            clf_dnntf, le_dnntf  = trainDNNTF(A, Cl, A_test, Cl_test, learnFileRoot)
-        else:
-            clf_dnntf, le_dnntf  = trainDNNTF2(A, Cl, A_test, Cl_test, learnFileRoot)
-            
-    if kerasDef.runKeras == True:
-        model_keras, le_keras = trainKeras(En, A, Cl, A_test, Cl_test, learnFileRoot)
+    timing = []
+
+    ''' sklearn models train in worker processes, concurrently with TensorFlow '''
+    sklearnModels = [m for m, run in [['NN', nnDef.runNN], ['SVM', svmDef.runSVM]] if run == True]
+    scheduler = None
+    try:
+        if sysDef.parallelTraining == True and len(sklearnModels) > 0:
+            scheduler = TrainingScheduler(A, Cl, A_test, Cl_test, learnFileRoot)
+            scheduler.submit(sklearnModels)
+            sklearnModels = []
+
+        ''' Run Neural Network - TensorFlow'''
+        if dnntfDef.runDNNTF == True:
+            start_time = time.perf_counter()
+            if dnntfDef.runSkflowDNNTF == False:
+                clf_dnntf, le_dnntf  = trainDNNTF(A, Cl, A_test, Cl_test, learnFileRoot)
+            else:
+                clf_dnntf, le_dnntf  = trainDNNTF2(A, Cl, A_test, Cl_test, learnFileRoot)
+            timing.append(['DNN-TF', 'main', time.perf_counter() - start_time])
+
+        if kerasDef.runKeras == True:
+            start_time = time.perf_counter()
+            model_keras, le_keras = trainKeras(En, A, Cl, A_test, Cl_test, learnFileRoot)
+            timing.append(['Keras', 'main', time.perf_counter() - start_time])
+
+        ''' Tensorflow '''
+        if tfDef.runTF == True:
+            start_time = time.perf_counter()
+            trainTF(A, Cl, A_test, Cl_test, learnFileRoot)
+            timing.append(['TF', 'main', time.perf_counter() - start_time])
+
+        ''' Run Neural Network - sklearn / Support Vector Machines '''
+        for model in sklearnModels:
+            timing.append(trainSklearnModel(model, A, Cl, A_test, Cl_test, learnFileRoot))
+        if scheduler is not None:
+            timing.extend(scheduler.join())
+    finally:
+        if scheduler is not None:
+            scheduler.close()
+
+    saveTimingSummary(learnFile, timing)
 
-    ''' Run Neural Network - sklearn'''
-    if nnDef.runNN == True:
-        clf_nn, le_nn = trainNN(A, Cl, A_test, Cl_test, learnFileRoot)
-    
-    ''' Run Support Vector Machines '''
-    if svmDef.runSVM == True:
-        clf_svm, le_svm = trainSVM(A, Cl, A_test, Cl_test, learnFileRoot)
-    
-    ''' Tensorflow '''
-    if tfDef.runTF == True:
-        trainTF(A, Cl, A_test, Cl_test, learnFileRoot)
-    
     ''' Plot Training Data - Normalized'''
     if plotDef.createTrainingDataPlot == True:
         plotTrainData(A, En, A_test, plotDef.plotAllSpectra, learnFileRoot+"_norm")
 
+#**********************************************
+''' Train a sklearn model, return [name, process, wall time] '''
+#**********************************************
+def trainSklearnModel(model, A, Cl, A_test, Cl_test, Root, process='main'):
+    start_time = time.perf_counter()
+    if model == 'NN':
+        trainNN(A, Cl, A_test, Cl_test, Root)
+    elif model == 'SVM':
+        trainSVM(A, Cl, A_test, Cl_test, Root)
+    return [model, process, time.perf_counter() - start_time]
+
+#**********************************************
+''' Concurrent training of the sklearn models '''
+''' The preprocessed arrays are placed once in shared memory and '''
+''' attached (not copied) by each worker process. Workers get '''
+''' numCores minus the cores left to TensorFlow in the main process. '''
+''' Requires the shared memory helpers of SpectraKeras (libSpectraKeras) '''
+#**********************************************
+class TrainingScheduler(object):
+    def __init__(self, A, Cl, A_test, Cl_test, Root):
+        from libSpectraKeras import shareArrays
+        self.Root = Root
+        self.executor = None
+        self.futures = []
+        self.shms, self.specs = shareArrays([A, Cl, A_test, Cl_test])
+
+    def submit(self, models):
+        import multiprocessing as mp
+        from concurrent.futures import ProcessPoolExecutor
+        runTF = dnntfDef.runDNNTF or kerasDef.runKeras or tfDef.runTF
+        # Keep at least one core per TensorFlow model family for the main process
+        coresTF = min(sysDef.numCores-1, int(dnntfDef.runDNNTF)+int(kerasDef.runKeras)+int(tfDef.runTF)) if runTF else 0
+        numWorkers = max(1, min(len(models), sysDef.numCores-coresTF))
+        numThreads = max(1, (sysDef.numCores-coresTF)//numWorkers)
+        print(' Training', ', '.join(models), 'in', numWorkers, 'worker process(es),', numThreads, 'thread(s) each\n')
+        # TensorFlow in the main process is not fork-safe: workers are started fresh
+        self.executor = ProcessPoolExecutor(max_workers=numWorkers, mp_context=mp.get_context('spawn'))
+        self.futures = [self.executor.submit(trainSklearnWorker, m, self.specs, self.Root, numThreads) for m in models]
+
+    def join(self):
+        return [f.result() for f in self.futures]
+
+    # Always called (also on errors): stops the workers and frees the shared memory
+    def close(self):
+        from libSpectraKeras import freeArrays
+        if self.executor is not None:
+            for f in self.futures:
+                f.cancel()
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        freeArrays(self.shms)
+        self.shms = []
+
+def trainSklearnWorker(model, specs, Root, numThreads):
+    from libSpectraKeras import attachArrays, freeArrays
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=numThreads)
+    except ImportError:
+        pass
+    shms, arrays = attachArrays(specs)
+    result = trainSklearnModel(model, *arrays, Root, 'worker')
+    del arrays
+    freeArrays(shms, False)
+    return result
+
+#**********************************************
+''' Per-model training time, printed and saved in the summary '''
+#**********************************************
+def saveTimingSummary(learnFile, timing):
+    summary_filename = 'summary_accuracy' + str(datetime.now().strftime('_%Y-%m-%d_%H-%M-%S.csv'))
+    with open(summary_filename, "a") as sum_file:
+        csv_out=csv.writer(sum_file)
+        csv_out.writerow(['Training File:', learnFile])
+        csv_out.writerow(['Model', 'Process', 'Wall time [s]'])
+        csv_out.writerows([[name, process, '{0:.2f}'.format(t)] for name, process, t in timing])
+
+    print('\n  ==========================================')
+    print('  \033[1mTraining time\033[0m')
+    print('  ==========================================')
+    print('  Model\t\t| Process\t| Wall time [s]')
+    print('  ------------------------------------------')
+    for name, process, t in timing:
+        print('  {0:s}\t\t| {1:s}\t\t| {2:.2f}'.format(name, process, t))
+    print('  ==========================================')
+    print(' Summary saved in:', summary_filename, '\n')
+
 #**********************************************
 ''' Process - Batch'''
+''' Each enabled model is trained (or loaded) once, '''
+''' then predicts all files in a single call '''
 #**********************************************
 def LearnPredictBatch(learnFile):
     summary_filename = 'summary' + str(datetime.now().strftime('_%Y-%m-%d_%H-%M-%S.csv'))
     makeHeaderSummary(summary_filename, learnFile)
-    ''' Open and process training data '''
-    En, Cl, A, YnormXind = readLearnFile(learnFile)
-    A, Cl, En, Aorig = preProcessNormLearningData(A, En, Cl, YnormXind, 0)
-    
+    learnFileRoot = os.path.splitext(learnFile)[0]
+    En, Cl, A, Aorig, YnormXind = getLearningData(learnFile)
+
+    ''' Open and preprocess prediction data '''
+    files = [f for f in glob.glob('*.txt') if f != learnFile]
     if sysDef.multiProc == True:
         import multiprocessing as mp
-        p = mp.Pool(sysDef.numCores)
-        for f in glob.glob('*.txt'):
-            if (f != learnFile):
-                p.apply_async(processSingleBatch, args=(f, En, Cl, A, Aorig, YnormXind, summary_filename, learnFile))
-        p.close()
-        p.join()
+        with mp.Pool(sysDef.numCores) as p:
+            data = p.map(readPredFile, files)
     else:
-        for f in glob.glob('*.txt'):
-            if (f != learnFile):
-                processSingleBatch(f, En, Cl, A, Aorig, YnormXind, summary_filename, learnFile)
-
-def processSingleBatch(f, En, Cl, A, Aorig, YnormXind, summary_filename, learnFile):
-    print(' Processing file: \033[1m' + f + '\033[0m\n')
-    R, Rx = readPredFile(f)
-    summaryFile = [f]
-    ''' Preprocess prediction data '''
-    R, Rorig = preProcessNormPredData(R, Rx, En, YnormXind, 0)
+        data = [readPredFile(f) for f in files]
+
+    fileNames = []
+    R = []
+    Rorig = []
+    for f, d in zip(files, data):
+        if d is None:
+            continue
+        r, rorig = preProcessNormPredData(d[0], d[1], En, YnormXind, int(len(fileNames)>0))
+        R.append(r[0])
+        Rorig.append(rorig[0])
+        fileNames.append(f)
+    if len(fileNames) == 0:
+        print('\033[1m' + ' No valid files for batch prediction \n' + '\033[0m')
+        return
+    R = np.array(R)
+    Rorig = np.array(Rorig)
+    print(' Processing', len(fileNames), 'files\n')
+
+    summaryFile = [[f] for f in fileNames]
+    timing = []
 
-    learnFileRoot = os.path.splitext(learnFile)[0]
-    
     ''' Run Neural Network - TensorFlow'''
     if dnntfDef.runDNNTF == True:
+        start_time = time.perf_counter()
         if dnntfDef.runSkflowDNNTF == False:
             clf_dnntf, le_dnntf  = trainDNNTF(A, Cl, A, Cl, learnFileRoot)
-            dnntfPred, dnntfProb = predDNNTF(clf_dnntf, le_dnntf, R, Cl)
+            dnntfPred, dnntfProb = predDNNTFBatch(clf_dnntf, le_dnntf, R)
         else:
             clf_dnntf, le_dnntf  = trainDNNTF2(A, Cl, A, Cl, learnFileRoot)
-            dnntfPred, dnntfProb = predDNNTF2(clf_dnntf, le_dnntf, R, Cl)
-        summaryFile.extend([dnntfPred, dnntfProb])
-        dnntfDef.alwaysRetrain = False
-        
+            dnntfPred, dnntfProb = predDNNTF2Batch(clf_dnntf, le_dnntf, R)
+        addBatchSummary(summaryFile, dnntfPred, dnntfProb)
+        timing.append(['DNN-TF', time.perf_counter() - start_time])
+
     ''' Run Keras'''
     if kerasDef.runKeras == True:
-        model, le_keras  = trainKeras(En, A, Cl, A, Cl, learnFileRoot)
-        kerasPred, kerasProb = predKeras(model_keras, le_keras, R, Cl)
-        summaryFile.extend([kerasPred, kerasProb])
-    
+        start_time = time.perf_counter()
+        model_keras, le_keras  = trainKeras(En, A, Cl, A, Cl, learnFileRoot)
+        kerasPred, kerasProb = predKerasBatch(model_keras, le_keras, R)
+        addBatchSummary(summaryFile, kerasPred, kerasProb)
+        timing.append(['Keras', time.perf_counter() - start_time])
+
     ''' Run Neural Network - sklearn'''
     if nnDef.runNN == True:
+        start_time = time.perf_counter()
         clf_nn, le_nn = trainNN(A, Cl, A, Cl, learnFileRoot)
-        nnPred, nnProb = predNN(clf_nn, A, Cl, R, le_nn)
-        summaryFile.extend([nnPred, nnProb])
-        nnDef.alwaysRetrain = False
+        nnPred, nnProb = predNNBatch(clf_nn, A, Cl, R, le_nn)
+        addBatchSummary(summaryFile, nnPred, nnProb)
+        timing.append(['NN', time.perf_counter() - start_time])
 
     ''' Run Support Vector Machines '''
     if svmDef.runSVM == True:
+        start_time = time.perf_counter()
         clf_svm, le_svm = trainSVM(A, Cl, A, Cl, learnFileRoot)
-        svmPred, svmProb = predSVM(clf_svm, A, Cl, En, R, le_svm)
-        summaryFile.extend([svmPred, svmProb])
-        svmDef.alwaysRetrain = False
+        svmPred, svmProb = predSVMBatch(clf_svm, R, le_svm)
+        addBatchSummary(summaryFile, svmPred, svmProb)
+        timing.append(['SVM', time.perf_counter() - start_time])
 
     ''' Tensorflow '''
     if tfDef.runTF == True:
-        trainTF(A, Cl, A, Cl, learnFileRoot)
-        tfPred, tfProb = predTF(A, Cl, R, learnFileRoot)
-        summaryFile.extend([tfPred, tfProb, tfAccur])
-        tfDef.tfalwaysRetrain = False
+        start_time = time.perf_counter()
+        tfAccur = trainTF(A, Cl, A, Cl, learnFileRoot)
+        tfPred, tfProb = predTFBatch(A, Cl, R, learnFileRoot)
+        addBatchSummary(summaryFile, tfPred, tfProb, [tfAccur]*len(fileNames))
+        timing.append(['TF', time.perf_counter() - start_time])
 
     ''' Run K-Means '''
     if kmDef.runKM == True:
-        kmDef.plotKM = False
-        kmPred = runKMmain(A, Cl, En, R, Aorig, Rorig)
-        summaryFile.extend([kmPred])
+        start_time = time.perf_counter()
+        kmPred = runKMbatch(A, Cl, R, learnFileRoot)
+        addBatchSummary(summaryFile, kmPred)
+        timing.append(['K-Means', time.perf_counter() - start_time])
 
     with open(summary_filename, "a") as sum_file:
         csv_out=csv.writer(sum_file)
-        csv_out.writerow(summaryFile)
-        sum_file.close()
+        csv_out.writerows(summaryFile)
+
+    print('\n  ==================================')
+    print('  \033[1mBatch prediction\033[0m -', len(fileNames), 'files')
+    print('  ==================================')
+    print('  Model\t\t| Wall time [s]')
+    print('  ----------------------------------')
+    for name, t in timing:
+        print('  {0:s}\t\t| {1:.2f}'.format(name, t))
+    print('  ==================================')
+    print(' Summary saved in:', summary_filename, '\n')
+
+# Append one or more columns to the per-file summary rows
+def addBatchSummary(summaryFile, *columns):
+    for i in range(len(summaryFile)):
+        summaryFile[i].extend([c[i] for c in columns])
 
 #**********************************************
 ''' Learn and Predict - Maps'''
+''' Models are trained once, the whole map is preprocessed '''
+''' as a matrix and predicted in tiles of sysDef.mapTileSize '''
 #**********************************************
 def LearnPredictMap(learnFile, mapFile):
-    ''' Open and process training data '''
-    En, Cl, A, YnormXind = readLearnFile(learnFile)
-
     learnFileRoot = os.path.splitext(learnFile)[0]
+    En, Cl, A, Aorig, YnormXind = getLearningData(learnFile)
 
     ''' Open prediction map '''
     X, Y, R, Rx = readPredMap(mapFile)
-    type = 0
-    i = 0;
-    svmPred = nnPred = tfPred = kmPred = np.empty([X.shape[0]])
-    A, Cl, En, Aorig = preProcessNormLearningData(A, En, Cl, YnormXind, type)
     print(' Processing map...' )
-    
-    if nnDef.runNN == True:
-        clf_nn, le_nn = trainNN(A, Cl, A, Cl, learnFileRoot)
+    R, Rorig = preProcessNormPredMatrix(R, Rx, En, YnormXind, 0)
+    timing = []
 
+    ''' Run Neural Network - TensorFlow'''
     if dnntfDef.runDNNTF == True:
+        start_time = time.perf_counter()
         if dnntfDef.runSkflowDNNTF == False:
             clf_dnntf, le_dnntf  = trainDNNTF(A, Cl, A, Cl, learnFileRoot)
+            dnntfPred, temp = predDNNTFBatch(clf_dnntf, le_dnntf, R)
         else:
             clf_dnntf, le_dnntf  = trainDNNTF2(A, Cl, A, Cl, learnFileRoot)
+            dnntfPred, temp = predDNNTF2Batch(clf_dnntf, le_dnntf, R)
+        saveMapBatch(mapFile, 'DNN-TF', 'HC', dnntfPred, X, Y, True)
+        timing.append(['DNN-TF', time.perf_counter() - start_time])
 
+    ''' Run Keras'''
     if kerasDef.runKeras == True:
+        start_time = time.perf_counter()
         model_keras, le_keras  = trainKeras(En, A, Cl, A, Cl, learnFileRoot)
+        kerasPred, temp = predKerasBatch(model_keras, le_keras, R)
+        saveMapBatch(mapFile, 'Keras', 'HC', kerasPred, X, Y, True)
+        timing.append(['Keras', time.perf_counter() - start_time])
 
+    ''' Run Neural Network - sklearn'''
+    if nnDef.runNN == True:
+        start_time = time.perf_counter()
+        clf_nn, le_nn = trainNN(A, Cl, A, Cl, learnFileRoot)
+        nnPred = predictMapTiles(lambda r: predNNBatch(clf_nn, A, Cl, r, le_nn)[0], R)
+        saveMapBatch(mapFile, 'NN', 'HC', nnPred, X, Y, True)
+        timing.append(['NN', time.perf_counter() - start_time])
+
+    ''' Run Support Vector Machines '''
     if svmDef.runSVM == True:
+        start_time = time.perf_counter()
         clf_svm, le_svm = trainSVM(A, Cl, A, Cl, learnFileRoot)
+        svmPred = predictMapTiles(lambda r: predSVMBatch(clf_svm, r, le_svm)[0], R)
+        saveMapBatch(mapFile, 'svm', 'HC', svmPred, X, Y, True)
+        timing.append(['SVM', time.perf_counter() - start_time])
 
-    for r in R[:]:
-        r, rorig = preProcessNormPredData(r, Rx, En, YnormXind, type)
-        type = 1
-        
-        ''' Run Neural Network - TensorFlow'''
-        if dnntfDef.runDNNTF == True:
-            if dnntfDef.runSkflowDNNTF == False:
-                dnntfPred[i], temp = predDNNTF(cl_dnntf, le_dnntf, r, Cl)
-            else:
-                dnntfPred[i], temp = predDNNTF2(cl_dnntf, le_dnntf, r, Cl)
-            
-            saveMap(mapFile, 'DNN-TF', 'HC', dnntfPred[i], X[i], Y[i], True)
-            dnnDef.alwaysRetrain = False
-            
-        if dnntfDef.runKeras == True:
-            kerasPred[i], temp = predKeras(model_keras, le_keras, r, Cl)
-            saveMap(mapFile, 'Keras', 'HC', kerasPred[i], X[i], Y[i], True)
-
-        ''' Run Neural Network - sklearn'''
-        if nnDef.runNN == True:
-            nnPred[i], temp = predNN(clf_nn, A, Cl, r, le_nn)
-            saveMap(mapFile, 'NN', 'HC', nnPred[i], X[i], Y[i], True)
-            nnDef.alwaysRetrain = False
-        
-        ''' Run Support Vector Machines '''
-        if svmDef.runSVM == True:
-            svmPred[i], temp = predSVM(clf_svm, A, Cl, En, r, le_svm)
-            saveMap(mapFile, 'svm', 'HC', svmPred[i], X[i], Y[i], True)
-            svmDef.alwaysRetrain = False
+    ''' Tensorflow '''
+    if tfDef.runTF == True:
+        start_time = time.perf_counter()
+        trainTF(A, Cl, A, Cl, learnFileRoot)
+        tfPred, temp = predTFBatch(A, Cl, R, learnFileRoot)
+        saveMapBatch(mapFile, 'TF', 'HC', tfPred, X, Y, True)
+        timing.append(['TF', time.perf_counter() - start_time])
 
-        ''' Tensorflow '''
-        if tfDef.runTF == True:
-            trainTF(A, Cl, A, Cl, learnFileRoot)
-            tfPred, temp = predTF(A, Cl, r, learnFileRoot)
-            saveMap(mapFile, 'TF', 'HC', tfPred[i], X[i], Y[i], True)
-            tfDef.alwaysRetrain = False
-
-        ''' Run K-Means '''
-        if kmDef.runKM == True:
-            kmDef.plotKM = False
-            kmPred[i] = runKMmain(A, Cl, En, r, Aorig, rorig)
-            saveMap(mapFile, 'KM', 'HC', kmPred[i], X[i], Y[i], True)
-        i+=1
+    ''' Run K-Means '''
+    if kmDef.runKM == True:
+        start_time = time.perf_counter()
+        kmPred = runKMbatch(A, Cl, R, learnFileRoot)
+        saveMapBatch(mapFile, 'KM', 'HC', kmPred, X, Y, True)
+        timing.append(['K-Means', time.perf_counter() - start_time])
+
+    print('\n  ==================================')
+    print('  \033[1mMap prediction\033[0m -', R.shape[0], 'spectra')
+    print('  ==================================')
+    print('  Model\t\t| Wall time [s]')
+    print('  ----------------------------------')
+    for name, t in timing:
+        print('  {0:s}\t\t| {1:.2f}'.format(name, t))
+    print('  ==================================\n')
 
     if dnntfDef.plotMap == True and dnntfDef.runDNNTF == True:
         plotMaps(X, Y, dnntfPred, 'Deep Neural networks - tensorFlow')
@@ -316,3 +466,14 @@ def LearnPredictMap(learnFile, mapFile):
     if kmDef.plotMap == True and kmDef.runKM == True:
         plotMaps(X, Y, kmPred, 'K-Means Prediction')
 
+# Predict the rows of R in tiles of sysDef.mapTileSize, in parallel when multiProc
+# is set (sklearn releases the GIL in its numerical kernels). Order is preserved.
+def predictMapTiles(predFn, R):
+    tiles = [R[i:i+sysDef.mapTileSize] for i in range(0, R.shape[0], sysDef.mapTileSize)]
+    if sysDef.multiProc == True and len(tiles) > 1:
+        from multiprocessing.pool import ThreadPool
+        with ThreadPool(sysDef.numCores) as p:
+            pred = p.map(predFn, tiles)
+    else:
+        pred = [predFn(t) for t in tiles]
+    return np.concatenate(pred)
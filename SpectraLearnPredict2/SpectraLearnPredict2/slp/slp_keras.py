@@ -13,12 +13,8 @@
 ***********************************************************
 '''
 
-import matplotlib
-if matplotlib.get_backend() == 'TkAgg':
-    matplotlib.use('Agg')
-
 import numpy as np
-import sys, os.path, getopt, glob, csv, pydot, graphviz
+import sys, os.path, getopt, glob, csv
 import random, time, configparser, os, pickle
 from os.path import exists, splitext
 from os import rename
@@ -40,6 +36,8 @@ def input_fn(A, Cl2):
 ''' https://keras.io/getting-started/sequential-model-guide/#examples'''
 #********************************************************************************
 def trainKeras(En, A, Cl, A_test, Cl_test, Root):
+    kerasDef.setup()
+    import tensorflow as tf
     if Configuration().useTF2:
         print(" Using tf.keras API")
         import tensorflow.keras as keras  #tf.keras
@@ -89,6 +87,7 @@ def trainKeras(En, A, Cl, A_test, Cl_test, Root):
     else:
         model_name = model_directory+"/keras_"+str(len(kerasDef.hidden_layers))+"HL_"+str(kerasDef.hidden_layers[0])+".hd5"
     model_le = model_directory+"/keras_model_le.pkl"
+    loadOnly = isLoadOnly(A, model_name)
     
     if kerasDef.alwaysRetrain == False:
         print(" Training model saved in: ", model_name, "\n")
@@ -124,7 +123,7 @@ def trainKeras(En, A, Cl, A_test, Cl_test, Root):
         with open(model_le, 'ab') as f:
             f.write(pickle.dumps(le))
     
-    if kerasDef.fullBatch == True:
+    if kerasDef.fullBatch == True and loadOnly == False:
         batch_size = A.shape[0]
     else:
         batch_size = kerasDef.batchSize
@@ -182,7 +181,7 @@ def trainKeras(En, A, Cl, A_test, Cl_test, Root):
             from keras.utils import plot_model
             keras.utils.plot_model(model, to_file=model_directory+'/keras_MLP_model.png', show_shapes=True)
             
-            import matplotlib.pyplot as plt
+            plt = importPyplot()
             plt.figure(tight_layout=True)
             plotInd = int(len(kerasDef.hidden_layers))*100+11
             visibleX = True
@@ -221,8 +220,9 @@ def trainKeras(En, A, Cl, A_test, Cl_test, Root):
         printModelKeras(model)
         printParamKeras(A)
     
-    score = model.evaluate(A_test, Cl2_test, batch_size=batch_size)
-    printEvalSummary(model_name, score)
+    if loadOnly == False:
+        score = model.evaluate(A_test, Cl2_test, batch_size=batch_size)
+        printEvalSummary(model_name, score)
     return model, le
 
 #***********************************************
@@ -331,5 +331,20 @@ def predKeras(model, le, R, Cl):
 
     return predValue, predProb
 
+#********************************************************************************
+''' Batch prediction using Keras model '''
+''' Predicted values and probabilities for each row of R '''
+#********************************************************************************
+def predKerasBatch(model, le, R):
+    if kerasDef.regressor:
+        predValue = model.predict(R).flatten()
+        predProb = np.zeros(predValue.shape[0])
+    else:
+        predictions = model.predict(R)
+        pred_class = np.argmax(predictions, axis=1)
+        predValue = le.inverse_transform(pred_class)
+        predProb = np.round(100*predictions[np.arange(pred_class.shape[0]),pred_class],2)
+    return predValue, predProb
+
 
 
@@ -12,10 +12,6 @@
 *
 ***********************************************************
 '''
-import matplotlib
-if matplotlib.get_backend() == 'TkAgg':
-    matplotlib.use('Agg')
-
 import numpy as np
 import sys, os.path, getopt, glob, csv
 import random, time, configparser, os
@@ -24,44 +20,86 @@ from os import rename
 from datetime import datetime, date
 
 from .slp_config import *
+from .slp_preprocess import *
 
 
 #********************
 ''' Run K-Means '''
 #********************
-def runKMmain(A, Cl, En, R, Aorig, Rorig):
-    from sklearn.cluster import KMeans
+def runKMmain(A, Cl, En, R, Aorig, Rorig, Root):
     print('==========================================================================\n')
     print(' Running K-Means...')
     print(' Number of unique identifiers in training data: ' + str(np.unique(Cl).shape[0]))
-    if kmDef.customNumKMComp == False:
-        numKMcomp = np.unique(Cl).shape[0]
-    else:
-        numKMcomp = kmDef.numKMcomponents
-    kmeans = KMeans(n_clusters=numKMcomp, random_state=0).fit(A)
+    kmeans = trainKM(A, getNumKMcomp(Cl), Root)
     prediction = kmeans.predict(R)[0]
 
     print('\n  ==============================')
     print('  \033[1mK-Means\033[0m - Prediction')
     print('  ==============================')
     print('  Class\t| Value')
-    for j in range(0,kmeans.labels_.shape[0]):
-        if kmeans.labels_[j] == prediction:
-            print("  {0:d}\t| {1:.2f}".format(prediction,Cl[j]))
+    for j in np.where(kmeans.labels_ == prediction)[0]:
+        print("  {0:d}\t| {1:.2f}".format(prediction,Cl[j]))
     print('  ==============================\n')
 
     if kmDef.plotKM == True:
-        import matplotlib.pyplot as plt
-        for j in range(0,kmeans.labels_.shape[0]):
-            if kmeans.labels_[j] == kmeans.predict(R)[0]:
-                plt.plot(En, Aorig[j,:])
+        plt = importPyplot()
+        for j in np.where(kmeans.labels_ == prediction)[0]:
+            plt.plot(En, Aorig[j,:])
         plt.plot(En, Rorig[0,:], linewidth = 2, label='Predict')
         plt.title('K-Means')
         plt.xlabel('Raman shift [1/cm]')
         plt.ylabel('Intensity')
         plt.legend()
         plt.show()
-    return kmeans.predict(R)[0]
+    return prediction
+
+#**********************************************
+''' K-Means - Batch prediction for each row of R '''
+#**********************************************
+def runKMbatch(A, Cl, R, Root):
+    kmeans = trainKM(A, getNumKMcomp(Cl), Root)
+    return kmeans.predict(R)
+
+def getNumKMcomp(Cl):
+    if kmDef.customNumKMComp == False:
+        return np.unique(Cl).shape[0]
+    else:
+        return kmDef.numKMcomponents
+
+#**********************************************
+''' Train K-Means '''
+''' The fitted model is saved in <Root>.kmModel-<n>.pkl (or .kmMiniBatchModel) '''
+''' and reused unless alwaysRetrainKM is set. With miniBatchKM, MiniBatchKMeans '''
+''' is fitted on mini-batches of batchSizeKM spectra '''
+#**********************************************
+def trainKM(A, numKMcomp, Root):
+    from sklearn.externals import joblib
+    if kmDef.miniBatch == True:
+        kmTrainedData = Root + '.kmMiniBatchModel-' + str(numKMcomp) + '.pkl'
+    else:
+        kmTrainedData = Root + '.kmModel-' + str(numKMcomp) + '.pkl'
+    isLoadOnly(A, kmTrainedData)
+    try:
+        if kmDef.alwaysRetrain == False:
+            with open(kmTrainedData):
+                print('  Opening K-Means model...\n')
+                kmeans = joblib.load(kmTrainedData)
+        else:
+            raise ValueError('  Force retraining K-Means model')
+    except:
+        if kmDef.miniBatch == True:
+            from sklearn.cluster import MiniBatchKMeans
+            print('  Training MiniBatchKMeans in batches of', kmDef.batchSize, 'spectra')
+            kmeans = MiniBatchKMeans(n_clusters=numKMcomp, batch_size=kmDef.batchSize, random_state=0, n_init=3).fit(A)
+        else:
+            from sklearn.cluster import KMeans
+            kmeans = KMeans(n_clusters=numKMcomp, random_state=0).fit(A)
+        joblib.dump(kmeans, kmTrainedData)
+    return kmeans
+
+# Predict in chunks of batchSizeKM spectra, to bound memory on large maps
+def predictKM(kmeans, R):
+    return np.concatenate([kmeans.predict(R[i:i+kmDef.batchSize]) for i in range(0, R.shape[0], kmDef.batchSize)])
 
 #**********************************************
 ''' K-Means - Maps'''
@@ -70,23 +108,25 @@ def KmMap(mapFile, numKMcomp):
     ''' Open prediction map '''
     X, Y, R, Rx = readPredMap(mapFile)
     type = 0
-    i = 0;
     R, Rx, Rorig = preProcessNormMap(R, Rx, type)
 
-    from sklearn.cluster import KMeans
     print(' Running K-Means...')
     print(' Number of classes: ' + str(numKMcomp))
-    kmeans = KMeans(n_clusters=kmDef.numKMcomponents, random_state=0).fit(R)
-    kmPred = np.empty([R.shape[0]])
+    kmeans = trainKM(R, numKMcomp, os.path.splitext(mapFile)[0])
+    kmPred = predictKM(kmeans, R)
+    saveMapBatch(mapFile, 'KM', 'Class', kmPred, X, Y, True)
 
-    for i in range(0, R.shape[0]):
-        kmPred[i] = kmeans.predict(R[i,:].reshape(1,-1))[0]
-        saveMap(mapFile, 'KM', 'Class', int(kmPred[i]), X[i], Y[i], True)
-        if kmPred[i] in kmeans.labels_:
-            if os.path.isfile(saveMapName(mapFile, 'KM', 'Class_'+ str(int(kmPred[i]))+'-'+str(np.unique(kmeans.labels_).shape[0]), False)) == False:
-                saveMap(mapFile, 'KM', 'Class_'+ str(int(kmPred[i])) + '-'+str(np.unique(kmeans.labels_).shape[0]) , '\t'.join(map(str, Rx)), ' ', ' ', False)
-            saveMap(mapFile, 'KM', 'Class_'+ str(int(kmPred[i])) + '-'+str(np.unique(kmeans.labels_).shape[0]) , '\t'.join(map(str, R[1,:])), X[i], Y[i], False)
+    ''' Spectra of each class, one file per class '''
+    numClasses = np.unique(kmeans.labels_).shape[0]
+    for k in np.unique(kmPred):
+        classFile = saveMapName(mapFile, 'KM', 'Class_'+ str(k) + '-' + str(numClasses), False)
+        ind = np.where(kmPred == k)[0]
+        lines = []
+        if os.path.isfile(classFile) == False:
+            lines.append(' \t \t' + '\t'.join(map(str, Rx)) + '\n')
+        lines.extend(['{:}\t{:}\t'.format(X[i], Y[i]) + '\t'.join(map(str, R[i].tolist())) + '\n' for i in ind])
+        with open(classFile, "a") as coord_file:
+            coord_file.write(''.join(lines))
 
     if kmDef.plotKM == True:
         plotMaps(X, Y, kmPred, 'K-Means')
-
@@ -12,17 +12,12 @@
 *
 ***********************************************************
 '''
-import matplotlib
-if matplotlib.get_backend() == 'TkAgg':
-    matplotlib.use('Agg')
-
 import numpy as np
 import sys, os.path, getopt, glob, csv
 import random, time, configparser, os
 from os.path import exists, splitext
 from os import rename
 from datetime import datetime, date
-from sklearn import preprocessing
 
 from .slp_config import *
 
@@ -35,6 +30,7 @@ from .slp_config import *
 def trainNN(A, Cl, A_test, Cl_test, Root):
     from sklearn.neural_network import MLPClassifier, MLPRegressor
     from sklearn.externals import joblib
+    from sklearn import preprocessing
     
     if nnDef.MLPRegressor is False:
         Root+"/DNN-TF_"
@@ -44,6 +40,7 @@ def trainNN(A, Cl, A_test, Cl_test, Root):
 
     model_le = Root + '.nnLabelEnc.pkl'
     le = preprocessing.LabelEncoder()
+    isLoadOnly(A, nnTrainedData)
 
     print('==========================================================================\n')
     print('\033[1m Running Neural Network: multi-layer perceptron (MLP)\033[0m')
@@ -122,7 +119,11 @@ def predNN(clf, A, Cl, R, le):
     else:
         Cl = np.array(Cl,dtype=float)
         predValue = clf.predict(R)[0]
-        predProb = clf.score(A,Cl)
+        # R^2 on the learning data (not available in prediction-only runs)
+        if A.shape[0] > 0:
+            predProb = clf.score(A,Cl)
+        else:
+            predProb = 0
         print('\033[1m' + '\n Predicted regressor value (Deep Neural Networks - sklearn) = ' + str('{:.3f}'.format(predValue)) +
               '  (R^2 = ' + str('{:.5f}'.format(predProb)) + ')\033[0m\n')
     
@@ -142,3 +143,19 @@ def predNN(clf, A, Cl, R, le):
 
     return predValue, predProb
 
+#********************************************************************************
+''' Batch prediction - Neural Network - sklearn '''
+''' Predicted values and probabilities (R^2 for regressor) for each row of R '''
+#********************************************************************************
+def predNNBatch(clf, A, Cl, R, le):
+    if nnDef.MLPRegressor is False:
+        predValue = le.inverse_transform(clf.predict(R))
+        predProb = np.round(100*np.amax(clf.predict_proba(R), axis=1),4)
+    else:
+        predValue = clf.predict(R)
+        if A.shape[0] > 0:
+            predProb = np.full(R.shape[0], clf.score(A, np.array(Cl,dtype=float)))
+        else:
+            predProb = np.zeros(R.shape[0])
+    return predValue, predProb
+
@@ -12,10 +12,6 @@
 *
 ***********************************************************
 '''
-import matplotlib
-if matplotlib.get_backend() == 'TkAgg':
-    matplotlib.use('Agg')
-
 import numpy as np
 import sys, os.path, getopt, glob, csv
 import random, time, configparser, os
@@ -24,6 +20,7 @@ from os import rename
 from datetime import datetime, date
 
 from .slp_config import *
+from .slp_preprocess import *
 
 
 #********************************************************************************
@@ -36,30 +33,97 @@ from .slp_config import *
     pca.explained_variance_ratio
     '''
 #********************************************************************************
-def runPCA(En, Cl, A, YnormXind, numPCAcomponents):
-    from sklearn.decomposition import PCA
-    import matplotlib.pyplot as plt
-    from matplotlib import cm
-
-    #''' Open and process training data '''
-    #En, Cl, A, YnormXind = readLearnFile(learnFile)
-
+def runPCA(En, Cl, A, YnormXind, numPCAcomponents, Root):
     print('==========================================================================\n')
     print(' Running PCA...\n')
+    numPCAcomp = getNumPCAcomp(Cl, numPCAcomponents)
+    pca = getPCA(numPCAcomp)
+    if pcaDef.solver == 'incremental':
+        for i in range(0, A.shape[0], pcaDef.batchSize):
+            pca.partial_fit(A[i:i+pcaDef.batchSize])
+    else:
+        pca.fit(A)
+    A_r = pca.transform(A)
+    savePCA(pca, Root, numPCAcomp)
+    showPCA(pca, En, Cl, A_r)
+
+#********************************************************************************
+''' Run PCA on a learning file '''
+''' With solverPCA = incremental, .h5 learning files are streamed '''
+''' in chunks of batchSizePCA spectra and never fully loaded in memory '''
+#********************************************************************************
+def runPCAfile(learnFile, numPCAcomponents):
+    Root = os.path.splitext(learnFile)[0]
+    if pcaDef.solver != 'incremental' or os.path.splitext(learnFile)[1] != ".h5" or \
+            (preprocDef.cherryPickEnPoint == True and preprocDef.enRestrictRegion == False):
+        En, Cl, A, YnormXind = readLearnFile(learnFile)
+        runPCA(En, Cl, A, YnormXind, numPCAcomponents, Root)
+        return
+
+    import h5py
+    with h5py.File(learnFile, 'r') as hf:
+        M = hf["M"]
+        En = M[0,1:]
+        Cl = M[1:,0]
+        numSpectra = M.shape[0]-1
+        print(' Streaming', numSpectra, 'spectra from:', learnFile)
+        print('==========================================================================\n')
+        print(' Running PCA...\n')
+        numPCAcomp = getNumPCAcomp(Cl, numPCAcomponents)
+        pca = getPCA(numPCAcomp)
+        # Row 0 holds the x-axis
+        chunks = [(i, min(i+pcaDef.batchSize, numSpectra+1)) for i in range(1, numSpectra+1, pcaDef.batchSize)]
+        for i, j in chunks:
+            pca.partial_fit(M[i:j,1:])
+        A_r = np.vstack([pca.transform(M[i:j,1:]) for i, j in chunks])
+    savePCA(pca, Root, numPCAcomp)
+    showPCA(pca, En, Cl, A_r)
+
+def getNumPCAcomp(Cl, numPCAcomponents):
     print(' Number of unique identifiers in training data: ' + str(np.unique(Cl).shape[0]))
     if pcaDef.customNumPCAComp == False:
         numPCAcomp = np.unique(Cl).shape[0]
     else:
         numPCAcomp = numPCAcomponents
     print(' Number of Principal components: ' + str(numPCAcomp) + '\n')
-    pca = PCA(n_components=numPCAcomp)
-    A_r = pca.fit(A).transform(A)
+    return numPCAcomp
+
+def getPCA(numPCAcomp):
+    if pcaDef.solver == 'incremental':
+        from sklearn.decomposition import IncrementalPCA
+        print(' Using IncrementalPCA in batches of', pcaDef.batchSize, 'spectra\n')
+        return IncrementalPCA(n_components=numPCAcomp, batch_size=pcaDef.batchSize)
+    from sklearn.decomposition import PCA
+    if pcaDef.solver == 'randomized':
+        print(' Using randomized SVD\n')
+        return PCA(n_components=numPCAcomp, svd_solver='randomized', random_state=0)
+    return PCA(n_components=numPCAcomp)
 
+#********************************************************************************
+''' Save/load the fitted PCA model (<Root>.pcaModel-<n>.pkl) '''
+''' for later projection of new spectra with pca.transform() '''
+#********************************************************************************
+def savePCA(pca, Root, numPCAcomp):
+    from sklearn.externals import joblib
+    pcaModel = Root + '.pcaModel-' + str(numPCAcomp) + '.pkl'
+    joblib.dump(pca, pcaModel)
+    print(' PCA model saved in:', pcaModel, '\n')
+
+def loadPCA(Root, numPCAcomp):
+    from sklearn.externals import joblib
+    return joblib.load(Root + '.pcaModel-' + str(numPCAcomp) + '.pkl')
+
+#********************************************************************************
+''' Print and plot scores and loadings '''
+#********************************************************************************
+def showPCA(pca, En, Cl, A_r):
     for i in range(0,pca.components_.shape[0]):
         print(' Score PC ' + str(i) + ': ' + '{0:.0f}%'.format(pca.explained_variance_ratio_[i] * 100))
     print('')
 
     if plotDef.showPCAPlots == True:
+        plt = importPyplot()
+        from matplotlib import cm
         print(' Plotting Loadings and score plots... \n')
 
         #***************************
@@ -77,20 +141,11 @@ def runPCA(En, Cl, A, YnormXind, numPCAcomponents):
         #***************************
         ''' Plotting Scores '''
         #***************************
-        Cl_ind = np.zeros(len(Cl))
-        Cl_labels = np.zeros(0)
-        ind = np.zeros(np.unique(Cl).shape[0])
-
-        for i in range(len(Cl)):
-            if (np.in1d(Cl[i], Cl_labels, invert=True)):
-                Cl_labels = np.append(Cl_labels, Cl[i])
-
-        for i in range(len(Cl)):
-            Cl_ind[i] = np.where(Cl_labels == Cl[i])[0][0]
+        Cl_labels, Cl_ind = labelIndex(Cl)
+        colors = [ cm.jet(x) for x in np.linspace(0, 1, Cl_labels.shape[0]) ]
+        numComp = pca.components_.shape[0]
 
-            colors = [ cm.jet(x) for x in np.linspace(0, 1, ind.shape[0]) ]
-
-        for color, i, target_name in zip(colors, range(ind.shape[0]), Cl_labels):
+        for color, i, target_name in zip(colors, range(Cl_labels.shape[0]), Cl_labels):
             plt.scatter(A_r[Cl_ind==i,0], A_r[Cl_ind==i,1], color=color, alpha=.8, lw=2, label=target_name)
 
         plt.title('Score plot')
@@ -101,21 +156,27 @@ def runPCA(En, Cl, A, YnormXind, numPCAcomponents):
         plt.title('Score box plot')
         plt.xlabel('Principal Component')
         plt.ylabel('Score')
-        for j in range(pca.components_.shape[0]):
-            for color, i, target_name in zip(colors, range(ind.shape[0]), Cl_labels):
-                plt.scatter([j+1]*len(A_r[Cl_ind==i,j]), A_r[Cl_ind==i,j], color=color, alpha=.8, lw=2, label=target_name)
+        for color, i, target_name in zip(colors, range(Cl_labels.shape[0]), Cl_labels):
+            scores = A_r[Cl_ind==i]
+            plt.scatter(np.tile(np.arange(1, numComp+1), scores.shape[0]), scores.ravel(), color=color, alpha=.8, lw=2, label=target_name)
         plt.boxplot(A_r)
         plt.figure()
 
         #******************************
         ''' Plotting Scores vs H:C '''
         #******************************
-        for j in range(pca.components_.shape[0]):
-            for color, i, target_name in zip(colors, range(ind.shape[0]), Cl_labels):
+        for j in range(numComp):
+            for color, i, target_name in zip(colors, range(Cl_labels.shape[0]), Cl_labels):
                 plt.scatter(np.asarray(Cl)[Cl_ind==i], A_r[Cl_ind==i,j], color=color, alpha=.8, lw=2, label=target_name)
             plt.xlabel('H:C elemental ratio')
             plt.ylabel('PC ' + str(j) + ' ({0:.0f}%)'.format(pca.explained_variance_ratio_[j] * 100))
             plt.figure()
         plt.show()
 
-
+# Unique labels in order of first appearance, and the index of each sample's label
+def labelIndex(Cl):
+    labels, first, inverse = np.unique(Cl, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.shape[0])
+    return labels[order], rank[inverse.ravel()]
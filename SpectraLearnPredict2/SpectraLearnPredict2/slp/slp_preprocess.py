@@ -13,13 +13,9 @@
 ***********************************************************
 '''
 
-import matplotlib
-if matplotlib.get_backend() == 'TkAgg':
-    matplotlib.use('Agg')
-
 import numpy as np
-import sys, os.path, getopt, glob, csv
-import random, time, configparser, os, h5py
+import sys, os.path, getopt, glob, csv, pickle
+import random, time, configparser, os, threading
 from os.path import exists, splitext
 from os import rename
 from datetime import datetime, date
@@ -34,6 +30,7 @@ def readLearnFile(learnFile):
         if os.path.splitext(learnFile)[1] == ".npy":
             M = np.load(learnFile)
         elif os.path.splitext(learnFile)[1] == ".h5":
+            import h5py
             with h5py.File(learnFile, 'r') as hf:
                 M = hf["M"][:]
         else:
@@ -56,19 +53,7 @@ def readLearnFile(learnFile):
     Cl = M[1:,0]
 
     if preprocDef.cherryPickEnPoint == True and preprocDef.enRestrictRegion == False:
-        Atemp = A[:,range(len(preprocDef.enSel))]
-        enPoints = list(preprocDef.enSel)
-        enRange = list(preprocDef.enSel)
-
-        for i in range(0, len(preprocDef.enSel)):
-            enRange[i] = np.where((En<float(preprocDef.enSel[i]+preprocDef.enSelDelta[i])) & (En>float(preprocDef.enSel[i]-preprocDef.enSelDelta[i])))[0].tolist()
-
-            for j in range(0, A.shape[0]):
-                Atemp[j,i] = A[j,A[j,enRange[i]].tolist().index(max(A[j, enRange[i]].tolist()))+enRange[i][0]]
-
-            enPoints[i] = int(np.average(enRange[i]))
-        A = Atemp
-        En = En[enPoints]
+        A, En = cherryPickPoints(A, En)
 
         if type == 0:
             print( ' Cheery picking points in the spectra\n')
@@ -105,19 +90,26 @@ def readPredFile(sampleFile):
     Rx=Rtot[0,:]
 
     if preprocDef.cherryPickEnPoint == True and preprocDef.enRestrictRegion == False:
-        Rtemp = R[range(len(preprocDef.enSel))]
-        enPoints = list(preprocDef.enSel)
-        enRange = list(preprocDef.enSel)
-        for i in range(0, len(preprocDef.enSel)):
-            enRange[i] = np.where((Rx<float(preprocDef.enSel[i]+preprocDef.enSelDelta[i])) & (Rx>float(preprocDef.enSel[i]-preprocDef.enSelDelta[i])))[0].tolist()
-            Rtemp[i] = R[R[enRange[i]].tolist().index(max(R[enRange[i]].tolist()))+enRange[i][0]]
-
-            enPoints[i] = int(np.average(enRange[i]))
-        R = Rtemp
-        Rx = Rx[enPoints]
+        R, Rx = cherryPickPoints(R[np.newaxis,:], Rx)
+        R = R[0]
 
     return R, Rx
 
+#**********************************************************************************
+''' Cherry pick spectral points '''
+''' For each point in enSel, take the max of every spectrum within enSel +/- enSelDelta '''
+''' The x-axis is set at the center of each window '''
+#**********************************************************************************
+def cherryPickPoints(A, En):
+    Atemp = np.empty((A.shape[0], len(preprocDef.enSel)), dtype=A.dtype)
+    enPoints = list(preprocDef.enSel)
+    rows = np.arange(A.shape[0])
+    for i in range(0, len(preprocDef.enSel)):
+        enRange = np.where((En<float(preprocDef.enSel[i]+preprocDef.enSelDelta[i])) & (En>float(preprocDef.enSel[i]-preprocDef.enSelDelta[i])))[0]
+        Atemp[:,i] = A[rows, np.argmax(A[:,enRange], axis=1)+enRange[0]]
+        enPoints[i] = int(np.average(enRange))
+    return Atemp, En[enPoints]
+
 #**********************************************************************************
 ''' Preprocess Learning data '''
 #**********************************************************************************
@@ -140,10 +132,7 @@ def preProcessNormLearningData(A, En, Cl, YnormXind, type):
                 print('  Normalizing spectral intensity to: ' + str(preprocDef.YnormTo) + '; En = [' + str(preprocDef.YnormX-preprocDef.YnormXdelta) + ', ' + str(preprocDef.YnormX+preprocDef.YnormXdelta) + ']')
             else:
                 print('  Normalizing spectral intensity to: ' + str(preprocDef.YnormTo) + '; to max intensity in spectra')
-        for i in range(0,A.shape[0]):
-            if(np.amin(A[i]) <= 0):
-                A[i,:] = A[i,:] - np.amin(A[i,:]) + 1e-8
-            A[i,:] = np.multiply(A[i,:], preprocDef.YnormTo/A[i,A[i][YnormXind].tolist().index(max(A[i][YnormXind].tolist()))+YnormXind[0]])
+        normYSpectra(A, YnormXind)
 
     if preprocDef.StandardScalerFlag == True:
         print('  Using StandardScaler from sklearn ')
@@ -169,6 +158,52 @@ def preProcessNormLearningData(A, En, Cl, YnormXind, type):
 
     return A, Cl, En, Aorig
 
+#**********************************************************************************
+''' Preprocessing state '''
+''' Everything needed to preprocess prediction data the way the learning data '''
+''' was preprocessed, saved next to the models as <Root>.preproc.pkl '''
+#**********************************************************************************
+preprocStateKeys = ['Ynorm', 'fullYnorm', 'YnormTo', 'StandardScalerFlag', 'enRestrictRegion',
+    'enLim1', 'enLim2', 'cherryPickEnPoint', 'enSel', 'enSelDelta']
+
+def savePreprocState(Root, En, Cl, A, YnormXind):
+    state = {k : getattr(preprocDef, k) for k in preprocStateKeys}
+    state.update({'En' : En, 'Cl' : Cl, 'numPoints' : A.shape[1], 'YnormXind' : YnormXind,
+        'scaler' : getattr(preprocDef, 'scaler', None)})
+    with open(Root + '.preproc.pkl', 'wb') as f:
+        f.write(pickle.dumps(state))
+
+# Use the saved state if predictOnly is set, or if the learning file is missing
+def usePreprocState(learnFile):
+    Root = os.path.splitext(learnFile)[0]
+    if os.path.isfile(Root + '.preproc.pkl') == False:
+        return False
+    return preprocDef.predictOnly == True or os.path.isfile(learnFile) == False
+
+# Returns En, Cl, A, Aorig, YnormXind as preProcessNormLearningData would, with A
+# and Aorig empty. Models are then loaded from their saved files, never retrained.
+def loadPreprocState(Root):
+    with open(Root + '.preproc.pkl', 'rb') as f:
+        state = pickle.loads(f.read())
+    print(' Prediction only: using preprocessing state from ' + Root + '.preproc.pkl')
+    print(' Saved models are used and not retrained\n')
+    for k in preprocStateKeys:
+        setattr(preprocDef, k, state[k])
+    if state['scaler'] is not None:
+        preprocDef.scaler = state['scaler']
+
+    for d in [dnntfDef, kerasDef, nnDef, svmDef, kmDef, tfDef]:
+        d.alwaysRetrain = False
+    for d in [dnntfDef, kerasDef, tfDef]:
+        d.alwaysImprove = False
+    # These need the learning data
+    nnDef.nnClassReport = svmDef.svmClassReport = False
+    plotDef.createTrainingDataPlot = False
+    kmDef.plotKM = False
+
+    A = np.zeros((0, state['numPoints']))
+    return state['En'], state['Cl'], A, np.copy(A), state['YnormXind']
+
 #**********************************************************************************
 ''' Preprocess Prediction data '''
 #**********************************************************************************
@@ -180,7 +215,7 @@ def preProcessNormPredData(R, Rx, En, YnormXind, type):
     if(R.shape[0] != En.shape[0]):
         if type == 0:
             print('\033[1m' + '  WARNING: Different number of datapoints for the x-axis\n  for training (' + str(En.shape[0]) + ') and sample (' + str(R.shape[0]) + ') data.\n  Reformatting x-axis of sample data...\n' + '\033[0m')
-        R = np.interp(En, Rx, R)
+        R = resampler.transform(En, Rx, R)
     R = R.reshape(1,-1)
     Rorig = np.copy(R)
 
@@ -197,7 +232,7 @@ def preProcessNormPredData(R, Rx, En, YnormXind, type):
         if(np.amin(R) <= 0):
             print('  Spectra max below zero detected')
             R[0,:] = R[0,:] - np.amin(R[0,:]) + 1e-8
-        R[0,:] = np.multiply(R[0,:], preprocDef.YnormTo/R[0,R[0][YnormXind].tolist().index(max(R[0][YnormXind].tolist()))+YnormXind[0]])
+        normYSpectra(R, YnormXind)
 
     if preprocDef.StandardScalerFlag == True:
         print('  Using StandardScaler from sklearn ')
@@ -222,6 +257,104 @@ def preProcessNormPredData(R, Rx, En, YnormXind, type):
                 print( '  Using full energy range: [' + str(En[0]) + ', ' + str(En[En.shape[0]-1]) + ']\n')
     return R, Rorig
 
+#**********************************************************************************
+''' Preprocess Prediction data - matrix of spectra sharing the same x-axis '''
+''' Same result as preProcessNormPredData applied to each row of R '''
+#**********************************************************************************
+def preProcessNormPredMatrix(R, Rx, En, YnormXind, type):
+    print(' Processing Prediction data: ' + str(R.shape[0]) + ' spectra... ')
+    if(R.shape[1] != En.shape[0]):
+        if type == 0:
+            print('\033[1m' + '  WARNING: Different number of datapoints for the x-axis\n  for training (' + str(En.shape[0]) + ') and sample (' + str(R.shape[1]) + ') data.\n  Reformatting x-axis of sample data...\n' + '\033[0m')
+        R = resampler.transform(En, Rx, R)
+    else:
+        R = np.array(R, dtype=np.float64)
+    Rorig = np.copy(R)
+
+    if preprocDef.Ynorm == True:
+        if type == 0:
+            if preprocDef.fullYnorm == False:
+                print('  Normalizing spectral intensity to: ' + str(preprocDef.YnormTo) + '; En = [' + str(preprocDef.YnormX-preprocDef.YnormXdelta) + ', ' + str(preprocDef.YnormX+preprocDef.YnormXdelta) + ']')
+            else:
+                print('  Normalizing spectral intensity to: ' + str(preprocDef.YnormTo) + '; to max intensity in spectra')
+        normYSpectra(R, YnormXind)
+
+    if preprocDef.StandardScalerFlag == True:
+        print('  Using StandardScaler from sklearn ')
+        R = preprocDef.scaler.transform(R)
+
+    if preprocDef.enRestrictRegion == True:
+        En = En[range(preprocDef.enLim1, preprocDef.enLim2)]
+        R = R[:,range(preprocDef.enLim1, preprocDef.enLim2)]
+        if type == 0:
+            print( '  Restricting energy range between: [' + str(En[0]) + ', ' + str(En[En.shape[0]-1]) + ']\n')
+    else:
+        if type == 0:
+            if(preprocDef.cherryPickEnPoint == True):
+                print( '  Using selected spectral points:')
+                print(En)
+            else:
+                print( '  Using full energy range: [' + str(En[0]) + ', ' + str(En[En.shape[0]-1]) + ']\n')
+    return R, Rorig
+
+#**********************************************************************************
+''' Normalize each spectrum (in place) to the max intensity within YnormXind '''
+''' Spectra with non-positive values are first shifted above zero '''
+#**********************************************************************************
+def normYSpectra(A, YnormXind):
+    Amin = np.amin(A, axis=1)
+    shift = Amin <= 0
+    if shift.any():
+        # Same operation order as A - min + 1e-8, so results are bit-identical
+        A -= np.where(shift, Amin, 0)[:,np.newaxis]
+        A += np.where(shift, 1e-8, 0)[:,np.newaxis]
+    # YnormXind is a contiguous range of indices: slicing avoids a copy
+    window = A[:,YnormXind[0]:YnormXind[-1]+1]
+    # First maximum within the window, as in list.index(max(...))
+    ind = np.argmax(window, axis=1) + YnormXind[0]
+    A *= preprocDef.YnormTo/A[np.arange(A.shape[0]),ind][:,np.newaxis]
+    return A
+
+#**********************************************************************************
+''' Linear resampling onto the x-axis of the training data '''
+''' Equivalent to np.interp(En, Rx, r) for each row r of R, with index '''
+''' and weight arrays computed once per (En, Rx) and applied to the stack '''
+''' Same as Resampler in SpectraKeras/libSpectraKeras.py: the two packages are '''
+''' installed separately. Keep them in sync. '''
+#**********************************************************************************
+class Resampler(object):
+    def __init__(self, maxPlans=32):
+        self.maxPlans = maxPlans
+        self.plans = {}
+        # Shared by the prediction server threads
+        self.lock = threading.Lock()
+
+    def getPlan(self, En, Rx):
+        En = np.asarray(En, dtype=np.float64)
+        Rx = np.asarray(Rx, dtype=np.float64)
+        key = (En.tobytes(), Rx.tobytes())
+        plan = self.plans.get(key)
+        if plan is None:
+            ind = np.clip(np.searchsorted(Rx, En, side='right')-1, 0, max(Rx.size-2, 0))
+            ind2 = np.minimum(ind+1, Rx.size-1)
+            dx = Rx[ind2] - Rx[ind]
+            w = np.zeros(En.size)
+            np.divide(En - Rx[ind], dx, out=w, where=dx!=0)
+            # Outside of Rx, np.interp holds the first/last value
+            plan = (ind, ind2, np.clip(w, 0, 1))
+            with self.lock:
+                if len(self.plans) >= self.maxPlans:
+                    self.plans.clear()
+                self.plans[key] = plan
+        return plan
+
+    def transform(self, En, Rx, R):
+        ind, ind2, w = self.getPlan(En, Rx)
+        R = np.asarray(R)
+        return R[...,ind]*(1-w) + R[...,ind2]*w
+
+resampler = Resampler()
+
 #**********************************************************************************
 ''' Preprocess prediction data '''
 #**********************************************************************************
@@ -243,8 +376,7 @@ def preProcessNormMap(A, En, type):
     if preprocDef.Ynorm == True:
         if type == 0:
             print(' Normalizing spectral intensity to: ' + str(preprocDef.YnormTo) + '; En = [' + str(preprocDef.YnormX-preprocDef.YnormXdelta) + ', ' + str(preprocDef.YnormX+preprocDef.YnormXdelta) + ']')
-        for i in range(0,A.shape[0]):
-            A[i,:] = np.multiply(A[i,:], preprocDef.YnormTo/np.amax(A[i]))
+        A *= preprocDef.YnormTo/np.amax(A, axis=1)[:,np.newaxis]
 
 
     if preprocDef.StandardScalerFlag == True:
@@ -309,6 +441,18 @@ def saveMap(file, type, extension, s, x1, y1, comma):
         coord_file.write('{:}\n'.format(s))
         coord_file.close()
 
+#************************************
+''' Save a whole map with a single buffered write '''
+#************************************
+def saveMapBatch(file, type, extension, s, x, y, comma):
+    inputFile = saveMapName(file, type, extension, comma)
+    if comma==True:
+        fmt = '{:},{:},{:}\n'
+    else:
+        fmt = '{:}\t{:}\t{:}\n'
+    with open(inputFile, "a") as coord_file:
+        coord_file.write(''.join([fmt.format(x[i], y[i], s[i]) for i in range(len(s))]))
+
 def saveMapName(file, type, extension, comma):
     if comma==True:
         extension2 = '_map.csv'
@@ -325,7 +469,7 @@ def plotProb(clf, R):
     print(' Probabilities of this sample within each class: \n')
     for i in range(0,clf.classes_.shape[0]):
         print(' ' + str(clf.classes_[i]) + ': ' + str(round(100*prob[i],2)) + '%')
-    import matplotlib.pyplot as plt
+    plt = importPyplot()
     print('\n Stand by: Plotting probabilities for each class... \n')
     plt.title('Probability density per class')
     for i in range(0, clf.classes_.shape[0]):
@@ -340,7 +484,7 @@ def plotProb(clf, R):
 ''' Plot Training data'''
 #************************************
 def plotTrainData(A, En, R, plotAllSpectra, learnFileRoot):
-    import matplotlib.pyplot as plt
+    plt = importPyplot()
     if plotDef.plotAllSpectra == True:
         step = 1
         learnFileRoot = learnFileRoot + '_full-set'
@@ -379,7 +523,7 @@ def plotMaps(X, Y, A, label):
 
     rbf = scipy.interpolate.Rbf(Y, -X, A, function='linear')
     zi = rbf(xi, yi)
-    import matplotlib.pyplot as plt
+    plt = importPyplot()
     plt.imshow(zi, vmin=A.min(), vmax=A.max(), origin='lower',label='data',
                extent=[X.min(), X.max(), Y.min(), Y.max()])
     plt.title(label)
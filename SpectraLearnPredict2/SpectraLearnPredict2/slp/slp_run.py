@@ -13,10 +13,6 @@
 ***********************************************************
 '''
 
-import matplotlib
-if matplotlib.get_backend() == 'TkAgg':
-    matplotlib.use('Agg')
-
 import numpy as np
 import sys, os.path, getopt, glob, csv
 import random, time, configparser, os
@@ -32,8 +28,7 @@ from .slp_io import *
 #**********************************************
 def run():
 
-    start_time = time.clock()
-    print(" TensorFlow v.",parse_version(tf.version.VERSION) )
+    start_time = time.perf_counter()
 
     try:
         opts, args = getopt.getopt(sys.argv[1:],
@@ -90,7 +85,7 @@ def run():
             else:
                 numPCAcomp = pcaDef.numPCAcomponents
             try:
-                runPCA(sys.argv[2], numPCAcomp)
+                runPCAfile(sys.argv[2], numPCAcomp)
             except:
                 usage()
                 sys.exit(2)
@@ -105,8 +100,10 @@ def run():
             except:
                 usage()
                 sys.exit(2)
-        total_time = time.clock() - start_time
-        print(" TensorFlow v.",parse_version(tf.version.VERSION) )
+        total_time = time.perf_counter() - start_time
+        # TensorFlow is loaded only if a TensorFlow model was run
+        if 'tensorflow' in sys.modules:
+            print(" TensorFlow v.",sys.modules['tensorflow'].version.VERSION)
         print(" Total time: {0:.1f}s or {1:.1f}m or {2:.1f}h".format(total_time,
                                                     total_time/60, total_time/3600),"\n")
 
@@ -12,10 +12,6 @@
 *
 ***********************************************************
 '''
-import matplotlib
-if matplotlib.get_backend() == 'TkAgg':
-    matplotlib.use('Agg')
-
 import numpy as np
 import sys, os.path, getopt, glob, csv, pickle
 import random, time, configparser, os
@@ -43,6 +39,7 @@ def trainSVM(A, Cl, A_test, Cl_test, Root):
     model_le = Root + '.svmLabelEnc.pkl'
 
     le = preprocessing.LabelEncoder()
+    isLoadOnly(A, svmTrainedData)
     try:
         if svmDef.alwaysRetrain == False:
             with open(svmTrainedData):
@@ -119,94 +116,11 @@ def predSVM(clf, A, Cl, R, le):
     return R_pred[0], round(100*max(prob),1)
 
 #********************************************************************************
-''' Run PCA '''
-''' Transform data:
-    pca.fit(data).transform(data)
-    Loading Vectors (eigenvectors):
-    pca.components_
-    Eigenvalues:
-    pca.explained_variance_ratio
-    '''
+''' Batch prediction - Support Vector Machines '''
+''' Predicted values and probabilities for each row of R '''
 #********************************************************************************
-def runPCA(learnFile, numPCAcomponents):
-    from sklearn.decomposition import PCA
-    import matplotlib.pyplot as plt
-    from matplotlib import cm
-
-    ''' Open and process training data '''
-    En, Cl, A, YnormXind = readLearnFile(learnFile)
-
-    print('==========================================================================\n')
-    print(' Running PCA...\n')
-    print(' Number of unique identifiers in training data: ' + str(np.unique(Cl).shape[0]))
-    if pcaDef.customNumPCAComp == False:
-        numPCAcomp = np.unique(Cl).shape[0]
-    else:
-        numPCAcomp = numPCAcomponents
-    print(' Number of Principal components: ' + str(numPCAcomp) + '\n')
-    pca = PCA(n_components=numPCAcomp)
-    A_r = pca.fit(A).transform(A)
-
-    for i in range(0,pca.components_.shape[0]):
-        print(' Score PC ' + str(i) + ': ' + '{0:.0f}%'.format(pca.explained_variance_ratio_[i] * 100))
-    print('')
-
-    if plotDef.showPCAPlots == True:
-        print(' Plotting Loadings and score plots... \n')
-
-        #***************************
-        ''' Plotting Loadings '''
-        #***************************
-        for i in range(0,pca.components_.shape[0]):
-            plt.plot(En, pca.components_[i,:], label='PC' + str(i) + ' ({0:.0f}%)'.format(pca.explained_variance_ratio_[i] * 100))
-        plt.plot((En[0], En[En.shape[0]-1]), (0.0, 0.0), 'k--')
-        plt.title('Loadings plot')
-        plt.xlabel('Raman shift [1/cm]')
-        plt.ylabel('Principal component')
-        plt.legend()
-        plt.figure()
-
-        #***************************
-        ''' Plotting Scores '''
-        #***************************
-        Cl_ind = np.zeros(len(Cl))
-        Cl_labels = np.zeros(0)
-        ind = np.zeros(np.unique(Cl).shape[0])
-
-        for i in range(len(Cl)):
-            if (np.in1d(Cl[i], Cl_labels, invert=True)):
-                Cl_labels = np.append(Cl_labels, Cl[i])
-
-        for i in range(len(Cl)):
-            Cl_ind[i] = np.where(Cl_labels == Cl[i])[0][0]
-
-            colors = [ cm.jet(x) for x in np.linspace(0, 1, ind.shape[0]) ]
-
-        for color, i, target_name in zip(colors, range(ind.shape[0]), Cl_labels):
-            plt.scatter(A_r[Cl_ind==i,0], A_r[Cl_ind==i,1], color=color, alpha=.8, lw=2, label=target_name)
-
-        plt.title('Score plot')
-        plt.xlabel('PC 0 ({0:.0f}%)'.format(pca.explained_variance_ratio_[0] * 100))
-        plt.ylabel('PC 1 ({0:.0f}%)'.format(pca.explained_variance_ratio_[1] * 100))
-        plt.figure()
-
-        plt.title('Score box plot')
-        plt.xlabel('Principal Component')
-        plt.ylabel('Score')
-        for j in range(pca.components_.shape[0]):
-            for color, i, target_name in zip(colors, range(ind.shape[0]), Cl_labels):
-                plt.scatter([j+1]*len(A_r[Cl_ind==i,j]), A_r[Cl_ind==i,j], color=color, alpha=.8, lw=2, label=target_name)
-        plt.boxplot(A_r)
-        plt.figure()
-
-        #******************************
-        ''' Plotting Scores vs H:C '''
-        #******************************
-        for j in range(pca.components_.shape[0]):
-            for color, i, target_name in zip(colors, range(ind.shape[0]), Cl_labels):
-                plt.scatter(np.asarray(Cl)[Cl_ind==i], A_r[Cl_ind==i,j], color=color, alpha=.8, lw=2, label=target_name)
-            plt.xlabel('H:C elemental ratio')
-            plt.ylabel('PC ' + str(j) + ' ({0:.0f}%)'.format(pca.explained_variance_ratio_[j] * 100))
-            plt.figure()
-        plt.show()
+def predSVMBatch(clf, R, le):
+    predValue = le.inverse_transform(clf.predict(R))
+    predProb = np.round(100*np.amax(clf.predict_proba(R), axis=1),1)
+    return predValue, predProb
 
@@ -13,10 +13,6 @@
 ***********************************************************
 '''
 
-import matplotlib
-if matplotlib.get_backend() == 'TkAgg':
-    matplotlib.use('Agg')
-
 import numpy as np
 import sys, os.path, getopt, glob, csv
 import random, time, configparser, os
@@ -46,6 +42,7 @@ def trainTF(A, Cl, A_test, Cl_test, Root):
     
     tfTrainedData = Root + '.tfmodel'
     print("\n  Training model saved in: ", tfTrainedData, "\n")
+    isLoadOnly(A, tfTrainedData + '.meta')
 
     #**********************************************
     ''' Initialize Estimator and training data '''
@@ -92,6 +89,7 @@ def trainTF(A, Cl, A_test, Cl_test, Root):
 
     saver = tf.train.Saver()
     accur = 0
+    accuracy_score = 0
 
     #**********************************************
     ''' Train '''
@@ -134,6 +132,7 @@ def trainTF(A, Cl, A_test, Cl_test, Root):
     #print("  Loss: {:.2f}".format(accuracy_score["loss"]))
     #print("  Global step: {:.2f}\n".format(accuracy_score["global_step"]))
     print('  ================================\n')
+    return accuracy_score
 
 #**********************************************
 ''' Predict using basic Tensorflow '''
@@ -175,6 +174,26 @@ def predTF(A, Cl, R, Root):
     print('\033[1m Predicted value (TF): ' + str(np.unique(Cl)[res2][0]) + ' (Probability: ' + str('{:.1f}'.format(res1[0][res2][0])) + '%)\n' + '\033[0m' )
     return np.unique(Cl)[res2][0], res1[0][res2][0]
 
+#**********************************************
+''' Batch prediction using basic Tensorflow '''
+''' Predicted values and probabilities for each row of R '''
+#**********************************************
+def predTFBatch(A, Cl, R, Root):
+    import tensorflow as tf
+
+    tfTrainedData = Root + '.tfmodel'
+    x,y,y_ = setupTFmodel(A, Cl)
+    sess = tf.InteractiveSession()
+    tf.global_variables_initializer().run()
+    print(' Opening TF training model from:', tfTrainedData)
+    saver = tf.train.Saver()
+    saver.restore(sess, './' + tfTrainedData)
+    res1 = sess.run(y, feed_dict={x: R})
+    sess.close()
+
+    res2 = np.argmax(res1, axis=1)
+    return np.unique(Cl)[res2], res1[np.arange(res2.shape[0]),res2]
+
 #**********************************************
 ''' Setup Tensorflow Model'''
 #**********************************************
@@ -4,7 +4,7 @@ setup(
     name='SpectraLearnPredict2',
     packages=find_packages(),
     install_requires=['numpy', 'matplotlib', 'pandas', 'scikit-learn', 'keras',
-                    'pydot', 'graphviz', 'h5py', 'tensorflow'],
+                    'pydot', 'graphviz', 'h5py', 'tensorflow', 'SpectraKeras'],
     entry_points={'gui_scripts' : ['SpectraLearnPredict2=SpectraLearnPredict2.__main__:main']},
     version='20191022a',
     description='Machine learning for spectral data',
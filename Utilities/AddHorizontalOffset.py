@@ -6,7 +6,7 @@
 * Replicate training data with horizontal offset
 * For augmentation of data
 *
-* version: 20181221a
+* version: 20261018a
 *
 * By: Nicola Ferralis <feranick@hotmail.com>
 *
@@ -16,6 +16,8 @@ print(__doc__)
 
 import numpy as np
 import sys, os.path, h5py, csv
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../SpectraKeras'))
+from libSpectraKeras import Augmenter
 
 #************************************
 ''' Main '''
@@ -25,6 +27,8 @@ class defParam:
     Ynorm = True
     YnormTo = 1
     randOffset = False
+    numWorkers = os.cpu_count()
+    seed = None
 
 def main():
     if(len(sys.argv)<4):
@@ -35,22 +39,14 @@ def main():
     En, M = readLearnFile(sys.argv[1])
     newFile = os.path.splitext(sys.argv[1])[0] + '_n' + sys.argv[2]+ '_oH' + sys.argv[3]
 
-    if os.path.exists(newFile) == False:
-        newTrain = np.append([0], En)
-        newTrain = np.vstack((newTrain, M))
-    else:
-        newTrain = M
-
     print(' Adding', sys.argv[2],'sets with horizontal offset:', sys.argv[3], '\n')
-
-    for j in range(int(sys.argv[2])):
-        newTrain = np.vstack((newTrain, horizontalOffset(En, M, float(sys.argv[3]))))
+    aug = Augmenter(En, horOffset=float(sys.argv[3]), randomize=defParam.randOffset,
+        normalize=defParam.Ynorm, YnormTo=defParam.YnormTo, seed=defParam.seed)
 
     if defParam.Ynorm ==True:
         print(" Normalizing Learning + Noisy Spectra to:",defParam.YnormTo,"\n")
-        newTrain = normalizeSpectra(newTrain)
 
-    saveLearnFile(newTrain, newFile)
+    saveLearnFile(aug, M, newFile, int(sys.argv[2]))
 
 #************************************
 ''' Open Learning Data '''
@@ -78,41 +74,17 @@ def readLearnFile(learnFile):
 #***************************************
 ''' Save new learning Data '''
 #***************************************
-def saveLearnFile(M, learnFile):
+def saveLearnFile(aug, M, learnFile, numCopies):
     if defParam.saveAsTxt == True:
         learnFile += '.txt'
         print(" Saving new training file (txt) in:", learnFile+"\n")
-        with open(learnFile, 'ab') as f:
-            np.savetxt(f, M, delimiter='\t', fmt='%10.6f')
     else:
         learnFile += '.h5'
         print(" Saving new training file (hdf5) in: "+learnFile+"\n")
-        with h5py.File(learnFile, 'w') as hf:
-            hf.create_dataset("M",  data=M)
-
-#*******************************************
-''' Introduce Horizontal Offset in Data '''
-#*******************************************
-def horizontalOffset(En, M, offset):
-    newM = np.copy(M)
-    for i in range(0, M.shape[0]):
-        if defParam.randOffset:
-            newEn = np.add(En, offset*np.random.uniform(-1,1))
-        else:
-            newEn = np.add(En, offset)
-        newM[i,1:] = np.interp(En, newEn, M[i,1:], left = 0, right = 0)
-    return newM
-
-#************************************
-''' Normalize '''
-#************************************
-def normalizeSpectra(M):
-    for i in range(1,M.shape[0]):
-        if(np.amin(M[i]) <= 0):
-            M[i,1:] = M[i,1:] - np.amin(M[i,1:]) + 1e-8
-        #M[i,1:] = np.multiply(M[i,1:], defParam.YnormTo/max(M[i][1:]))
-    M[1:,1:] = np.multiply(M[1:,1:], np.array([float(defParam.YnormTo)/np.amax(M[1:,1:], axis = 1)]).T)
-    return M
+    # Augmented from the raw spectra, normalized afterwards as the original rows
+    numRows = aug.save(M, learnFile, numCopies, numWorkers=defParam.numWorkers,
+        normalizeOriginal=defParam.Ynorm)
+    print(" Spectra in new training file:", numRows-1, "(seed: "+str(aug.seed)+")\n")
 
 #************************************
 ''' Main initialization routine '''
@@ -8,7 +8,7 @@
 * slope parameter.
 * For augmentation of data
 *
-* version: 20181221a
+* version: 20261018a
 *
 * By: Nicola Ferralis <feranick@hotmail.com>
 *
@@ -18,6 +18,8 @@ print(__doc__)
 
 import numpy as np
 import sys, os.path, h5py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../SpectraKeras'))
+from libSpectraKeras import Augmenter
 #************************************
 ''' Main '''
 #************************************
@@ -27,6 +29,8 @@ class defParam:
     randomSlope = True
     Ynorm = True
     YnormTo = 1
+    numWorkers = os.cpu_count()
+    seed = None
 
 def main():
     if len(sys.argv) < 4:
@@ -49,27 +53,15 @@ def main():
         newFile += '_sLinBack-' + sys.argv[3]
         print(' Adding', sys.argv[2], 'sets with linear background with slope:', sys.argv[3], '\n')
 
-    if defParam.Ynorm ==True:
-        print(" Normalizing Learning Spectra to:",defParam.YnormTo)
-        newFile += '_norm'+str(defParam.YnormTo)
-
-    #newFile += '.txt'
     En, M = readLearnFile(sys.argv[1])
-
-    if os.path.exists(newFile) == False:
-        newTrain = np.append([0], En)
-        newTrain = np.vstack((newTrain, M))
-    else:
-        newTrain = M
-
-    for j in range(int(sys.argv[2])):
-        newTrain = np.vstack((newTrain, linBackground(En, M, float(sys.argv[3]))))
+    aug = Augmenter(En, linBackground=float(sys.argv[3]), randomize=defParam.randomSlope,
+        normalize=defParam.Ynorm, YnormTo=defParam.YnormTo, seed=defParam.seed, keepLabels=False)
 
     if defParam.Ynorm ==True:
-        print(" Normalizing Learning + Noisy Spectra to:",defParam.YnormTo,"\n")
-        newTrain = normalizeSpectra(newTrain)
+        print(" Normalizing Learning Spectra to:",defParam.YnormTo)
+        newFile += '_norm'+str(defParam.YnormTo)
 
-    saveLearnFile(newTrain, newFile)
+    saveLearnFile(aug, M, newFile, int(sys.argv[2]))
 
 #************************************
 ''' Open Learning Data '''
@@ -97,54 +89,17 @@ def readLearnFile(learnFile):
 #***************************************
 ''' Save new learning Data '''
 #***************************************
-def saveLearnFile(M, learnFile):
+def saveLearnFile(aug, M, learnFile, numCopies):
     if defParam.saveAsTxt == True:
         learnFile += '.txt'
         print(" Saving new training file (txt) in:", learnFile+"\n")
-        with open(learnFile, 'ab') as f:
-            np.savetxt(f, M, delimiter='\t', fmt='%10.6f')
     else:
         learnFile += '.h5'
         print(" Saving new training file (hdf5) in: "+learnFile+"\n")
-        with h5py.File(learnFile, 'w') as hf:
-            hf.create_dataset("M",  data=M)
-
-#************************************
-''' Introduce Noise in Data '''
-#************************************
-def linBackground(En, M, slope):
-    S = np.zeros(M.shape)
-    if defParam.randomSlope == True:
-        slope = np.multiply(slope,np.random.uniform(0,1, size=(M.shape[0],1)))
-    S[:,1:] = np.add(np.subtract(M[:,1:],np.array([M[:,1]]).T), slope*En)
-    return S
-
-'''
-def linBackground_old(En, M, slope):
-    from random import uniform
-    for j in range(0, M.shape[0]):
-        rSlope = slope
-        if defParam.randomSlope == True:
-            rSlope *= uniform(0,1)
-        S = np.zeros(M.shape)
-        for i in range(0, En.shape[0]):
-            if defParam.addToFlatland == False:
-                S[j,i+1] = M[j,i+1] + rSlope*En[i] - M[j,1]
-            else:
-                if M[j,i+1].any() == 0:
-                    S[j,i+1] = M[j,i+1] + rSlope*En[i] - M[j,1]
-    return S
-'''
-#************************************
-''' Normalize '''
-#************************************
-def normalizeSpectra(M):
-    for i in range(1,M.shape[0]):
-        if(np.amin(M[i]) <= 0):
-            M[i,1:] = M[i,1:] - np.amin(M[i,1:]) + 1e-8
-        #M[i,1:] = np.multiply(M[i,1:], defParam.YnormTo/max(M[i][1:]))
-    M[1:,1:] = np.multiply(M[1:,1:], np.array([float(defParam.YnormTo)/np.amax(M[1:,1:], axis = 1)]).T)
-    return M
+    # Augmented from the raw spectra, normalized afterwards as the original rows
+    numRows = aug.save(M, learnFile, numCopies, numWorkers=defParam.numWorkers,
+        normalizeOriginal=defParam.Ynorm)
+    print(" Spectra in new training file:", numRows-1, "(seed: "+str(aug.seed)+")\n")
 
 #************************************
 ''' Main initialization routine '''
@@ -7,7 +7,7 @@
 * Offset is randomly set
 * For augmentation of data
 *
-* version: 20181221b
+* version: 20261018a
 *
 * By: Nicola Ferralis <feranick@hotmail.com>
 *
@@ -17,6 +17,8 @@ print(__doc__)
 
 import numpy as np
 import sys, os.path, h5py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../SpectraKeras'))
+from libSpectraKeras import Augmenter
 #************************************
 ''' Main '''
 #************************************
@@ -25,6 +27,8 @@ class defParam:
     addToFlatland = False
     Ynorm = True
     YnormTo = 1
+    numWorkers = os.cpu_count()
+    seed = None
 
 def main():
     if len(sys.argv) < 4:
@@ -34,14 +38,6 @@ def main():
         return
 
     newFile = os.path.splitext(sys.argv[1])[0] + '_n' + sys.argv[2] + '_offs' + sys.argv[3]
-    learnFileExt = os.path.splitext(sys.argv[1])[1]
-
-    '''
-    if learnFileExt == ".h5":
-        defParam.saveAsTxt = False
-    else:
-        defParam.saveAsTxt = True
-    '''
 
     if len(sys.argv) == 5:
         defParam.addToFlatland = True
@@ -51,26 +47,15 @@ def main():
         print(' Adding', sys.argv[2], 'sets with random noise with offset:', sys.argv[3], '\n')
 
     En, M = readLearnFile(sys.argv[1])
+    aug = Augmenter(En, noise=float(sys.argv[3]), flatland=defParam.addToFlatland,
+        normalize=defParam.Ynorm, YnormTo=defParam.YnormTo, seed=defParam.seed, shared=True, compound=True)
     
     if defParam.Ynorm ==True:
-        print(" Normalizing Learning Spectra to:",defParam.YnormTo)
-        M = normalizeSpectra(M)
+        print(" Normalizing Learning and Noisy Spectra to:",defParam.YnormTo)
+        aug.normalizeSpectra(M[:,1:], M[:,0])
         newFile += '_norm1'
 
-    if os.path.exists(newFile) == False:
-        newTrain = np.append([0], En)
-        newTrain = np.vstack((newTrain, M))
-    else:
-        newTrain = M
-
-    for j in range(int(sys.argv[2])):
-        newTrain = np.vstack((newTrain, scrambleNoise(M, float(sys.argv[3]))))
-
-    if defParam.Ynorm ==True:
-        print(" Normalizing Learning + Noisy Spectra to:",defParam.YnormTo,"\n")
-        newTrain = normalizeSpectra(newTrain)
-
-    saveLearnFile(newTrain, newFile)
+    saveLearnFile(aug, M, newFile, int(sys.argv[2]))
 
 #************************************
 ''' Open Learning Data '''
@@ -98,46 +83,15 @@ def readLearnFile(learnFile):
 #***************************************
 ''' Save new learning Data '''
 #***************************************
-def saveLearnFile(M, learnFile):
+def saveLearnFile(aug, M, learnFile, numCopies):
     if defParam.saveAsTxt == True:
         learnFile += '.txt'
         print(" Saving new training file (txt) in:", learnFile+"\n")
-        with open(learnFile, 'ab') as f:
-            np.savetxt(f, M, delimiter='\t', fmt='%10.6f')
     else:
         learnFile += '.h5'
         print(" Saving new training file (hdf5) in: "+learnFile+"\n")
-        with h5py.File(learnFile, 'w') as hf:
-            hf.create_dataset("M",  data=M)
-
-#************************************
-''' Introduce Noise in Data '''
-#************************************
-def scrambleNoise(M, offset):
-    M[:,1:] = np.add(M[:,1:], 0.01*offset*np.random.uniform(-1,1, size=(1,M.shape[1]-1)))
-    return M
-'''
-def scrambleNoise_old(M, offset):
-    from random import uniform
-    for i in range(1, M.shape[1]-1):
-        if defParam.addToFlatland == False:
-            M[:,i] += 0.01*offset*uniform(-1,1)
-        else:
-            if M[:,i].any() == 0:
-                M[:,i] += 0.01*offset*uniform(-1,1)
-    return M
-'''
-
-#************************************
-''' Normalize '''
-#************************************
-def normalizeSpectra(M):
-    for i in range(1,M.shape[0]):
-        if(np.amin(M[i]) <= 0):
-            M[i,1:] = M[i,1:] - np.amin(M[i,1:]) + 1e-8
-        #M[i,1:] = np.multiply(M[i,1:], defParam.YnormTo/max(M[i][1:]))
-    M[1:,1:] = np.multiply(M[1:,1:], np.array([float(defParam.YnormTo)/np.amax(M[1:,1:], axis = 1)]).T)
-    return M
+    numRows = aug.save(M, learnFile, numCopies, numWorkers=defParam.numWorkers)
+    print(" Spectra in new training file:", numRows-1, "(seed: "+str(aug.seed)+")\n")
 
 #************************************
 ''' Main initialization routine '''
@@ -8,7 +8,7 @@
 * spectra are also shifted along the x axis
 * For augmentation of data
 *
-* version: 20180615a
+* version: 20261018a
 *
 * By: Nicola Ferralis <feranick@hotmail.com>
 *
@@ -19,6 +19,8 @@ print(__doc__)
 
 import numpy as np
 import sys, os.path, h5py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../SpectraKeras'))
+from libSpectraKeras import Augmenter
 
 #************************************
 ''' Main '''
@@ -26,6 +28,8 @@ import sys, os.path, h5py
 class defParam:
     saveAsTxt = False
     addToFlatland = False
+    numWorkers = os.cpu_count()
+    seed = None
 
 def main():
     if len(sys.argv) < 5:
@@ -45,19 +49,12 @@ def main():
               ', horizontal offset within', sys.argv[4],'\n')
 
     En, M = readLearnFile(sys.argv[1])
+    # The noise offset is a fraction (not a %) of the max of each spectrum.
+    # The noise offset is also used as horizontal offset.
+    aug = Augmenter(En, relNoise=100*float(sys.argv[3]), horOffset=float(sys.argv[3]),
+        flatland=defParam.addToFlatland, seed=defParam.seed)
 
-    if os.path.exists(newFile) == False:
-        newTrain = np.append([0], En)
-        newTrain = np.vstack((newTrain, M))
-    else:
-        newTrain = M
-
-    for j in range(int(sys.argv[2])):
-        newTrain = np.vstack((newTrain,
-                    scrambleNoise(horizontalOffset(En, M, float(sys.argv[3]), True),
-                    float(sys.argv[3]))))
-
-    saveLearnFile(newTrain, newFile)
+    saveLearnFile(aug, M, newFile, int(sys.argv[2]))
 
 #************************************
 ''' Open Learning Data '''
@@ -85,50 +82,15 @@ def readLearnFile(learnFile):
 #***************************************
 ''' Save new learning Data '''
 #***************************************
-def saveLearnFile(M, learnFile):
+def saveLearnFile(aug, M, learnFile, numCopies):
     if defParam.saveAsTxt == True:
         learnFile += '.txt'
         print(" Saving new training file (txt) in:", learnFile+"\n")
-        with open(learnFile, 'ab') as f:
-            np.savetxt(f, M, delimiter='\t', fmt='%10.6f')
     else:
         learnFile += '.h5'
         print(" Saving new training file (hdf5) in: "+learnFile+"\n")
-        with h5py.File(learnFile, 'w') as hf:
-            hf.create_dataset("M",  data=M)
-
-#************************************
-''' Introduce Noise in Data '''
-#************************************
-def scrambleNoise(M, offset):
-    from random import uniform
-    for j in range(0, M.shape[0]):
-        for i in range(1, M.shape[1]):
-            if defParam.addToFlatland == False:
-                M[j,i] += offset*uniform(-1,1)*np.amax(M[j,:])
-            else:
-                if M[j,i].any() == 0:
-                    M[j,i] += offset*uniform(-1,1)*np.amax(M[j,:])
-    return M
-
-#*******************************************
-''' Introduce Horizontal Offset in Data '''
-#*******************************************
-def horizontalOffset(En, M, offset, rand):
-    
-    newM = np.zeros(M.shape)
-    newM[:,0] = M[:,0]
-    newEn = np.zeros(En.shape)
-    
-    for i in range(0, M.shape[0]):
-        if rand is True:
-            from random import uniform
-            newEn = En + offset*uniform(-1,1)
-        else:
-            newEn = En + offset
-        newM[i,1:] = np.interp(En, newEn, M[i,1:], left = 0, right = 0)
-    
-    return newM
+    numRows = aug.save(M, learnFile, numCopies, numWorkers=defParam.numWorkers)
+    print(" Spectra in new training file:", numRows-1, "(seed: "+str(aug.seed)+")\n")
 
 #************************************
 ''' Main initialization routine '''
@@ -7,7 +7,7 @@
 *
 * Adds spectra to Training File
 * Spectra can be ASCII or Rruff
-* version: 20190114a
+* version: 20261018a
 *
 * By: Nicola Ferralis <feranick@hotmail.com>
 *
@@ -18,109 +18,192 @@ print(__doc__)
 import numpy as np
 import sys, os, os.path, h5py
 from datetime import datetime, date
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../SpectraKeras'))
+from libSpectraKeras import Resampler
 
 #**********************************************
 ''' main '''
 #**********************************************
+class defParam:
+    # Rows per HDF5 chunk when creating a resizable dataset
+    chunkRows = 1024
+
 def main():
     try:
         if sys.argv[3] == ".":
-            for ind, f in enumerate(sorted(os.listdir("."))):
-                if f != sys.argv[1] and f != sys.argv[2] and os.path.splitext(f)[-1] == ".txt":
-                    makeFile(sys.argv[1], sys.argv[2], f, sys.argv[4])
+            files = [f for f in sorted(os.listdir(".")) if f != sys.argv[1] and f != sys.argv[2] and os.path.splitext(f)[-1] == ".txt"]
+            makeFile(sys.argv[1], sys.argv[2], files, sys.argv[4])
         else:
-            makeFile(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
+            makeFile(sys.argv[1], sys.argv[2], [sys.argv[3]], sys.argv[4])
     except:
         usage()
     sys.exit(2)
 
 #**********************************************
 ''' Make Training file '''
+''' All sample files are resampled together and '''
+''' appended to the learning file in one go '''
 #**********************************************
-def makeFile(learnFile, sampleTag, sampleFile, param):
+def makeFile(learnFile, sampleTag, sampleFiles, param):
     #**********************************************
     ''' Open and process training data '''
     #**********************************************
-    try:
-        firstline = open(sampleFile).readline()
-        with open(sampleFile, 'r') as f:
-            if firstline[:7] == "##NAMES":
-                En = np.loadtxt(f, unpack = True, usecols=range(0,1), delimiter = ',', skiprows = 10)
-            else:
-                En = np.loadtxt(f, unpack = True, usecols=range(0,1))
-            print(' Number of points in \"' + sampleFile + '\": ' + str(En.shape[0]))
-    except:
-        print('\033[1m' + ' Sample data file not found \n' + '\033[0m')
+    samples = []
+    for sampleFile in sampleFiles:
+        En, R = readSampleFile(sampleFile)
+        if En is not None:
+            samples.append((sampleFile, En, R))
+    if len(samples) == 0:
         return
 
-    with open(sampleFile, 'r') as f:
-        if firstline[:7] == "##NAMES":
-            R = np.loadtxt(f, unpack = True, usecols=range(1,2), delimiter = ',', skiprows = 10)
-        else:
-            R = np.loadtxt(f, unpack = True, usecols=range(1,2))
-
-    if os.path.exists(learnFile):
-        if os.path.splitext(learnFile)[1] == ".npy":
-            M = np.load(learnFile)
-        elif os.path.splitext(learnFile)[1] == ".h5":
-            with h5py.File(learnFile, 'r') as hf:
-                M = hf["M"][:]
-        else:
-            with open(learnFile, 'r') as f:
-                M = np.loadtxt(f, unpack =False)
-            
-        sampleSize = M.shape[0]+1
-        print(' Number of samples in \"' + learnFile + '\": ' + str(sampleSize))
-        EnT = np.delete(np.array(M[0,:]),np.s_[0:1],0)
-        if EnT.shape[0] == En.shape[0]:
-            print(' Number of points in the map dataset: ' + str(EnT.shape[0]))
-        else:
-            print('\033[1m' + ' Mismatch in datapoints: ' + str(EnT.shape[0]) + '; sample = ' +  str(En.shape[0]) + '\033[0m')
-            R = np.interp(EnT, En, R, left = 0, right = 0)
-            print('\033[1m' + ' Mismatch corrected: datapoints in sample: ' + str(R.shape[0]) + '\033[0m')
-        newTrain = np.append(float(param),R).reshape(1,-1)
-    else:
+    EnT = readLearnFileEn(learnFile)
+    if EnT is None:
         print('\n\033[1m' + ' Train data file not found. Creating...' + '\033[0m')
-        newTrain = np.append([0], En)
-        newTrain = np.vstack((newTrain, np.append(float(param),R)))
-        sampleSize = 2
+        EnT = samples[0][1]
+    else:
+        print(' Number of points in the learning dataset: ' + str(EnT.shape[0]))
 
-    saveLearnFile(newTrain, learnFile)
+    newTrain = np.hstack((np.full((len(samples),1), float(param)), resampleSpectra(EnT, samples)))
+    appendLearnFile(newTrain, learnFile, EnT)
     
     if os.path.exists(sampleTag):
         learnFileInfo = sampleTag
         summary=""
     else:
-        learnFileInfo = os.path.splitext(learnFile)[0] + str(datetime.now().strftime('_%Y-%m-%d_%H-%M-%S.csv'))
         learnFileInfo = sampleTag
         print('\033[1m' + ' Train info file not found. Creating...' + '\033[0m')
         summary = str(datetime.now().strftime('Classification started: %Y-%m-%d %H:%M:%S'))+"\n"
 
-    summary += str(param) + ',,,' + sampleFile +'\n'
+    for sampleFile, En, R in samples:
+        summary += str(param) + ',,,' + sampleFile +'\n'
         
     with open(learnFileInfo, 'ab') as f:
         f.write(summary.encode())
 
     print(' Added info to \"' + learnFileInfo + '\"\n')
 
+#**********************************************
+''' Read sample file (ASCII or Rruff) '''
+#**********************************************
+def readSampleFile(sampleFile):
+    try:
+        firstline = open(sampleFile).readline()
+        with open(sampleFile, 'r') as f:
+            if firstline[:7] == "##NAMES":
+                data = np.loadtxt(f, usecols=(0,1), delimiter = ',', skiprows = 10, ndmin = 2)
+            else:
+                data = np.loadtxt(f, usecols=(0,1), ndmin = 2)
+        print(' Number of points in \"' + sampleFile + '\": ' + str(data.shape[0]))
+    except:
+        print('\033[1m' + ' Sample data file not found \n' + '\033[0m')
+        return None, None
+    return data[:,0], data[:,1]
+
+#**********************************************
+''' Resample spectra onto EnT '''
+''' Spectra sharing the same x-axis are resampled '''
+''' together, with zeros outside of their range '''
+#**********************************************
+def resampleSpectra(EnT, samples):
+    resampler = Resampler()
+    newR = np.zeros((len(samples), EnT.shape[0]))
+    groups = {}
+    for i, (sampleFile, En, R) in enumerate(samples):
+        groups.setdefault(En.tobytes(), []).append(i)
+    for group in groups.values():
+        En = samples[group[0]][1]
+        R = np.array([samples[i][2] for i in group])
+        if np.array_equal(En, EnT):
+            newR[group] = R
+            continue
+        print('\033[1m' + ' Mismatch in datapoints: ' + str(EnT.shape[0]) + '; sample = ' +  str(En.shape[0]) +
+            ' (' + str(len(group)) + ' spectra)\033[0m')
+        Rg = resampler.transform(EnT, En, R)
+        Rg[:,(EnT < En[0]) | (EnT > En[-1])] = 0
+        newR[group] = Rg
+    return newR
+
+#************************************
+''' Read only the energy scale of the learning file '''
+#************************************
+def readLearnFileEn(learnFile):
+    if not os.path.exists(learnFile):
+        return None
+    if os.path.splitext(learnFile)[1] == ".npy":
+        En = np.load(learnFile, mmap_mode='r')[0,1:]
+    elif os.path.splitext(learnFile)[1] == ".h5":
+        with h5py.File(learnFile, 'r') as hf:
+            En = hf["M"][0,1:]
+    else:
+        with open(learnFile, 'r') as f:
+            En = np.loadtxt(f, max_rows=1)[1:]
+    return np.array(En)
+
 #***************************************
-''' Save new learning Data '''
+''' Append new learning Data '''
+''' h5: extends a resizable "M" dataset in place '''
+''' npy: rewrites only the header when possible '''
+''' txt: appends the rows '''
 #***************************************
-def saveLearnFile(M, learnFile):
-    if os.path.splitext(learnFile)[1] == '.txt':
+def appendLearnFile(M, learnFile, EnT):
+    newFile = not os.path.exists(learnFile)
+    if newFile:
+        M = np.vstack((np.append([0], EnT), M))
+    ext = os.path.splitext(learnFile)[1]
+    if ext == '.txt':
         print(" Saving updated training file (txt) in:", learnFile+"\n")
         with open(learnFile, 'ab') as f:
             np.savetxt(f, M, delimiter='\t', fmt='%10.6f')
-    elif os.path.splitext(sys.argv[1])[1] == '.h5':
+    elif ext == '.h5':
         print(" Saving updated training file (hdf5) in: "+learnFile+"\n")
-        with h5py.File(learnFile, 'w') as hf:
-            hf.create_dataset("M",  data=M)
-    elif os.path.splitext(sys.argv[1])[1] == '.npy':
+        with h5py.File(learnFile, 'a') as hf:
+            if "M" in hf and hf["M"].maxshape[0] is None:
+                dataset = hf["M"]
+                n = dataset.shape[0]
+                dataset.resize(n + M.shape[0], axis=0)
+                dataset[n:] = M
+            else:
+                if "M" in hf:
+                    # Fixed-size dataset from older versions: make it resizable once
+                    M = np.vstack((hf["M"][:], M))
+                    del hf["M"]
+                hf.create_dataset("M", data=M, maxshape=(None, M.shape[1]),
+                    chunks=(min(defParam.chunkRows, M.shape[0]), M.shape[1]))
+    elif ext == '.npy':
         print(" Saving updated training file (npy) in: "+learnFile+"\n")
-        with open(learnFile, 'ab') as f:
-            np.save(f, M, '%10.6f')
+        if newFile or not appendNpy(M, learnFile):
+            if not newFile:
+                M = np.vstack((np.load(learnFile), M))
+            np.save(learnFile, M)
     else:
         print(" Format of training file, "+learnFile+", not supported\n")
+        return
+    print(" Spectra added: "+str(M.shape[0]-1 if newFile else M.shape[0]))
+
+# Append rows to a C-ordered npy file in place, provided the
+# updated header fits in the space of the existing one
+def appendNpy(M, learnFile):
+    from io import BytesIO
+    fmt = np.lib.format
+    with open(learnFile, 'r+b') as f:
+        version = fmt.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = fmt.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = fmt.read_array_header_2_0(f)
+        headerSize = f.tell()
+        if fortran or len(shape) != 2 or shape[1] != M.shape[1]:
+            return False
+        header = BytesIO()
+        fmt.write_array_header_1_0(header, {'descr' : fmt.dtype_to_descr(dtype),
+            'fortran_order' : False, 'shape' : (shape[0] + M.shape[0], shape[1])})
+        if version != (1, 0) or len(header.getvalue()) != headerSize:
+            return False
+        f.seek(0)
+        f.write(header.getvalue())
+        f.seek(headerSize + shape[0]*shape[1]*dtype.itemsize)
+        f.write(np.ascontiguousarray(M, dtype=dtype).tobytes())
+    return True
 
 #************************************
 ''' Lists the program usage '''
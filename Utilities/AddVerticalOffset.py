@@ -6,7 +6,7 @@
 * Replicate training data with vertical offset
 * For augmentation of data
 *
-* version: 20180615a
+* version: 20261018a
 *
 * By: Nicola Ferralis <feranick@hotmail.com>
 *
@@ -16,11 +16,16 @@ print(__doc__)
 
 import numpy as np
 import sys, os.path, csv, h5py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../SpectraKeras'))
+from libSpectraKeras import Augmenter
 #************************************
 ''' Main '''
 #************************************
 class defParam:
     saveAsTxt = False
+    randOffset = False
+    numWorkers = os.cpu_count()
+    seed = None
 
 def main():
     if(len(sys.argv)<4):
@@ -31,18 +36,11 @@ def main():
     En, M = readLearnFile(sys.argv[1])
     newFile = os.path.splitext(sys.argv[1])[0] + '_n' + sys.argv[2]+ '_oV' + sys.argv[3]
 
-    if os.path.exists(newFile) == False:
-        newTrain = np.append([0], En)
-        newTrain = np.vstack((newTrain, M))
-    else:
-        newTrain = M
-
     print(' Adding', sys.argv[2],'sets with vertical offset:', sys.argv[3], '\n')
+    aug = Augmenter(En, vertOffset=float(sys.argv[3]), randomize=defParam.randOffset, seed=defParam.seed,
+        shared=True, compound=True, vertOffsetLast=False)
 
-    for j in range(int(sys.argv[2])):
-        newTrain = np.vstack((newTrain, verticalOffset(M, float(sys.argv[3]))))
-
-    saveLearnFile(newTrain, newFile)
+    saveLearnFile(aug, M, newFile, int(sys.argv[2]))
 
 #************************************
 ''' Open Learning Data '''
@@ -70,25 +68,15 @@ def readLearnFile(learnFile):
 #***************************************
 ''' Save new learning Data '''
 #***************************************
-def saveLearnFile(M, learnFile):
+def saveLearnFile(aug, M, learnFile, numCopies):
     if defParam.saveAsTxt == True:
         learnFile += '.txt'
         print(" Saving new training file (txt) in:", learnFile+"\n")
-        with open(learnFile, 'ab') as f:
-            np.savetxt(f, M, delimiter='\t', fmt='%10.6f')
     else:
         learnFile += '.h5'
         print(" Saving new training file (hdf5) in: "+learnFile+"\n")
-        with h5py.File(learnFile, 'w') as hf:
-            hf.create_dataset("M",  data=M)
-
-#************************************
-''' Introduce Noise in Data '''
-#************************************
-def verticalOffset(M, offset):    
-    for i in range(1, M.shape[1]-1):
-        M[:,i] += offset
-    return M
+    numRows = aug.save(M, learnFile, numCopies, numWorkers=defParam.numWorkers)
+    print(" Spectra in new training file:", numRows-1, "(seed: "+str(aug.seed)+")\n")
 
 #************************************
 ''' Main initialization routine '''
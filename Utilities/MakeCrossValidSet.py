@@ -6,7 +6,7 @@
 * Make Cross Validation Dataset from Learing Set
 * Uses CSV with selected spectra from log file.
 *
-* version: 20180614e
+* version: 20261018a
 *
 * By: Nicola Ferralis <feranick@hotmail.com>
 *
@@ -15,12 +15,15 @@
 print(__doc__)
 
 import numpy as np
-import sys, os.path, h5py
+import sys, os.path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../SpectraKeras'))
+from libSpectraKeras import LearnFileSplitter
 #************************************
 ''' Main '''
 #************************************
 class defParam:
     saveAsTxt = True
+    blockSize = 65536
 
 def main():
     if len(sys.argv) < 3:
@@ -30,23 +33,23 @@ def main():
         print(' Requires python 3.x. Not compatible with python 2.x\n')
         return
 
-    En, M = readLearnFile(sys.argv[1])
     I = readIndexFile(sys.argv[2])
-    L = np.zeros(0)
+    if I is None:
+        return
 
-    for i in range(0,I.shape[0]):
-        if I[i] != 0:
-            L = np.append(L,[i])
+    # Rows of the index file follow the spectra in the learning file
+    test = I != 0
+    numTest = int(np.count_nonzero(test))
 
-    if len(L) ==0:
+    if numTest == 0:
         print(" No test validation spectra have been specified in the csv file. Exiting.\n")
         return
 
-    cvSize = L.shape[0]*100/I.shape[0]
+    cvSize = numTest*100/I.shape[0]
     
     print("\n Size of initial training set:", str(I.shape[0]),
-          "\n Size of final training set:", str(I.shape[0]-L.shape[0]),
-          "\n Size of final testing set: ",str(L.shape[0]),
+          "\n Size of final training set:", str(I.shape[0]-numTest),
+          "\n Size of final testing set: ",str(numTest),
           " ({:.2f}%)\n".format(cvSize))
 
     if defParam.saveAsTxt == True:
@@ -59,18 +62,18 @@ def main():
     if os.path.exists(trainFile) or os.path.exists(testFile) == True:
         print(" Training or cross validation test files exist. Exiting.\n")
         return
-        
-    L = L.reshape(-1,1)
-    newTest = np.append([0], En)
-    
-    print(" Sorting spectra for training and testing according to list...")
-    for i in L:
-        newTest = np.vstack((newTest, M[int(i)]))
-    newTrain = M
-    for i in L:
-        newTrain = np.delete(newTrain, int(i), 0)
 
-    saveCVFiles(newTrain, newTest, trainFile, testFile)
+    sp = readLearnFile(sys.argv[1])
+    if sp is None:
+        return
+    if sp.numRows != I.shape[0]:
+        print(" Index file lists", I.shape[0], "spectra, learning file has", sp.numRows, ". Exiting.\n")
+        sp.close()
+        return
+
+    print(" Sorting spectra for training and testing according to list...")
+    saveCVFiles(sp, test, trainFile, testFile)
+    sp.close()
 
     print(' Done!\n')
 
@@ -80,42 +83,18 @@ def main():
 def readLearnFile(learnFile):
     print(" Opening learning file: "+learnFile+"\n")
     try:
-        if os.path.splitext(learnFile)[1] == ".npy":
-            M = np.load(learnFile)
-        elif os.path.splitext(learnFile)[1] == ".h5":
-            with h5py.File(learnFile, 'r') as hf:
-                M = hf["M"][:]
-        else:
-            with open(learnFile, 'r') as f:
-                M = np.loadtxt(f, unpack =False)
+        return LearnFileSplitter(learnFile, defParam.blockSize)
     except:
         print("\033[1m" + " Learning file not found \n" + "\033[0m")
         return
 
-    En = M[0,1:]
-    A = M[1:,1:]
-    Cl = M[1:,0]
-
-    return En, M, Cl
-
 #***************************************
 ''' Save split CV Learning/test Data '''
 #***************************************
-def saveCVFiles(newTrain, newTest, trainFile, testFile):
-    if defParam.saveAsTxt == True:
-        print("\n Saving new training file (txt) in:", trainFile)
-        with open(trainFile, 'ab') as f:
-            np.savetxt(f, newTrain, delimiter='\t', fmt='%10.6f')
-        print(" Saving new cross validation (txt) in:", testFile, '\n')
-        with open(testFile, 'ab') as f:
-            np.savetxt(f, newTest, delimiter='\t', fmt='%10.6f')
-    else:
-        print("\n Saving new training file (hdf5) in: "+trainFile)
-        with h5py.File(trainFile, 'w') as hf:
-            hf.create_dataset("M",  data=newTrain)
-        print(" Saving new cross validation file (hfd5) in:"+testFile+"\n")
-        with h5py.File(testFile, 'w') as hf:
-            hf.create_dataset("M",  data=newTest)
+def saveCVFiles(sp, test, trainFile, testFile):
+    print("\n Saving new training and cross validation files")
+    sp.write([trainFile, testFile], [~test, test])
+    print('')
 
 #************************************
 ''' Open Index File '''
@@ -6,7 +6,7 @@
 * Create Random Cross Validation Datasets
 * Train + Test
 *
-* version: 20180726a
+* version: 20261018a
 *
 * By: Nicola Ferralis <feranick@hotmail.com>
 *
@@ -15,40 +15,73 @@
 print(__doc__)
 
 import numpy as np
-import sys, os, csv, h5py
+import sys, os, getopt
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../SpectraKeras'))
+from libSpectraKeras import LearnFileSplitter
 
 class defParam:
     saveAsTxt = False
+    stratified = False
+    numFolds = 0
+    seed = 42
+    blockSize = 65536
 
 def main():
-    if(len(sys.argv)<3):
-        print(' Usage:\n  python3 RandomCrossValidMaker.py <learnData> <percentageCrossValid>\n')
-        print(' Requires python 3.x. Not compatible with python 2.x\n')
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "k:sh", ["kfold=", "stratified", "help"])
+    except:
+        usage()
+        return
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            usage()
+            return
+        if o in ("-k", "--kfold"):
+            defParam.numFolds = int(a)
+        if o in ("-s", "--stratified"):
+            defParam.stratified = True
+
+    if len(args) < 1 or (defParam.numFolds == 0 and len(args) < 2):
+        usage()
         return
-
-    En, A, Cl = readLearnFile(sys.argv[1])
-
-    percTrain = str('{:.0f}'.format(100-float(sys.argv[2])))
-    percTest = str('{:.0f}'.format(float(sys.argv[2])))
 
     if defParam.saveAsTxt == True:
-        newTrainFile = os.path.splitext(sys.argv[1])[0] + '_train-cv' + percTrain + 'pc.txt'
-        newTestFile = os.path.splitext(sys.argv[1])[0] + '_test-cv' + percTest + 'pc.txt'
+        ext = '.txt'
+    else:
+        ext = '.h5'
+    root = os.path.splitext(args[0])[0]
+
+    if defParam.numFolds > 1:
+        trainFiles = [root + '_train-fold' + str(i+1) + 'of' + str(defParam.numFolds) + ext for i in range(defParam.numFolds)]
+        testFiles = [root + '_test-fold' + str(i+1) + 'of' + str(defParam.numFolds) + ext for i in range(defParam.numFolds)]
+    elif defParam.numFolds == 0:
+        percTrain = str('{:.0f}'.format(100-float(args[1])))
+        percTest = str('{:.0f}'.format(float(args[1])))
+        trainFiles = [root + '_train-cv' + percTrain + 'pc' + ext]
+        testFiles = [root + '_test-cv' + percTest + 'pc' + ext]
     else:
-        newTrainFile = os.path.splitext(sys.argv[1])[0] + '_train-cv' + percTrain + 'pc.h5'
-        newTestFile = os.path.splitext(sys.argv[1])[0] + '_test-cv' + percTest + 'pc.h5'
+        print(" Number of folds must be at least 2. Exiting.\n")
+        return
 
-    if os.path.exists(newTrainFile) or os.path.exists(newTestFile) == True:
+    if any(os.path.exists(f) for f in trainFiles + testFiles):
         print(" Training or cross validation test files exist. Exiting.\n")
         return
 
-    print(' Splitting', sys.argv[1], ' (Train:', percTrain,'%; Test:',percTest,'%)\n')
-    A_train, Cl_train, A_test, Cl_test = formatSubset(A, Cl, float(sys.argv[2])/100)
+    sp = readLearnFile(args[0])
+    if sp is None:
+        return
+
+    if defParam.numFolds > 1:
+        print(' Splitting', args[0], 'in', defParam.numFolds, 'folds', '(stratified)\n' if defParam.stratified else '\n')
+        fold = sp.kFolds(defParam.numFolds, defParam.stratified, defParam.seed)
+        testMasks = [fold == i for i in range(defParam.numFolds)]
+    else:
+        print(' Splitting', args[0], ' (Train:', percTrain,'%; Test:',percTest,'%)', '(stratified)\n' if defParam.stratified else '\n')
+        testMasks = [sp.testMask(float(args[1])/100, defParam.stratified, defParam.seed)]
 
-    print(' Writing new training file: ', newTrainFile)
-    writeFile(newTrainFile, En, A_train, Cl_train)
-    print('\n Writing new cross-validation file: ', newTestFile)
-    writeFile(newTestFile, En, A_test, Cl_test)
+    # All training and test files are written in one pass over the learning file
+    sp.write(trainFiles + testFiles, [~m for m in testMasks] + testMasks)
+    sp.close()
 
     print('\n Done!\n')
 
@@ -58,57 +91,19 @@ def main():
 def readLearnFile(learnFile):
     print(" Opening learning file: "+learnFile+"\n")
     try:
-        if os.path.splitext(learnFile)[1] == ".npy":
-            M = np.load(learnFile)
-        elif os.path.splitext(learnFile)[1] == ".h5":
-            with h5py.File(learnFile, 'r') as hf:
-                M = hf["M"][:]
-        else:
-            with open(learnFile, 'r') as f:
-                M = np.loadtxt(f, unpack =False)
+        return LearnFileSplitter(learnFile, defParam.blockSize)
     except:
         print("\033[1m" + " Learning file not found \n" + "\033[0m")
         return
 
-    En = M[0,1:]
-    A = M[1:,1:]
-    Cl = M[1:,0]
-
-    return En, A, Cl
-
-#*****************************************
-''' Write new learning and test files '''
-#*****************************************
-def writeFile(File, En, A, Cl):
-    print(' Number of datapoints:', str(A.shape[0]))
-    
-    newMatrix = np.append([0], En).reshape(1,-1)
-    for i in range(len(Cl)):
-        newMatrix = np.vstack((newMatrix, np.append(Cl[i], A[i])))
-    
-    if defParam.saveAsTxt == True:
-        with open(File, 'ab') as f:
-            np.savetxt(f, newMatrix, delimiter='\t', fmt='%10.6f')
-    else:
-        with h5py.File(File, 'w') as hf:
-            hf.create_dataset("M",  data=newMatrix)
-
 #************************************
-''' Format subset '''
+''' Lists the program usage '''
 #************************************
-def formatSubset(A, Cl, percent):
-    from sklearn.model_selection import train_test_split
-    A_train, A_cv, Cl_train, Cl_cv = \
-    train_test_split(A, Cl, test_size=percent, random_state=42)
-    return A_train, Cl_train, A_cv, Cl_cv
-
-def formatSubset2(A, Cl, percent):
-    list = np.random.choice(range(len(Cl)), round(percent*len(Cl)), replace=False)
-    A_train = np.delete(A,list,0)
-    Cl_train = np.delete(Cl,list)
-    A_cv = A[list]
-    Cl_cv = Cl[list]
-    return A_train, Cl_train, A_cv, Cl_cv
+def usage():
+    print(' Usage:\n  python3 RandomCrossValidMaker.py <learnData> <percentageCrossValid>\n')
+    print(' Stratified by class:\n  python3 RandomCrossValidMaker.py -s <learnData> <percentageCrossValid>\n')
+    print(' K-fold (all folds in one pass):\n  python3 RandomCrossValidMaker.py -k <#folds> [-s] <learnData>\n')
+    print(' Requires python 3.x. Not compatible with python 2.x\n')
 
 #************************************
 ''' Main initialization routine '''
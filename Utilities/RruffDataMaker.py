@@ -6,7 +6,7 @@
 * RRuffDataMaker
 * Adds spectra to single file for classification
 * File must be in RRuFF
-* version: 20180725c
+* version: 20261018a
 *
 * By: Nicola Ferralis <feranick@hotmail.com>
 *
@@ -16,6 +16,7 @@ print(__doc__)
 
 import numpy as np
 import sys, os.path, h5py
+from multiprocessing import Pool
 from datetime import datetime, date
 
 #**********************************************
@@ -35,7 +36,13 @@ class defParam:
     # fill in in absence of data
     useMinForBoundary = False
 
+    # Files are parsed in parallel by numCores processes
+    # and written to the learning file every writeBlock spectra
+    numCores = os.cpu_count()
+    writeBlock = 1000
+
 def main():
+    threshold = 0
     if len(sys.argv) < 5:
         enInit = 100
         enFin = 1500
@@ -44,9 +51,7 @@ def main():
         enInit = sys.argv[2]
         enFin =  sys.argv[3]
         enStep = sys.argv[4]
-        if len(sys.argv) < 6:
-            threshold = 0
-        else:
+        if len(sys.argv) >= 6:
             threshold = sys.argv[5]
 
     if len(sys.argv) == 7:
@@ -62,8 +67,6 @@ def main():
 ''' Open and process inividual files '''
 #**********************************************
 def processMultiFile(learnFile, enInit, enFin, enStep, threshold):
-    index = 0
-    success = False
     size = 0
     compound=[]
     learnFileRoot = os.path.splitext(learnFile)[0]
@@ -81,126 +84,178 @@ def processMultiFile(learnFile, enInit, enFin, enStep, threshold):
             ",enInit="+str(enInit)+",enFin="+str(enFin)+",enStep="+str(enStep)+\
             ",threshold="+str(threshold)+"\n"
     
-    # Read, if exisiting, learnFile
+    # Read, if exisiting, the energy scale of learnFile
     if os.path.exists(learnFile):
         print('\n\033[1m' + ' Train data file found. Opening...' + '\033[0m')
-        EnT, M = readLearnFile(learnFile)
+        EnT = readLearnFileEn(learnFile)
     else:
         print('\n\033[1m' + ' Train data file not found. Creating...' + '\033[0m')
-        EnT = np.arange(float(enInit), float(enFin), float(enStep), dtype=np.float)
-        M = np.append([0], EnT)
+        EnT = np.arange(float(enInit), float(enFin), float(enStep), dtype=float)
 
-    # process sample data
-    for ind, f in enumerate(sorted(os.listdir("."))):
+    # Class indices follow the order of the sorted file names
+    files = []
+    for f in sorted(os.listdir(".")):
         if (f != learnFile and os.path.splitext(f)[-1] == ".txt"):
             try:
                 index = compound.index(f.partition("_")[0])
             except:
                 compound.append(f.partition("_")[0])
                 index = len(compound)-1
-            
-            success, M = makeFile(f, EnT, M, index, threshold)
+            files.append((f, EnT, index, threshold, defParam.useMinForBoundary,
+                defParam.leftBoundary, defParam.rightBoundary))
+
+    # Parse the files in a process pool, write rows in order as they come
+    writer = LearnFileWriter(learnFileRoot, EnT, learnFile if os.path.exists(learnFile) else None)
+    with Pool(defParam.numCores) as p:
+        chunksize = max(1, min(64, len(files)//(4*defParam.numCores)))
+        for args, (success, row, messages) in zip(files, p.imap(makeFile, files, chunksize=chunksize)):
+            print('\n'.join(messages))
             if success == True:
-                summary += str(index) + ',,,' + f +'\n'
+                writer.append(row)
                 size = size + 1
-            else:
-                summary += str(index) + ',,,' + f +'\n'
+            summary += str(args[2]) + ',,,' + args[0] +'\n'
+    writer.close()
 
     print('\n Energy scale: [', str(enInit),',',
             str(enFin), ']; Step:', str(enStep),
             '; Threshold:', str(threshold),'\n')
-
-    saveLearningFile(M, os.path.splitext(learnFile)[0])
     
     with open(summary_filename, "a") as sum_file:
         sum_file.write(summary)
 
-    Cl2 = np.zeros((size, size))
-    for i in range(size):
-        np.put(Cl2[i], i, 1)
-
     if defParam.saveFormatClass == True:
+        Cl2 = np.eye(size)
         tfclass_filename = learnFileRoot + '.tfclass'
         print(' Saving class file...\n')
         with open(tfclass_filename, 'ab') as f:
             np.savetxt(f, Cl2, delimiter='\t', fmt='%10.6f')
 
 #**********************************************
-''' Add data to Training file '''
+''' Parse a sample file and resample onto EnT '''
+''' Runs in the worker processes: returns '''
+''' the row for the learning file and the log '''
 #**********************************************
-def makeFile(sampleFile, EnT, M, param, threshold):
-    print('\n Process file in class #: ' + str(param))
+def makeFile(args):
+    sampleFile, EnT, param, threshold, useMinForBoundary, leftBoundary, rightBoundary = args
+    messages = ['\n Process file in class #: ' + str(param)]
     try:
         with open(sampleFile, 'r') as f:
-            En = np.loadtxt(f, unpack = True, usecols=range(0,1), delimiter = ',', skiprows = 10)
-            if(En.size == 0):
-                print('\n Empty file \n' )
-                return False, M
-        with open(sampleFile, 'r') as f:
-            R = np.loadtxt(f, unpack = True, usecols=range(1,2), delimiter = ',', skiprows = 10)
+            data = np.loadtxt(f, usecols=(0,1), delimiter = ',', skiprows = 10, ndmin = 2)
+        if(data.size == 0):
+            messages.append('\n Empty file \n')
+            return False, None, messages
+        En, R = data[:,0], data[:,1]
         R[R<float(threshold)*np.amax(R)/100] = 0
-        print(' Number of points in \"' + sampleFile + '\": ' + str(En.shape[0]))
-        print(' Setting datapoints below ', threshold, '% of max (',str(np.amax(R)),')')
+        messages.append(' Number of points in \"' + sampleFile + '\": ' + str(En.shape[0]))
+        messages.append(' Setting datapoints below  ' + str(threshold) + ' % of max ( ' + str(np.amax(R)) + ' )')
     except:
-        print('\033[1m' + sampleFile + ' file not found \n' + '\033[0m')
-        return False, M
+        messages.append('\033[1m' + sampleFile + ' file not found \n' + '\033[0m')
+        return False, None, messages
 
     if EnT.shape[0] == En.shape[0]:
-        print(' Number of points in the learning dataset: ' + str(EnT.shape[0]))
+        messages.append(' Number of points in the learning dataset: ' + str(EnT.shape[0]))
     else:
-        print('\033[1m' + ' Mismatch in datapoints: ' + str(EnT.shape[0]) + '; sample = ' +  str(En.shape[0]) + '\033[0m')
-        if defParam.useMinForBoundary == True:
-            print(" Boundaries: Filling in with min values")
-            defParam.leftBoundary = R[0]
-            defParam.rightBoundary = R[R.shape[0]-1]
+        messages.append('\033[1m' + ' Mismatch in datapoints: ' + str(EnT.shape[0]) + '; sample = ' +  str(En.shape[0]) + '\033[0m')
+        if useMinForBoundary == True:
+            messages.append(" Boundaries: Filling in with min values")
+            leftBoundary = R[0]
+            rightBoundary = R[R.shape[0]-1]
         else:
-            print(" Boundaries: Filling in preset values")
-        print("  Left:",defParam.leftBoundary,"; Right:",defParam.leftBoundary)
+            messages.append(" Boundaries: Filling in preset values")
+        messages.append("  Left: " + str(leftBoundary) + " ; Right: " + str(rightBoundary))
         
-        R = np.interp(EnT, En, R, left = defParam.leftBoundary, right = defParam.rightBoundary)
-        print('\033[1m' + ' Mismatch corrected: datapoints in sample: ' + str(R.shape[0]) + '\033[0m')
+        R = np.interp(EnT, En, R, left = leftBoundary, right = rightBoundary)
+        messages.append('\033[1m' + ' Mismatch corrected: datapoints in sample: ' + str(R.shape[0]) + '\033[0m')
 
-    M = np.vstack((M,np.append(float(param),R)))
-    return True, M
+    return True, np.append(float(param),R), messages
 
 #***************************************
-''' Save learning file '''
+''' Incremental writer for the learning file '''
+''' hdf5: rows are appended to a resizable dataset '''
+''' txt: rows are appended to the file '''
 #***************************************
-def saveLearningFile(M, learnFileRoot):
-    if defParam.saveAsTxt == True:
-        learnFile = learnFileRoot+'.txt'
-        print(" Saving new training file (txt) in:", learnFile+"\n")
-        with open(learnFile, 'wb') as f:
-            np.savetxt(f, M, delimiter='\t', fmt='%10.6f')
-    else:
-        learnFile = learnFileRoot+'.h5'
-        with h5py.File(learnFile, 'w') as hf:
-            hf.create_dataset("M",  data=M)
-        print(" Saving new training file (hdf5) in: "+learnFile+"\n")
+class LearnFileWriter(object):
+    def __init__(self, learnFileRoot, EnT, sourceFile=None):
+        self.rows = []
+        self.numRows = 0
+        if defParam.saveAsTxt == True:
+            self.learnFile = learnFileRoot+'.txt'
+            print(" Saving new training file (txt) in:", self.learnFile+"\n")
+            newFile = not os.path.exists(self.learnFile)
+            self.f = open(self.learnFile, 'ab')
+            if newFile:
+                np.savetxt(self.f, [np.append([0], EnT)], delimiter='\t', fmt='%10.6f')
+        else:
+            self.learnFile = learnFileRoot+'.h5'
+            print(" Saving new training file (hdf5) in: "+self.learnFile+"\n")
+            self.f = h5py.File(self.learnFile, 'a')
+            M = None
+            if sourceFile is not None and os.path.abspath(sourceFile) != os.path.abspath(self.learnFile):
+                # Learning file in another format (e.g. npy): its spectra are
+                # copied once into the new h5 file, which replaces any existing one
+                print(" Copying spectra from "+sourceFile+"\n")
+                if "M" in self.f:
+                    del self.f["M"]
+                M = readLearnFile(sourceFile)
+                self.dataset = self.f.create_dataset("M", data=M, maxshape=(None, M.shape[1]),
+                    chunks=(min(defParam.writeBlock, 1024), M.shape[1]))
+            elif "M" in self.f and self.f["M"].maxshape[0] is None:
+                self.dataset = self.f["M"]
+            else:
+                if "M" in self.f:
+                    # Existing fixed-size dataset: copy it into a resizable one
+                    M = self.f["M"][:]
+                    del self.f["M"]
+                else:
+                    M = np.array([np.append([0], EnT)])
+                self.dataset = self.f.create_dataset("M", data=M, maxshape=(None, M.shape[1]),
+                    chunks=(min(defParam.writeBlock, 1024), M.shape[1]))
+
+    def append(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= defParam.writeBlock:
+            self.flush()
+
+    def flush(self):
+        if len(self.rows) == 0:
+            return
+        if defParam.saveAsTxt == True:
+            np.savetxt(self.f, self.rows, delimiter='\t', fmt='%10.6f')
+        else:
+            n = self.dataset.shape[0]
+            self.dataset.resize(n + len(self.rows), axis=0)
+            self.dataset[n:] = np.array(self.rows)
+        self.numRows += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.f.close()
+        print(" Spectra added to "+self.learnFile+": "+str(self.numRows)+"\n")
 
 #************************************
 ''' Open Learning Data '''
 #************************************
 def readLearnFile(learnFile):
-    print(" Opening learning file: "+learnFile+"\n")
-    try:
-        if os.path.splitext(learnFile)[1] == ".npy":
-            M = np.load(learnFile)
-        elif os.path.splitext(learnFile)[1] == ".h5":
-            with h5py.File(learnFile, 'r') as hf:
-                M = hf["M"][:]
-        else:
-            with open(learnFile, 'r') as f:
-                M = np.loadtxt(f, unpack =False)
-    except:
-        print("\033[1m" + " Learning file not found \n" + "\033[0m")
-        return
+    if os.path.splitext(learnFile)[1] == ".npy":
+        return np.load(learnFile, mmap_mode='r')
+    with open(learnFile, 'r') as f:
+        return np.loadtxt(f, unpack =False, ndmin = 2)
 
-    En = M[0,1:]
-    A = M[1:,1:]
-    #Cl = M[1:,0]
-
-    return En, M
+#************************************
+''' Open energy scale of Learning Data '''
+#************************************
+def readLearnFileEn(learnFile):
+    print(" Opening learning file: "+learnFile+"\n")
+    if os.path.splitext(learnFile)[1] == ".npy":
+        En = np.load(learnFile, mmap_mode='r')[0,1:]
+    elif os.path.splitext(learnFile)[1] == ".h5":
+        with h5py.File(learnFile, 'r') as hf:
+            En = hf["M"][0,1:]
+    else:
+        with open(learnFile, 'r') as f:
+            En = np.loadtxt(f, max_rows=1)[1:]
+    return np.array(En)
 
 #************************************
 ''' Lists the program usage '''